@@ -0,0 +1,102 @@
+"""
+Micro-benchmarks for utilities.actionable_id against the previous implementation (validators on every call and the
+identifier patterns rebuilt and compiled per call), over a mix of identifier strings shaped like those coming through
+the isaid transforms: staff profile URLs, other URLs, emails, DOIs, ORCIDs and plain text. Each workload is timed with
+all distinct strings (no memo benefit) and with repeats, and the results are checked against the previous
+implementation.
+
+    python benchmarks/actionable_id.py --strings 20000
+"""
+import argparse
+import random
+import re
+import time
+
+import validators
+
+from pylinkedcmd import utilities
+
+
+def previous_actionable_id(identifier_string, return_resolver=True):
+    if validators.url(identifier_string) and "/staff-profiles/" in identifier_string.lower():
+        return {
+            "url": identifier_string,
+            "profile": identifier_string.split("?")[0]
+        }
+
+    if validators.email(identifier_string):
+        return {
+            "email": identifier_string
+        }
+
+    identifiers = {
+        "doi": {
+            "pattern": r"10.\d{4,9}\/[\S]+$",
+            "resolver": "https://doi.org/"
+        },
+        "orcid": {
+            "pattern": r"\d{4}-\d{4}-\d{4}-\w{4}",
+            "resolver": "https://orcid.org/"
+        }
+    }
+    for k,v in identifiers.items():
+        search = re.search(v["pattern"], identifier_string)
+        if search:
+            d_identifier = {
+                k: search.group()
+            }
+            if return_resolver and v["resolver"] is not None:
+                d_identifier["url"] = f"{v['resolver']}{search.group().upper()}"
+
+            return d_identifier
+
+    return
+
+
+def identifier_strings(count, seed=42):
+    rng = random.Random(seed)
+    makers = [
+        lambda n: f"https://www.usgs.gov/staff-profiles/person-{n}?qt-staff_profile_science_products=3",
+        lambda n: f"https://www.usgs.gov/centers/center-{n}",
+        lambda n: f"person{n}@usgs.gov",
+        lambda n: f"https://doi.org/10.5066/P9{n:06d}",
+        lambda n: f"0000-000{n % 10}-{n % 10000:04d}-{n % 9999:04d}",
+        lambda n: f"Water Resources Mission Area {n}"
+    ]
+    return [rng.choice(makers)(n) for n in range(count)]
+
+
+def timed(function, strings):
+    start = time.perf_counter()
+    results = [function(i) for i in strings]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strings", type=int, default=20000)
+    args = parser.parse_args()
+
+    distinct = identifier_strings(args.strings)
+    repeated = [random.Random(7).choice(distinct[:args.strings // 20]) for _ in range(args.strings)]
+
+    for workload, strings in [("distinct", distinct), ("repeated", repeated)]:
+        utilities._memoized_actionable_id.cache_clear()
+        previous_time, previous_results = timed(previous_actionable_id, strings)
+        current_time, current_results = timed(utilities.actionable_id, strings)
+
+        utilities._memoized_actionable_id.cache_clear()
+        start = time.perf_counter()
+        batch_results = utilities.actionable_ids(strings)
+        batch_time = time.perf_counter() - start
+
+        assert previous_results == current_results == batch_results
+        print(
+            f"{workload}: previous {previous_time:.3f}s, actionable_id {current_time:.3f}s "
+            f"({previous_time / current_time:.1f}x), actionable_ids {batch_time:.3f}s "
+            f"({previous_time / batch_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
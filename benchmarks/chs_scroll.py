@@ -0,0 +1,139 @@
+"""
+Compares the previous isaid_helpers.cache_chs_cache loop (one scroll, 400 documents a page, the whole cache gathered
+into a list) with chs.ChsCache.iter_docs, using larger pages and sliced scrolls, against a local stub of the CHS cache
+API. The stub serves a synthetic cache through Elasticsearch style scroll ids, and optional slice_id/slice_max
+parameters, and takes a fixed latency per page plus a small cost per document to stand in for the search cluster and
+the network.
+
+    python benchmarks/chs_scroll.py --docs 50000 --latency 0.05 --slices 4 --page-size 2000
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from pylinkedcmd import chs
+from pylinkedcmd.client import Client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536
+    latency = 0.05
+    per_doc_latency = 0.00002
+    docs = list()
+    scrolls = dict()
+    scrolls_lock = threading.Lock()
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        page_size = int(query["page_size"])
+
+        with self.scrolls_lock:
+            if "scroll_id" in query:
+                scroll_id = query["scroll_id"]
+                docs, position = self.scrolls[scroll_id]
+            else:
+                slice_id = int(query.get("slice_id", 0))
+                slice_max = int(query.get("slice_max", 1))
+                scroll_id = uuid.uuid4().hex
+                docs, position = self.docs[slice_id::slice_max], 0
+            self.scrolls[scroll_id] = (docs, position + page_size)
+
+        page = docs[position:position + page_size]
+        time.sleep(self.latency + self.per_doc_latency * len(page))
+
+        body = json.dumps({
+            "_scroll_id": scroll_id,
+            "hits": {"hits": [{"_id": doc["id"], "_source": doc} for doc in page]}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def previous_cache_chs_cache(cache_api_domain, cache_api_path, cache, exclude_errors=True):
+    all_data = list()
+
+    limit = 400
+    api_path = f"{cache_api_domain}{cache_api_path}?es_search_index=cache_{cache}&page_size={limit}&scan=True"
+    results = None
+    while True:
+        if results and "_scroll_id" in results and "scroll_id" not in api_path:
+            api_path = f"{api_path}&scroll_id={results['_scroll_id']}"
+
+        results = requests.get(api_path).json()
+
+        try:
+            if not results["hits"]["hits"]:
+                break
+            else:
+                if exclude_errors:
+                    docs = [i["_source"] for i in results["hits"]["hits"] if "error" not in i]
+                else:
+                    docs = [i["_source"] for i in results["hits"]["hits"]]
+                all_data.extend(docs)
+        except:
+            print(api_path)
+            print(results)
+            break
+
+    return all_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slices", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    StubHandler.docs = [
+        {"id": f"doc{n}", "title": f"Cached record {n}", "keywords": ["alpha", "beta", "gamma"]}
+        if n % 50 else {"id": f"doc{n}", "error": "Not found"}
+        for n in range(args.docs)
+    ]
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_domain = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    # The previous loop tested the hit rather than its _source for an error, so it never excluded anything
+    start = time.perf_counter()
+    previous_docs = previous_cache_chs_cache(api_domain, "prod", "bench")
+    previous_seconds = time.perf_counter() - start
+
+    chs_cache = chs.ChsCache(api_domain, "prod", client=Client(pool_maxsize=args.slices))
+    start = time.perf_counter()
+    sliced_docs = list(chs_cache.iter_docs(
+        "bench", page_size=args.page_size, slices=args.slices, exclude_errors=False
+    ))
+    sliced_seconds = time.perf_counter() - start
+
+    filtered_count = sum(1 for _ in chs_cache.iter_docs("bench", page_size=args.page_size, slices=args.slices))
+
+    server.shutdown()
+
+    assert sorted(i["id"] for i in previous_docs) == sorted(i["id"] for i in sliced_docs)
+    assert filtered_count == len([i for i in StubHandler.docs if "error" not in i])
+
+    sliced_label = f"iter_docs ({args.page_size}/page, {args.slices} slices):"
+    print(f"{'previous (400/page, 1 scroll):':40} {len(previous_docs) / previous_seconds:10.0f} docs/sec")
+    print(f"{sliced_label:40} {len(sliced_docs) / sliced_seconds:10.0f} docs/sec")
+    print(f"{'speedup:':40} {previous_seconds / sliced_seconds:10.1f}x")
+    print(f"{'error documents excluded:':40} {len(sliced_docs) - filtered_count:10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares serial doi.negotiate_doi calls with the concurrent doi.negotiate_dois engine against a local stub of the
+doi.org content negotiation service. The stub answers every DOI with a small CSL JSON document after a fixed delay
+that stands in for network latency, and returns a 429 with Retry-After for a share of requests to exercise the
+throttling path.
+
+    python benchmarks/doi_negotiation.py --dois 200 --latency 0.05 --workers 16
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pylinkedcmd import doi
+from pylinkedcmd.client import Client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536
+    latency = 0.05
+    throttle_share = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if random.random() < self.throttle_share:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        doi_string = self.path.lstrip("/")
+        body = json.dumps({
+            "DOI": doi_string,
+            "URL": f"https://doi.org/{doi_string}",
+            "title": f"Stub record for {doi_string}",
+            "type": "article-journal",
+            "issued": {"date-parts": [[2020]]}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.citationstyles.csl+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubClient(Client):
+    def __init__(self, stub_root, **kwargs):
+        super().__init__(backoff_factor=0.01, **kwargs)
+        self.stub_root = stub_root
+
+    def get(self, url, headers=None, params=None):
+        return super().get(url.replace("https://doi.org/", self.stub_root), headers=headers, params=params)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dois", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--throttle-share", type=float, default=0.05)
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    StubHandler.throttle_share = args.throttle_share
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub_root = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    dois = [f"10.5066/P9BENCH{n:05d}" for n in range(args.dois)]
+
+    serial_client = StubClient(stub_root, pool_maxsize=1)
+    start = time.perf_counter()
+    serial_results = [doi.negotiate_doi(d, client=serial_client) for d in dois]
+    serial_seconds = time.perf_counter() - start
+
+    bulk_client = StubClient(stub_root, pool_maxsize=args.workers)
+    start = time.perf_counter()
+    bulk_results = list(doi.negotiate_dois(dois, max_workers=args.workers, client=bulk_client))
+    bulk_seconds = time.perf_counter() - start
+
+    server.shutdown()
+
+    serial_errors = len([i for i in serial_results if i is None or "error" in i])
+    bulk_errors = len([i for _, i in bulk_results if i is None or "error" in i])
+    print(f"serial negotiate_doi:  {args.dois / serial_seconds:8.1f} DOIs/sec ({serial_errors} errors)")
+    print(f"bulk negotiate_dois:   {args.dois / bulk_seconds:8.1f} DOIs/sec ({bulk_errors} errors)")
+    print(f"speedup:               {serial_seconds / bulk_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Times isaid.filter_usgs_profiles on synthetic scraped profiles: a share of people with several profile pages under the
+same email, shared office addresses, and ORCIDs that turn up on more than one person. The previous implementation
+(a linear search per email) is quadratic, so it is only timed, and checked against, at the smaller --compare size.
+
+    python benchmarks/filter_usgs_profiles.py --profiles 100000 --compare 10000
+"""
+import argparse
+import collections
+import copy
+import random
+import time
+from itertools import groupby
+
+from pylinkedcmd import isaid
+
+
+def previous_filter_usgs_profiles(raw_profiles):
+    identified_profiles = [i for i in raw_profiles if i["email"] is not None or i["orcid"] is not None]
+    identified_profiles.sort(key=lambda x:x['email'])
+    most_likely_profile = dict()
+    for k,v in groupby(identified_profiles,key=lambda x:x['email']):
+        profiles = list([(i["profile"],i["content_size"]) for i in v])
+        if len(profiles) > 1:
+            most_likely_profile[k] = sorted(profiles,key=lambda x:(-x[1],x[0]))[0][0]
+
+    unique_emails = list(set([i["email"] for i in raw_profiles if i["email"] not in isaid.ignore_profile_emails]))
+    unique_emails.sort()
+
+    unique_identified_profiles = list()
+    for email in unique_emails:
+        if email in most_likely_profile.keys():
+            unique_identified_profiles.append(next(i for i in identified_profiles if i["profile"] == most_likely_profile[email]))
+        else:
+            unique_identified_profiles.append(next(i for i in raw_profiles if i["email"] == email))
+
+    duplicate_orcids = [item for item, count in collections.Counter([i["orcid"] for i in unique_identified_profiles if i["orcid"] is not None]).items() if count > 1]
+    for profile in [i for i in unique_identified_profiles if i["orcid"] in duplicate_orcids]:
+        profile.update({"orcid": None})
+
+    return unique_identified_profiles
+
+
+def synthetic_profiles(count, seed=42):
+    rng = random.Random(seed)
+    profiles = list()
+    for n in range(count):
+        person = n if rng.random() > 0.1 else rng.randrange(max(1, n))
+        email = f"person{person}@usgs.gov" if rng.random() > 0.02 else rng.choice(["ask@usgs.gov", "library@usgs.gov", None])
+        orcid = None
+        if email is not None and rng.random() < 0.4:
+            orcid = f"0000-0001-{person % 10000:04d}-{rng.randrange(3):04d}"
+        profiles.append({
+            "profile": f"https://www.usgs.gov/staff-profiles/person-{n}",
+            "email": email,
+            "orcid": orcid,
+            "content_size": rng.randrange(20000)
+        })
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=100000)
+    parser.add_argument("--compare", type=int, default=10000)
+    args = parser.parse_args()
+
+    compare_profiles = synthetic_profiles(args.compare)
+    previous_input, current_input = copy.deepcopy(compare_profiles), copy.deepcopy(compare_profiles)
+
+    start = time.perf_counter()
+    previous_results = previous_filter_usgs_profiles(previous_input)
+    previous_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    current_results = isaid.filter_usgs_profiles(current_input)
+    current_time = time.perf_counter() - start
+
+    assert previous_results == current_results
+    print(f"{args.compare} profiles: previous {previous_time:.2f}s, current {current_time:.3f}s ({previous_time / current_time:.0f}x)")
+
+    profiles = synthetic_profiles(args.profiles)
+    start = time.perf_counter()
+    results, report = isaid.filter_usgs_profiles(profiles, return_report=True)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.profiles} profiles: current {elapsed:.3f}s, {len(results)} kept, "
+        f"{len(report['collapsed'])} emails collapsed, {len(report['orcids_removed'])} ORCIDs removed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares the membership check reference_terms_to_graph used to find terms that weren't in the graph (rebuilding the
+list of graph URLs for every term) with graph.diff_records over a KeyIndex, in memory and in a SQLite file. Synthetic
+terms overlap the graph's keys by half, with a share of the overlapping terms changed. The previous check is
+quadratic, so it is only timed, and checked against, at the smaller --compare size.
+
+    python benchmarks/graph_diff.py --terms 200000 --compare 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from pylinkedcmd import graph
+
+properties = ["name", "source"]
+
+
+def previous_missing_terms(load_file_terms, ds_in_graph):
+    return [i for i in load_file_terms if i["url"] not in [ds["url"] for ds in ds_in_graph]]
+
+
+def synthetic_terms(count):
+    graph_terms = [
+        {"url": f"https://example.org/term/{n}", "name": f"Term {n}", "source": "USGS Thesaurus"}
+        for n in range(count)
+    ]
+    load_file_terms = [
+        {
+            "url": f"https://example.org/term/{n}",
+            "name": f"Term {n}" if n % 10 else f"Renamed term {n}",
+            "source": "USGS Thesaurus"
+        }
+        for n in range(count // 2, count + count // 2)
+    ]
+    return graph_terms, load_file_terms
+
+
+def timed_diff(graph_terms, load_file_terms, path=None):
+    start = time.perf_counter()
+    key_index = graph.KeyIndex(path)
+    key_index.add((i["url"], graph.fingerprint({p: i[p] for p in properties})) for i in graph_terms)
+    delta = graph.diff_records(key_index, load_file_terms, "url", properties=properties)
+    key_index.close()
+    return delta, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=200000)
+    parser.add_argument("--compare", type=int, default=5000)
+    args = parser.parse_args()
+
+    graph_terms, load_file_terms = synthetic_terms(args.compare)
+    start = time.perf_counter()
+    previous_missing = previous_missing_terms(load_file_terms, graph_terms)
+    previous_seconds = time.perf_counter() - start
+    delta, diff_seconds = timed_diff(graph_terms, load_file_terms)
+    assert delta["new"] == previous_missing
+
+    print(f"{args.compare} terms")
+    print(f"  previous nested scan:   {previous_seconds:8.3f}s")
+    print(f"  diff_records:           {diff_seconds:8.3f}s ({previous_seconds / diff_seconds:.0f}x)")
+
+    graph_terms, load_file_terms = synthetic_terms(args.terms)
+    delta, memory_seconds = timed_diff(graph_terms, load_file_terms)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        disk_delta, disk_seconds = timed_diff(graph_terms, load_file_terms, os.path.join(temp_dir, "keys.db"))
+    # The SQLite index lists missing keys in key order rather than graph order
+    assert sorted(disk_delta.pop("missing")) == sorted(delta["missing"])
+    assert all(disk_delta[k] == delta[k] for k in disk_delta)
+
+    print(f"{args.terms} terms ({len(delta['new'])} new, {len(delta['changed'])} changed, {len(delta['missing'])} missing)")
+    print(f"  diff_records in memory: {memory_seconds:8.3f}s")
+    print(f"  diff_records in SQLite: {disk_seconds:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
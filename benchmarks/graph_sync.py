@@ -0,0 +1,113 @@
+"""
+Compares a full reload of synthetic DOI records (every node and relationship MERGEd again) with GraphLoader.sync,
+which only writes what a ChangeTracker finds changed since the previous sync. Both run against an in-memory fake
+driver that counts rows and charges a fixed cost per row (--row-cost seconds, roughly what a MERGE costs on a real
+server). The second sync changes --changed records, drops --dropped records and adds --added new ones. Times include
+flattening the records and, for the sync, fingerprinting them.
+
+    python benchmarks/graph_sync.py --records 20000 --changed 200 --dropped 50 --added 100
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from pylinkedcmd import graph, isaid
+
+
+class CountingResult:
+    def consume(self):
+        return None
+
+
+class CountingDriver:
+    def __init__(self, row_cost):
+        self.row_cost = row_cost
+        self.rows = 0
+
+    def session(self, database=None):
+        return CountingSession(self)
+
+
+class CountingSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def run(self, query, **parameters):
+        self.driver.rows += len(parameters.get("rows", list()))
+        time.sleep(self.driver.row_cost * len(parameters.get("rows", list())))
+        return CountingResult()
+
+    def execute_write(self, transaction_function):
+        return transaction_function(self)
+
+
+def doi_doc(n, revision=0):
+    return {
+        "title": f"Report {n}" if not revision else f"Report {n} (revised)",
+        "URL": f"https://doi.org/10.5066/P9SYNC{n:06d}",
+        "DOI": f"10.5066/P9SYNC{n:06d}",
+        "issued": {"date-parts": [[2000 + n % 20]]},
+        "type": "report",
+        "publisher": "US Geological Survey",
+        "subject": [f"subject {n % 500}", f"subject {(n * 7) % 500}"],
+        "author": [
+            {
+                "given": "Author",
+                "family": f"{(n + i) % 3000}",
+                "ORCID": f"https://orcid.org/0000-0000-{(n + i) % 3000:04d}-0000"
+            }
+            for i in range(3)
+        ]
+    }
+
+
+def elements(docs):
+    return graph.graph_elements([isaid.work_node_from_doi_doc(i) for i in docs])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--changed", type=int, default=200)
+    parser.add_argument("--dropped", type=int, default=50)
+    parser.add_argument("--added", type=int, default=100)
+    parser.add_argument("--row-cost", type=float, default=0.0001)
+    args = parser.parse_args()
+
+    first_docs = [doi_doc(n) for n in range(args.records)]
+    second_docs = [
+        doi_doc(n, revision=1 if n < args.changed else 0)
+        for n in range(args.dropped, args.records + args.added)
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tracker = graph.ChangeTracker(os.path.join(temp_dir, "sync.db"), "doi")
+        graph.GraphLoader(CountingDriver(0)).sync(tracker, *elements(first_docs), ensure_schema=False)
+
+        full_driver = CountingDriver(args.row_cost)
+        start = time.perf_counter()
+        graph.GraphLoader(full_driver).load(*elements(second_docs), ensure_schema=False)
+        full_seconds = time.perf_counter() - start
+
+        sync_driver = CountingDriver(args.row_cost)
+        start = time.perf_counter()
+        summary = graph.GraphLoader(sync_driver).sync(tracker, *elements(second_docs), ensure_schema=False)
+        sync_seconds = time.perf_counter() - start
+        tracker.close()
+
+    print(f"full reload:       {full_driver.rows:8d} rows written in {full_seconds:7.2f}s")
+    print(f"incremental sync:  {sync_driver.rows:8d} rows written in {sync_seconds:7.2f}s")
+    print(f"speedup:           {full_seconds / sync_seconds:8.1f}x")
+    for kind, counts in summary.items():
+        print(f"  {kind}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares tagging texts with a VocabularyTagger against the per-label regex scan from the NER Training notebook
+(re.finditer over every reference label for every text, here with the labels escaped), on a synthetic vocabulary and
+synthetic texts that mention a share of its labels.
+
+    python benchmarks/tagger_vs_regex.py --labels 5000 --texts 100
+"""
+import argparse
+import random
+import re
+import time
+
+from pylinkedcmd.tagger import VocabularyTagger
+
+filler = "the of and in to a is for on with by from sediment water survey basin data analysis regional study".split()
+
+
+def synthetic_vocabulary(label_count, seed=42):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ro", "sa", "tu", "vi", "zo", "qu", "ex", "an"]
+    vocabulary = list()
+    for n in range(label_count):
+        words = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        vocabulary.append({
+            "source": "Synthetic",
+            "label": " ".join(words).title(),
+            "concept_label": rng.choice(["MINERAL_SPECIES", "GEOLOGIC_FORMATION", "US_COUNTY", "NAMED_VOLCANO"])
+        })
+    return vocabulary
+
+
+def synthetic_texts(vocabulary, text_count, words_per_text=150, seed=7):
+    rng = random.Random(seed)
+    texts = list()
+    for _ in range(text_count):
+        words = [rng.choice(filler) for _ in range(words_per_text)]
+        for _ in range(5):
+            words.insert(rng.randrange(len(words)), rng.choice(vocabulary)["label"])
+        texts.append(" ".join(words))
+    return texts
+
+
+def regex_spans(text, vocabulary):
+    entities = list()
+    for ref in vocabulary:
+        for m in re.finditer(re.escape(ref["label"]), text):
+            entities.append((m.start(), m.end(), ref["concept_label"]))
+    return entities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", type=int, default=5000)
+    parser.add_argument("--texts", type=int, default=100)
+    args = parser.parse_args()
+
+    vocabulary = synthetic_vocabulary(args.labels)
+    texts = synthetic_texts(vocabulary, args.texts)
+
+    start = time.perf_counter()
+    tagger = VocabularyTagger(vocabulary)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tagged = list(tagger.tag_texts(texts))
+    tagger_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    regex_tagged = [regex_spans(text, vocabulary) for text in texts]
+    regex_time = time.perf_counter() - start
+
+    print(f"{args.labels} labels, {args.texts} texts")
+    print(f"tagger: {build_time:.2f}s to build, {tagger_time:.2f}s to tag ({args.texts / tagger_time:,.0f} texts/s), {sum(map(len, tagged))} spans")
+    print(f"regex:  {regex_time:.2f}s to tag ({args.texts / regex_time:,.0f} texts/s), {sum(map(len, regex_tagged))} raw matches")
+    print(f"speedup: {regex_time / tagger_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares the UsgsWeb HTML parsing backends on saved staff profile and staff listing pages. For each backend it
+reports pages parsed per second and the peak Python memory allocated while parsing one page, and checks that the
+dictionaries produced match the default html.parser output exactly. The memory figure comes from tracemalloc, which
+does not see libxml2's own allocations, so it understates the lxml backends somewhat.
+
+    python benchmarks/usgsweb_parsers.py --repeat 200
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from pylinkedcmd.client import Client
+from pylinkedcmd.usgsweb import UsgsWeb, html_parsers, lxml
+
+fixture_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(fixture_path, name), "rb") as f:
+        return f.read()
+
+
+def measure(parse, repeat):
+    tracemalloc.start()
+    parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse()
+    elapsed = time.perf_counter() - start
+
+    return repeat / elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    profile_html = load_fixture("usgs_staff_profile.html")
+    listing_html = load_fixture("usgs_staff_listing.html")
+    profile_url = "https://www.usgs.gov/staff-profiles/jane-q-hydrologist"
+    date_retrieved = "2020-08-05T00:00:00"
+
+    backends = [p for p in html_parsers if p == "html.parser" or lxml is not None]
+    scrapers = {p: UsgsWeb(client=Client(pool_maxsize=1), parser=p) for p in backends}
+
+    reference_profile = scrapers["html.parser"].parse_profile(profile_url, profile_html, date_retrieved)
+    reference_listing = scrapers["html.parser"].parse_staff_listing(listing_html, date_retrieved)
+
+    print(f"{'backend':<12} {'page':<8} {'pages/sec':>10} {'peak MiB':>9} identical")
+    for backend, scraper in scrapers.items():
+        profile_rate, profile_peak = measure(
+            lambda: scraper.parse_profile(profile_url, profile_html, date_retrieved), args.repeat
+        )
+        listing_rate, listing_peak = measure(
+            lambda: scraper.parse_staff_listing(listing_html, date_retrieved), args.repeat
+        )
+        profile_same = scraper.parse_profile(profile_url, profile_html, date_retrieved) == reference_profile
+        listing_same = scraper.parse_staff_listing(listing_html, date_retrieved) == reference_listing
+        print(f"{backend:<12} {'profile':<8} {profile_rate:>10.1f} {profile_peak:>9.2f} {profile_same}")
+        print(f"{backend:<12} {'listing':<8} {listing_rate:>10.1f} {listing_peak:>9.2f} {listing_same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Times an offline build of Wikidata sources with read_wd_dump over a synthetic gzipped dump in the latest-all.json
+layout (one entity per line), at one parsing process and at several. Entities are padded with unrelated claims so
+their size is closer to real dump entities, and a share of them belong to the sources being built.
+
+    python benchmarks/wd_dump_build.py --entities 200000 --processes 4
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+
+from pylinkedcmd.wikidata import read_wd_dump
+
+sources = ["Wikidata Mineral Species", "Wikidata Global Volcanos", "Wikidata US Territories"]
+source_classes = [("P31", "Q12089225"), ("P31", "Q8072")]
+
+
+def item_claim(prop, qid, rank="normal"):
+    return {
+        "mainsnak": {"snaktype": "value", "property": prop, "datavalue": {"value": {"entity-type": "item", "id": qid}, "type": "wikibase-entityid"}},
+        "type": "statement",
+        "rank": rank
+    }
+
+
+def synthetic_entity(n, rng):
+    claims = {f"P{rng.randrange(100, 5000)}": [item_claim("P0", f"Q{rng.randrange(10 ** 6, 10 ** 7)}")] for _ in range(30)}
+    if rng.random() < 0.05:
+        prop, qid = rng.choice(source_classes)
+        claims[prop] = [item_claim(prop, qid)]
+    elif rng.random() < 0.01:
+        claims["P31"] = [item_claim("P31", "Q1352230"), item_claim("P31", "Q462778")]
+
+    entity = {
+        "type": "item",
+        "id": f"Q{n}",
+        "labels": {"en": {"language": "en", "value": f"Entity {n}"}, "de": {"language": "de", "value": f"Ding {n}"}},
+        "descriptions": {"en": {"language": "en", "value": f"synthetic entity {n}"}},
+        "aliases": {"en": [{"language": "en", "value": f"Alias {n}"}, {"language": "en", "value": f"Other {n}"}]},
+        "claims": claims
+    }
+    return entity
+
+
+def write_dump(path, entity_count, seed=42):
+    rng = random.Random(seed)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("[\n")
+        for n in range(1, entity_count + 1):
+            f.write(json.dumps(synthetic_entity(n, rng)))
+            f.write(",\n" if n < entity_count else "\n")
+        f.write("]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=200000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump_path = os.path.join(tmp, "latest-all.json.gz")
+        write_dump(dump_path, args.entities)
+        print(f"{args.entities} entities, {os.path.getsize(dump_path) / 2 ** 20:.1f} MiB compressed")
+
+        results = dict()
+        for processes in sorted(set([1, args.processes])):
+            start = time.perf_counter()
+            results[processes] = read_wd_dump(dump_path, sources=sources, processes=processes)
+            elapsed = time.perf_counter() - start
+            concepts = sum(len(i) for i in results[processes].values())
+            print(f"processes={processes}: {elapsed:.2f}s, {args.entities / elapsed:,.0f} entities/s, {concepts} concepts")
+
+        baseline = results[1]
+        assert all(results[processes] == baseline for processes in results)
+
+
+if __name__ == "__main__":
+    main()
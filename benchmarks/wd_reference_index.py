@@ -0,0 +1,82 @@
+"""
+Compares label lookups with search_wd_reference over the plain Wikidata reference list against lookups through a
+WdReferenceIndex, on a synthetic vocabulary shaped like build_wd_reference output: preferred and alternate labels
+spread over several sources, with a share of labels repeated across sources.
+
+    python benchmarks/wd_reference_index.py --labels 500000 --lookups 200
+"""
+import argparse
+import random
+import time
+
+from pylinkedcmd.wikidata import WdReferenceIndex, search_wd_reference
+
+sources = [
+    ("Wikidata Mineral Species", "MINERAL_SPECIES"),
+    ("Wikidata Geologic Formations", "GEOLOGIC_FORMATION"),
+    ("Wikidata US Counties", "US_COUNTY"),
+    ("Wikidata Global Volcanos", "NAMED_VOLCANO"),
+    ("Wikidata Aquifers", "NAMED_GROUNDWATER_AQUIFER")
+]
+
+
+def synthetic_reference(label_count, seed=42):
+    rng = random.Random(seed)
+    wd_reference = list()
+    for n in range(label_count):
+        source, concept_label = rng.choice(sources)
+        label_number = n if rng.random() > 0.1 else rng.randrange(max(1, n))
+        wd_reference.append({
+            "source": source,
+            "source_reference": "https://www.wikidata.org/wiki/Q0",
+            "label": f"Label {label_number}",
+            "concept_label": concept_label,
+            "identifier": f"http://www.wikidata.org/entity/Q{n}",
+            "label_source": "preferred" if rng.random() > 0.3 else "alternate"
+        })
+    return wd_reference
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", type=int, default=500000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    wd_reference = synthetic_reference(args.labels)
+    rng = random.Random(7)
+    search_labels = [f"Label {rng.randrange(args.labels)}" for _ in range(args.lookups)]
+    search_options = [
+        {},
+        {"preferred_only": True},
+        {"wd_source": sources[0][0]},
+        {"source_priority_list": [sources[1][0], sources[2][0]], "return_var": "identifier"}
+    ]
+
+    start = time.perf_counter()
+    index = WdReferenceIndex(wd_reference)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    list_results = [
+        search_wd_reference(label, wd_reference, **search_options[n % len(search_options)])
+        for n, label in enumerate(search_labels)
+    ]
+    list_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_results = [
+        index.search(label, **search_options[n % len(search_options)])
+        for n, label in enumerate(search_labels)
+    ]
+    index_seconds = time.perf_counter() - start
+
+    print(f"vocabulary size:         {args.labels}")
+    print(f"index build:             {build_seconds:10.3f} sec")
+    print(f"list scan lookups:       {args.lookups / list_seconds:10.1f} lookups/sec")
+    print(f"index lookups:           {args.lookups / index_seconds:10.1f} lookups/sec")
+    print(f"identical results:       {list_results == index_results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,14 @@
 # Config and helpers
+import csv
 import re
-import requests
-import pickle
 import os
 from neo4j import GraphDatabase
 from io import StringIO
 from html.parser import HTMLParser
-import pandas as pd
 import meilisearch
+from pylinkedcmd import storage
+from pylinkedcmd import chs
+from pylinkedcmd import graph
 
 cache_api_domain = os.environ["CHS_ISAID_API"]
 cache_api_domain_aggs = os.environ["CHS_ISAID_API_AGGS"]
@@ -20,21 +21,21 @@ f_mas_n_regions = f"{local_cache_path_rel}usgs_missions_regions.csv"
 f_usgs_centers = f"{local_cache_path_rel}usgs_cost_centers.csv"
 f_cost_center_projects = f"{local_cache_path_rel}sipp_cost_center_projects.p"
 
-f_raw_profiles = f"{local_cache_path_rel}process_usgs_profiles.p"
+f_raw_profiles = f"{local_cache_path_rel}process_usgs_profiles.jsonl.gz"
 f_graphable_profiles = f"{local_cache_path_rel}graphable_table_profile_entities.csv"
 f_graphable_profile_expertise = f"{local_cache_path_rel}graphable_table_profile_expertise.csv"
 f_graphable_profile_creative_works = f"{local_cache_path_rel}graphable_table_profile_creative_works.csv"
 
-f_raw_sb_people = f"{local_cache_path_rel}process_sb_people.p"
+f_raw_sb_people = f"{local_cache_path_rel}process_sb_people.jsonl.gz"
 f_graphable_sb_people = f"{local_cache_path_rel}graphable_table_sb_people.csv"
 
-f_raw_orcid = f"{local_cache_path_rel}process_orcid.p"
+f_raw_orcid = f"{local_cache_path_rel}process_orcid.jsonl.gz"
 f_graphable_orcid = f"{local_cache_path_rel}graphable_table_orcid.csv"
 
-f_process_pw = f"{local_cache_path_rel}process_pw.p"
+f_process_pw = f"{local_cache_path_rel}process_pw.jsonl.gz"
 f_graphable_pw = f"{local_cache_path_rel}graphable_pw.csv"
 
-f_raw_sdc = f"{local_cache_path_rel}process_sdc.p"
+f_raw_sdc = f"{local_cache_path_rel}process_sdc.jsonl.gz"
 f_graphable_sdc = f"{local_cache_path_rel}graphable_table_sdc.csv"
 f_graphable_sdc_rels_usgs_thesaurus = f"{local_cache_path_rel}graphable_table_sdc_usgs_thesaurus.csv"
 f_graphable_sdc_rels_places = f"{local_cache_path_rel}graphable_table_sdc_places.csv"
@@ -53,7 +54,7 @@ model_catalog_api = "https://www.sciencebase.gov/catalog/items?&max=200&folderId
 f_raw_model_catalog = f"{local_cache_path_rel}usgs_model_catalog.p"
 f_graphable_model_catalog = f"{local_cache_path_rel}graphable_table_model_catalog.csv"
 
-f_raw_doi = f"{local_cache_path_rel}doi.p"
+f_raw_doi = f"{local_cache_path_rel}doi.jsonl.gz"
 f_graphable_doi = f"{local_cache_path_rel}graphable_table_doi.csv"
 f_graphable_doi_contacts = f"{local_cache_path_rel}graphable_table_doi_contacts.csv"
 f_graphable_doi_funders = f"{local_cache_path_rel}graphable_table_doi_funders.csv"
@@ -79,6 +80,7 @@ f_graphable_sipp_projects = f"{local_cache_path_rel}graphable_sipp_projects.csv"
 f_graphable_sipp_staffing = f"{local_cache_path_rel}graphable_sipp_staffing.csv"
 
 f_graphable_reference_terms = f"{local_cache_path_rel}graphable_reference_terms.csv"
+f_graph_sync = f"{local_cache_path_rel}graph_sync.db"
 
 graph_driver = GraphDatabase.driver(
     os.environ["NEO4J_CONX"],
@@ -105,73 +107,79 @@ def get_search_client():
     )
     return search_client
 
-def cache_chs_cache(cache, exclude_errors=True):
-    all_data = list()
-
-    limit = 400
-    api_path = f"{cache_api_domain}{cache_api_path}?es_search_index=cache_{cache}&page_size={limit}&scan=True"
-    results = None
-    while True:
-        if results and "_scroll_id" in results and "scroll_id" not in api_path:
-            api_path = f"{api_path}&scroll_id={results['_scroll_id']}"
-
-        results = requests.get(api_path).json()
-
-        try:
-            if not results["hits"]["hits"]:
-                break
-            else:
-                if exclude_errors:
-                    docs = [i["_source"] for i in results["hits"]["hits"] if "error" not in i]
-                else:
-                    docs = [i["_source"] for i in results["hits"]["hits"]]
-                all_data.extend(docs)
-        except:
-            print(api_path)
-            print(results)
-            break
-            
-    return all_data
+def cache_chs_cache(cache, store_path, exclude_errors=True, page_size=1000, slices=1, checkpoint_path=None):
+    # Exports straight into the store; an interrupted run picks up from its checkpoint when it is run again
+    if checkpoint_path is None:
+        checkpoint_path = f"{store_path}.checkpoint"
+    chs_cache = chs.ChsCache(cache_api_domain, cache_api_path)
+    return chs_cache.export(
+        cache,
+        storage.JsonlStore(store_path),
+        page_size=page_size,
+        slices=slices,
+        exclude_errors=exclude_errors,
+        checkpoint_path=checkpoint_path
+    )
 
 def active_usgs_emails(raw_sb_directory_file=f_raw_sb_people):
     if not os.path.exists(raw_sb_directory_file):
         raise ValueError("The raw ScienceBase Directory cache file doesn't exist. Run that first.")
         
-    sb_people = pickle.load(open(raw_sb_directory_file, "rb"))
+    sb_people = storage.JsonlStore(raw_sb_directory_file).iter_records(fields=["email", "active"])
     emails = list(set([
         p["email"] for p in sb_people
-        if "email" in p and p["active"]
+        if p["email"] is not None and p["active"]
     ]))
     
     return emails
 
 def reference_terms_to_graph():
+    # Only terms not yet in the graph are loaded; existing terms are left as they are, as with the ON CREATE SET this
+    # replaced. Returns the rows of the reference terms file that still aren't in the graph after the load (an empty
+    # list when everything loaded).
     if not os.path.exists(f_graphable_reference_terms):
         return
 
-    with graph_driver.session(database=graphdb) as session:
-        session.run("""
-        LOAD CSV WITH HEADERS FROM '%(source_path)s/%(source_file)s' AS row
-        WITH row
-            MERGE (ds:DefinedSubjectMatter {url: row.url}) 
-            ON CREATE
-                SET ds.name = row.label,
-                ds.description = row.description,
-                ds.source = row.source,
-                ds.reference = row.source_reference,
-                ds.concept_label = row.concept_label
-        """ % {
-            "source_path": local_cache_path,
-            "source_file": f_graphable_reference_terms
-        })
-        
-        ds_in_graph = session.run("""
-        MATCH (ds:DefinedSubjectMatter)
-        RETURN ds.name AS name, ds.url AS url
-        """).data()
-        
-    load_file_terms = pd.read_csv(f_graphable_reference_terms).to_dict(orient="records")
-    return [i for i in load_file_terms if i["url"] not in [ds["url"] for ds in ds_in_graph]]
+    with open(f_graphable_reference_terms, "r", newline="") as f:
+        load_file_terms = list(csv.DictReader(f))
+
+    terms = [
+        {
+            "url": row["url"] or None,
+            "name": row["label"] or None,
+            "description": row["description"] or None,
+            "source": row["source"] or None,
+            "reference": row["source_reference"] or None,
+            "concept_label": row["concept_label"] or None
+        } for row in load_file_terms
+    ]
+
+    term_delta = graph.diff_graph(
+        graph_driver,
+        "DefinedSubjectMatter",
+        "url",
+        terms,
+        database=graphdb,
+        include_missing=False
+    )
+
+    loader = graph.GraphLoader(graph_driver, database=graphdb)
+    loader.load_nodes([
+        {"label": "DefinedSubjectMatter", "key": "url", "properties": {k: v for k, v in i.items() if v is not None}}
+        for i in term_delta["new"]
+    ])
+
+    still_missing = graph.diff_graph(
+        graph_driver,
+        "DefinedSubjectMatter",
+        "url",
+        term_delta["new"],
+        database=graphdb,
+        include_missing=False
+    )["new"]
+    missing_urls = set(i["url"] for i in still_missing)
+
+    return [i for i in load_file_terms if not i["url"] or i["url"] in missing_urls]
     
     
 class MLStripper(HTMLParser):
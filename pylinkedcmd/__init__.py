@@ -5,11 +5,17 @@ __email__ = 'sbristol@usgs.gov'
 __version__ = '0.2.3'
 
 from . import utilities
+from . import client
+from . import cache
 from . import orcid
 from . import doi
 from . import sciencebase
 from . import usgsweb
 from . import pw
+from . import tagger
+from . import storage
+from . import chs
+from . import graph
 from . import isaid
 
 
@@ -0,0 +1,199 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+
+revalidation_headers = ["ETag", "Last-Modified", "Cache-Control", "Expires"]
+
+
+def cache_timestamp(fetched_at):
+    '''
+    Formats a stored fetch time (seconds since the epoch) the same way the fetchers stamp _date_cached values.
+    '''
+    return str(datetime.utcfromtimestamp(fetched_at).isoformat())
+
+
+class ResponseCache:
+    '''
+    Base class for the HTTP response caches that can be attached to a pylinkedcmd.client.Client. Responses are keyed on
+    the full request URL plus the Accept header, since content negotiation returns different documents for the same
+    URL. A cached response younger than the TTL for its source (the host name of the URL) is returned without touching
+    the network. Older responses are revalidated with a conditional GET using the stored ETag and Last-Modified
+    values, so unchanged records cost a 304 instead of a full download.
+
+    Backends only need to implement read and write; hit, revalidation and miss counters are kept here.
+    :param default_ttl: seconds a response is served from the cache before being revalidated
+    :param source_ttl: dictionary of host name to TTL in seconds for sources that change more or less often than the
+    default, e.g. {"doi.org": 30 * 86400, "www.usgs.gov": 7 * 86400}
+    '''
+    def __init__(self, default_ttl=86400, source_ttl=None):
+        self.default_ttl = default_ttl
+        self.source_ttl = source_ttl or dict()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def read(self, url, accept):
+        raise NotImplementedError
+
+    def write(self, url, accept, entry):
+        raise NotImplementedError
+
+    def ttl(self, url):
+        return self.source_ttl.get(urlparse(url).netloc, self.default_ttl)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses
+        }
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def fetch(self, url, accept, headers, send):
+        '''
+        Returns a response for url from the cache or from send, a function taking request headers and performing the
+        actual GET. Every response returned carries a fetched_at attribute with the time its content was last
+        retrieved or confirmed from the source.
+        '''
+        entry = self.read(url, accept)
+        now = time.time()
+
+        if entry is not None and now - entry["fetched_at"] < self.ttl(url):
+            self._count("hits")
+            return response_from_entry(url, entry)
+
+        request_headers = dict(headers or dict())
+        if entry is not None:
+            if entry["etag"]:
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        r = send(request_headers)
+
+        if r.status_code == 304 and entry is not None:
+            # A 304 can carry new validators and freshness headers, which replace the stored ones
+            entry_headers = CaseInsensitiveDict(entry["headers"])
+            for header in revalidation_headers:
+                if header in r.headers:
+                    entry_headers[header] = r.headers[header]
+            entry["headers"] = dict(entry_headers)
+            entry["etag"] = entry_headers.get("ETag")
+            entry["last_modified"] = entry_headers.get("Last-Modified")
+            entry["fetched_at"] = now
+            self.write(url, accept, entry)
+            self._count("revalidations")
+            return response_from_entry(url, entry)
+
+        self._count("misses")
+        if r.status_code == 200:
+            self.write(url, accept, entry_from_response(r, now))
+
+        r.fetched_at = cache_timestamp(now)
+        return r
+
+
+def entry_from_response(r, fetched_at):
+    return {
+        "status_code": r.status_code,
+        "headers": dict(r.headers),
+        "content": r.content,
+        "encoding": r.encoding,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "fetched_at": fetched_at
+    }
+
+
+def response_from_entry(url, entry):
+    r = requests.Response()
+    r.url = url
+    r.status_code = entry["status_code"]
+    r.headers = CaseInsensitiveDict(entry["headers"])
+    r._content = entry["content"]
+    r._content_consumed = True
+    r.encoding = entry["encoding"]
+    r.fetched_at = cache_timestamp(entry["fetched_at"])
+    r.from_cache = True
+    return r
+
+
+class SqliteCache(ResponseCache):
+    '''
+    ResponseCache backed by a single SQLite file, which is safe to share across the worker threads of a Client and
+    persists between notebook runs.
+    :param path: location of the SQLite database file, created if it does not exist
+    '''
+    def __init__(self, path, default_ttl=86400, source_ttl=None):
+        super().__init__(default_ttl=default_ttl, source_ttl=source_ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT NOT NULL,
+                    accept TEXT NOT NULL,
+                    status_code INTEGER,
+                    headers TEXT,
+                    content BLOB,
+                    encoding TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL,
+                    PRIMARY KEY (url, accept)
+                )
+            """)
+
+    def read(self, url, accept):
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT status_code, headers, content, encoding, etag, last_modified, fetched_at
+                FROM responses WHERE url = ? AND accept = ?
+                """,
+                (url, accept or "")
+            ).fetchone()
+
+        if row is None:
+            return
+
+        return {
+            "status_code": row[0],
+            "headers": json.loads(row[1]),
+            "content": row[2],
+            "encoding": row[3],
+            "etag": row[4],
+            "last_modified": row[5],
+            "fetched_at": row[6]
+        }
+
+    def write(self, url, accept, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    accept or "",
+                    entry["status_code"],
+                    json.dumps(entry["headers"]),
+                    entry["content"],
+                    entry["encoding"],
+                    entry["etag"],
+                    entry["last_modified"],
+                    entry["fetched_at"]
+                )
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,195 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from .client import default_client
+from .storage import JsonlStore
+
+
+class ChsCache:
+    '''
+    Client for exporting whole caches (e.g. "doi", "orcid", "usgs_profiles") from the CHS cache API, which scrolls
+    through an Elasticsearch index a page at a time. Documents are yielded as pages arrive rather than collected into
+    one list, and the export can be split into slices, each scrolling its own share of the index on its own thread,
+    using Elasticsearch sliced scroll parameters passed through the API.
+
+    Slicing only works if the API forwards slice_id and slice_max to Elasticsearch. If it doesn't, every slice
+    scrolls the whole index and each document comes back once per slice, so the first pages of the slices are checked
+    against each other and a ValueError is raised, before any of the repeated documents are handed over, if they
+    share a document.
+
+    A scroll can't be rewound, so a failed export can only be resumed if every document from the pages already
+    scrolled past was kept. export writes each page to a JsonlStore before saving the scroll position, so an export
+    started again with the same checkpoint_path and settings picks up each slice from where it stopped, as long as the
+    server still holds the scroll. iter_docs doesn't checkpoint, since it can't know what its caller kept.
+    :param api_domain: base URL of the cache API
+    :param api_path: API path appended to the base URL
+    :param client: optional pylinkedcmd.client.Client to send requests through
+    '''
+    def __init__(self, api_domain, api_path="prod", client=None):
+        self.api_url = f"{api_domain}{api_path}"
+        self.client = client or default_client()
+
+    def _fetch_page(self, cache, page_size, slice_id, slices, scroll_id):
+        params = {
+            "es_search_index": f"cache_{cache}",
+            "page_size": page_size,
+            "scan": "True"
+        }
+        if slices > 1:
+            params["slice_id"] = slice_id
+            params["slice_max"] = slices
+        if scroll_id is not None:
+            params["scroll_id"] = scroll_id
+
+        r = self.client.get(self.api_url, params=params)
+        if r.status_code != 200:
+            raise ValueError(f"CHS cache API returned HTTP Status Code {r.status_code} for {cache} slice {slice_id}")
+
+        results = r.json()
+        if "hits" not in results or "hits" not in results["hits"]:
+            raise ValueError(f"Unexpected CHS cache API response for {cache} slice {slice_id}: {str(results)[:500]}")
+
+        return results
+
+    def _new_checkpoint(self, cache, page_size, slices):
+        return {
+            "cache": cache,
+            "page_size": page_size,
+            "slices": slices,
+            "stored": 0,
+            "slice_state": {str(i): {"scroll_id": None, "pages": 0, "docs": 0, "done": False} for i in range(slices)}
+        }
+
+    def _iter_pages(self, cache, page_size, slices, exclude_errors, checkpoint, page_done=None):
+        # Yields the documents of each page as a list. A slice's scroll state is only moved on, page_done called and
+        # the slice's next page requested once the caller comes back for more, i.e. once it has dealt with the page.
+        first_page_ids = dict()
+
+        with ThreadPoolExecutor(max_workers=slices) as executor:
+            in_flight = dict()
+
+            def request_page(slice_id):
+                state = checkpoint["slice_state"][slice_id]
+                future = executor.submit(
+                    self._fetch_page, cache, page_size, int(slice_id), slices, state["scroll_id"]
+                )
+                in_flight[future] = slice_id
+
+            for slice_id, state in checkpoint["slice_state"].items():
+                if not state["done"]:
+                    request_page(slice_id)
+
+            # When a slice fails, the pages other slices already have in flight have moved their scrolls on, so they
+            # are still handed over before the error is raised.
+            failure = None
+            try:
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        slice_id = in_flight.pop(future)
+                        try:
+                            results = future.result()
+                        except Exception as e:
+                            if failure is None:
+                                failure = e
+                            continue
+                        state = checkpoint["slice_state"][slice_id]
+                        hits = results["hits"]["hits"]
+
+                        if slices > 1 and state["pages"] == 0:
+                            page_ids = set(hit.get("_id") for hit in hits)
+                            if any(page_ids & other_ids for other_ids in first_page_ids.values()):
+                                raise ValueError(
+                                    f"Slices of the {cache} cache returned the same documents; the CHS cache API "
+                                    f"doesn't appear to pass slice_id and slice_max on, so export it with slices=1"
+                                )
+                            first_page_ids[slice_id] = page_ids
+
+                        yield [
+                            hit["_source"] for hit in hits
+                            if not (exclude_errors and "error" in hit["_source"])
+                        ]
+
+                        state["pages"] += 1
+                        state["docs"] += len(hits)
+                        state["scroll_id"] = results.get("_scroll_id", state["scroll_id"])
+                        state["done"] = not hits
+                        if page_done is not None:
+                            page_done()
+
+                        if not state["done"] and failure is None:
+                            request_page(slice_id)
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+        if failure is not None:
+            raise failure
+
+    def iter_docs(self, cache, page_size=1000, slices=1, exclude_errors=True):
+        '''
+        Yields the _source documents of a cache, in page order within each slice and in completion order across
+        slices. Raises ValueError if the API returns an error or an unusable response (after the client's retries),
+        once the pages the other slices already had in flight have been yielded. Use export for a run that needs to
+        be resumable.
+        :param cache: name of the cache, without the cache_ index prefix
+        :param page_size: number of documents requested per page
+        :param slices: number of slices scrolled in parallel; only use more than 1 where the API supports slicing
+        :param exclude_errors: skip cached documents that recorded an error instead of a record
+        '''
+        checkpoint = self._new_checkpoint(cache, page_size, slices)
+        for docs in self._iter_pages(cache, page_size, slices, exclude_errors, checkpoint):
+            yield from docs
+
+    def export(self, cache, store, page_size=1000, slices=1, exclude_errors=True, checkpoint_path=None):
+        '''
+        Exports a cache into a JsonlStore, replacing its contents once the whole cache has been written, and returns
+        the number of documents stored. Pages are appended to a .partial store next to it as they arrive. With a
+        checkpoint_path, the scroll position is saved after each page has been appended, and a failed export run
+        again with the same settings carries on from there; the checkpoint and partial store are removed once every
+        slice has finished.
+        :param cache: name of the cache, without the cache_ index prefix
+        :param store: pylinkedcmd.storage.JsonlStore the documents are written to
+        :param page_size: number of documents requested per page
+        :param slices: number of slices scrolled in parallel; only use more than 1 where the API supports slicing
+        :param exclude_errors: skip cached documents that recorded an error instead of a record
+        :param checkpoint_path: optional JSON file the scroll position is saved to after every page
+        '''
+        partial_store = JsonlStore(f"{store.path}.partial")
+        checkpoint = self._new_checkpoint(cache, page_size, slices)
+
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r") as f:
+                saved_checkpoint = json.load(f)
+            if [saved_checkpoint[k] for k in ["cache", "page_size", "slices"]] != [cache, page_size, slices]:
+                raise ValueError(f"Checkpoint at {checkpoint_path} was saved for a different export: {saved_checkpoint}")
+            checkpoint = saved_checkpoint
+
+            # A page appended after the last checkpoint was saved will be fetched again, so it is cut off here
+            stored_count = partial_store.count()
+            if stored_count < checkpoint["stored"]:
+                raise ValueError(
+                    f"{partial_store.path} holds {stored_count} documents but the checkpoint at {checkpoint_path} "
+                    f"counts {checkpoint['stored']}, so the export can't be resumed"
+                )
+            if stored_count > checkpoint["stored"]:
+                partial_store.write(islice(partial_store.iter_records(), checkpoint["stored"]))
+        else:
+            partial_store.write(list())
+
+        def save_checkpoint():
+            if checkpoint_path is None:
+                return
+            with open(f"{checkpoint_path}.tmp", "w") as f:
+                json.dump(checkpoint, f)
+            os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+        for docs in self._iter_pages(cache, page_size, slices, exclude_errors, checkpoint, page_done=save_checkpoint):
+            checkpoint["stored"] += partial_store.append(docs, batch_size=max(len(docs), 1))
+
+        os.replace(partial_store.path, store.path)
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        return checkpoint["stored"]
@@ -0,0 +1,280 @@
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+retry_status_codes = [429, 502, 503, 504]
+
+
+def retry_after_seconds(response):
+    '''
+    Interprets a Retry-After header, which can be either a number of seconds or an HTTP date, as a number of seconds
+    to wait from now. Returns None if the response has no usable header.
+    '''
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return
+
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    '''
+    Token bucket rate limiter keyed on host name. Every host gets its own bucket refilling at rate requests per
+    second with room for a burst of requests. A host can also be paused outright for a number of seconds, which is how
+    Retry-After instructions from a server are honored for every thread talking to that host.
+
+    An adaptive limiter also adjusts each host's rate to what the server will take: every throttled response halves
+    the host's rate (down to min_rate), and every successful one adds back a small step, up to the configured rate.
+    :param rate: requests per second allowed for each host; None means no rate limit, but pauses still apply
+    :param burst: number of requests that can go out back to back before the rate applies
+    :param adaptive: adjust each host's rate in response to throttled and successful requests
+    :param min_rate: lowest rate an adaptive limiter will drop a host to
+    '''
+    def __init__(self, rate=None, burst=1, adaptive=False, min_rate=0.1):
+        self.rate = rate
+        self.burst = burst
+        self.adaptive = adaptive
+        self.min_rate = min_rate
+        self._host_rates = dict()
+        self._buckets = dict()
+        self._paused_until = dict()
+        self._lock = threading.Lock()
+
+    def host_rate(self, host):
+        return self._host_rates.get(host, self.rate)
+
+    def _delay(self, host):
+        now = time.monotonic()
+        paused_until = self._paused_until.get(host, 0)
+        if paused_until > now:
+            return paused_until - now
+
+        rate = self.host_rate(host)
+        if rate is None:
+            return 0
+
+        tokens, last_check = self._buckets.get(host, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_check) * rate)
+        if tokens >= 1:
+            self._buckets[host] = (tokens - 1, now)
+            return 0
+
+        self._buckets[host] = (tokens, now)
+        return (1 - tokens) / rate
+
+    def wait(self, host):
+        while True:
+            with self._lock:
+                delay = self._delay(host)
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, host, seconds):
+        with self._lock:
+            self._paused_until[host] = max(
+                self._paused_until.get(host, 0),
+                time.monotonic() + seconds
+            )
+
+    def throttled(self, host):
+        if not self.adaptive:
+            return
+        with self._lock:
+            rate = self.host_rate(host)
+            if rate is None:
+                rate = 2 * self.min_rate if self.rate is None else self.rate
+            self._host_rates[host] = max(self.min_rate, rate / 2)
+
+    def succeeded(self, host):
+        if not self.adaptive:
+            return
+        with self._lock:
+            host_rate = self._host_rates.get(host)
+            if host_rate is None:
+                return
+            rate = host_rate + self.min_rate
+            if self.rate is not None and rate >= self.rate:
+                del self._host_rates[host]
+            else:
+                self._host_rates[host] = rate
+
+
+class Client:
+    '''
+    Thin wrapper around a pooled requests session used by the pylinkedcmd fetchers. Connections are kept alive and
+    reused across threads, requests to each host are throttled through a RateLimiter, and responses indicating the
+    server is overloaded (429 and 5xx gateway errors) are retried after whatever Retry-After the server asked for, or an
+    exponential backoff if it didn't say.
+
+    The aget coroutine runs the same request on the client's own thread pool so that fetchers for different sources can
+    overlap their I/O on one event loop while still sharing the connection pool and rate limits with synchronous
+    callers. Concurrency from the event loop is bounded per host by per_host_concurrency.
+    :param pool_maxsize: number of connections kept open per host, which should be at least the number of worker
+    threads sharing the client
+    :param per_host_rate: requests per second allowed for each host (None for no limit)
+    :param adaptive_rate: slow down for hosts that throttle requests and speed back up as requests succeed (see
+    RateLimiter)
+    :param per_host_concurrency: number of requests to a single host that aget will have in flight at once
+    :param max_retries: number of times a throttled or failed request is retried before giving up
+    :param backoff_factor: base number of seconds for the exponential backoff between retries
+    :param timeout: seconds to wait on the server before a request fails
+    :param cache: optional pylinkedcmd.cache.ResponseCache used to serve and revalidate responses
+    '''
+    def __init__(
+        self,
+        pool_maxsize=10,
+        per_host_rate=None,
+        adaptive_rate=False,
+        per_host_concurrency=8,
+        max_retries=3,
+        backoff_factor=1,
+        timeout=60,
+        cache=None
+    ):
+        self.pool_maxsize = pool_maxsize
+        self.per_host_concurrency = per_host_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.cache = cache
+        self.limiter = RateLimiter(per_host_rate, adaptive=adaptive_rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+
+    def get(self, url, headers=None, params=None, stream=False):
+        '''
+        GETs url through the rate limiter, retries and cache. With stream=True the body is left on the connection for
+        the caller to read with iter_content (and close) instead of being loaded up front; cached responses are always
+        read in full, since the cache needs the content anyway.
+        '''
+        if self.cache is None:
+            r = self._send(url, headers, params, stream)
+            r.fetched_at = str(datetime.utcnow().isoformat())
+            return r
+
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        accept = CaseInsensitiveDict(headers or dict()).get("accept")
+
+        return self.cache.fetch(
+            full_url,
+            accept,
+            headers,
+            lambda request_headers: self._send(full_url, request_headers, None)
+        )
+
+    def _send(self, url, headers, params, stream=False):
+        host = urlparse(url).netloc
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait(host)
+            try:
+                r = self.session.get(url, headers=headers, params=params, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self.limiter.pause(host, self.backoff_factor * 2 ** attempt)
+                continue
+
+            if r.status_code == 429:
+                self.limiter.throttled(host)
+            elif r.status_code not in retry_status_codes:
+                self.limiter.succeeded(host)
+
+            if r.status_code not in retry_status_codes or attempt == self.max_retries:
+                return r
+
+            delay = retry_after_seconds(r)
+            r.close()
+            if delay is None:
+                delay = self.backoff_factor * 2 ** attempt
+            self.limiter.pause(host, delay)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_maxsize)
+            return self._executor
+
+    def _host_semaphore(self, host):
+        loop = asyncio.get_running_loop()
+        semaphores = self._loop_semaphores.setdefault(loop, dict())
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return semaphores[host]
+
+    async def aget(self, url, headers=None, params=None, stream=False):
+        async with self._host_semaphore(urlparse(url).netloc):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(),
+                partial(self.get, url, headers=headers, params=params, stream=stream)
+            )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+
+def date_cached(response):
+    '''
+    Returns the time a response's content was fetched from its source, which for a cached response is the stored fetch
+    time rather than now, formatted for the _date_cached stamps on pylinkedcmd records.
+    '''
+    fetched_at = getattr(response, "fetched_at", None)
+    if fetched_at is None:
+        return str(datetime.utcnow().isoformat())
+    return fetched_at
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    '''
+    Returns the Client shared by every pylinkedcmd fetcher that isn't handed one explicitly, creating it on first use.
+    '''
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = Client(pool_maxsize=20)
+        return _default_client
+
+
+def set_default_client(client):
+    '''
+    Replaces the shared Client, e.g. with one that has a persistent response cache attached:
+    set_default_client(Client(pool_maxsize=20, cache=SqliteCache("pylinkedcmd_cache.db")))
+    '''
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
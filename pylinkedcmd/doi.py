@@ -1,9 +1,16 @@
-import requests
 from datetime import datetime
 from copy import copy
+from functools import partial
 from . import utilities
+from .client import Client, default_client, date_cached
 
-def negotiate_doi(doi, response_type="registry", return_errors=False):
+negotiation_headers = {
+    "registry": {"accept": "application/vnd.citationstyles.csl+json"},
+    "reference_string": {"accept": "text/x-bibliography"},
+    "dereference": {"accept": "application/json"}
+}
+
+def _doi_response_stub(doi, return_errors):
     identifiers = utilities.actionable_id(doi)
 
     if identifiers is None:
@@ -12,29 +19,16 @@ def negotiate_doi(doi, response_type="registry", return_errors=False):
         else:
             return
 
-    response_doc = {
+    return {
         "_identifiers": identifiers,
         "_date": str(datetime.utcnow().isoformat())
     }
 
-    if response_type == "registry":
-        headers = {"accept": "application/vnd.citationstyles.csl+json"}
-    elif response_type == "reference_string":
-        headers = {"accept": "text/x-bibliography"}
-    elif response_type == "dereference":
-        headers = {"accept": "application/json"}
-
-    try:
-        r = requests.get(
-            identifiers["url"], 
-            headers=headers
-        )
-    except Exception as e:
-        return {"doi": doi, "error": e}
-
+def _doi_from_response(doi, r, response_doc, response_type):
     if r.status_code != 200:
         return {"doi": doi, "error": f"HTTP Status Code: {str(r.status_code)}"}
     else:
+        response_doc["_date"] = date_cached(r)
         if response_type == "reference_string":
             response_doc["reference_string"] = r.text
         else:
@@ -45,6 +39,77 @@ def negotiate_doi(doi, response_type="registry", return_errors=False):
 
         return response_doc
 
+def negotiate_doi(doi, response_type="registry", return_errors=False, client=None):
+    '''
+    Resolves a single DOI through content negotiation at doi.org. The response_type determines the accept header sent:
+    "registry" returns the CSL JSON from the registration agency, "reference_string" returns a formatted citation, and
+    "dereference" returns whatever JSON the landing page provides. Errors come back as dictionaries with the DOI and an
+    error message. Requests go through the shared pylinkedcmd client unless another client is supplied.
+    '''
+    response_doc = _doi_response_stub(doi, return_errors)
+    if response_doc is None or "error" in response_doc:
+        return response_doc
+
+    if client is None:
+        client = default_client()
+
+    try:
+        r = client.get(
+            response_doc["_identifiers"]["url"], 
+            headers=negotiation_headers[response_type]
+        )
+    except Exception as e:
+        return {"doi": doi, "error": e}
+
+    return _doi_from_response(doi, r, response_doc, response_type)
+
+async def negotiate_doi_async(doi, response_type="registry", return_errors=False, client=None):
+    '''
+    Coroutine form of negotiate_doi that fetches through the shared client without blocking the event loop.
+    '''
+    response_doc = _doi_response_stub(doi, return_errors)
+    if response_doc is None or "error" in response_doc:
+        return response_doc
+
+    if client is None:
+        client = default_client()
+
+    try:
+        r = await client.aget(
+            response_doc["_identifiers"]["url"], 
+            headers=negotiation_headers[response_type]
+        )
+    except Exception as e:
+        return {"doi": doi, "error": e}
+
+    return _doi_from_response(doi, r, response_doc, response_type)
+
+def negotiate_dois(dois, response_type="registry", return_errors=False, max_workers=8, per_host_rate=None, client=None):
+    '''
+    Bulk form of negotiate_doi that runs content negotiation for many DOIs concurrently over one pooled session. Results
+    are yielded as (doi, response_doc) tuples as each request finishes, so they arrive in completion order rather than
+    the order of the input, and response_doc takes the same forms (including error dictionaries and None) that
+    negotiate_doi returns for a single DOI. Requests to each host are limited to per_host_rate per second, and
+    throttled responses are retried after any Retry-After the server sends.
+    :param dois: iterable of DOI strings, which can be a generator
+    :param max_workers: number of requests in flight at once
+    :param per_host_rate: requests per second allowed for each host (None for no limit)
+    :param client: optional pylinkedcmd.client.Client to use instead of building one from max_workers and per_host_rate
+    '''
+    own_client = client is None
+    if own_client:
+        client = Client(pool_maxsize=max_workers, per_host_rate=per_host_rate)
+
+    negotiate = partial(negotiate_doi, response_type=response_type, return_errors=return_errors, client=client)
+
+    try:
+        for doi, response_doc in utilities.concurrent_map(negotiate, dois, max_workers=max_workers):
+            yield doi, response_doc
+    finally:
+        # A client passed in belongs to the caller and stays open
+        if own_client:
+            client.close()
+
 def entity_from_doi(doi_doc):
     '''
     Processes a single DOI record retrieved via content negotiation into a flat summarized structure
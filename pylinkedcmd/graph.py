@@ -0,0 +1,828 @@
+import hashlib
+import itertools
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+node_key_properties = ["doi", "email", "orcid", "identifier_sciencebase", "url", "name"]
+
+relationship_type_keys = ["relationship_type", "node_relationship", "relationship"]
+
+relationship_property_keys = ["date_qualifier", "reference", "relationship_qualifier", "award"]
+
+inbound_relationships = [
+    "AUTHOR_OF",
+    "EDITOR_OF",
+    "POINT_OF_CONTACT",
+    "METADATA_CONTACT",
+    "CONTRIBUTOR",
+    "FUNDER_OF",
+    "DATA_SOURCE"
+]
+
+
+# Roles in which people and organizations are named on a work only as written there; without an identifier they can't
+# be told apart from others of the same name, so they aren't given nodes
+contact_relationships = [
+    "AUTHOR_OF",
+    "EDITOR_OF",
+    "POINT_OF_CONTACT",
+    "METADATA_CONTACT",
+    "CONTRIBUTOR"
+]
+
+
+def _quote(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _node_key(properties):
+    return next((key for key in node_key_properties if properties.get(key) not in [None, ""]), None)
+
+
+def graph_elements(records, label=None):
+    '''
+    Flattens records from the pylinkedcmd.isaid transforms (person_from_usgs_profile, model_node_from_sb_item,
+    dataset_node_from_sdc_item and work_node_from_doi_doc) into the node and relationship rows GraphLoader writes.
+    Each record's "properties" become a node, and every related node listed alongside them (creative_works,
+    expertise, identified_*/unidentified_* contacts, relationships, linkages, including nested DOI authors and their
+    affiliations) becomes a node plus a relationship to it, with date_qualifier, reference and any qualifiers kept on
+    the relationship.
+
+    Nodes are keyed on the first identifier they carry from node_key_properties (doi, email, orcid, ScienceBase
+    identifier, url, then name). A name is only good enough for things like subjects, places and named institutions:
+    a Person with nothing but a name, or anyone listed by name alone in one of the contact_relationships (the
+    unidentified authors and contacts of a work), is left out rather than merged with every other "Smith" in the
+    graph. Relationships such as AUTHOR_OF and FUNDER_OF (see inbound_relationships) point from the related node to
+    the record; the rest point from the record out. Nodes and relationships that appear more than once are combined,
+    and anything that can't be keyed is left out. Returns a (nodes, relationships) tuple of lists.
+    :param records: iterable of transformed records
+    :param label: node label for records whose properties have no node_type, e.g. "Person" for profiles
+    '''
+    nodes = dict()
+    relationships = dict()
+
+    def add_node(node_label, properties):
+        properties = {k: v for k, v in properties.items() if v is not None and k != "node_type"}
+        key = _node_key(properties)
+        if node_label is None or key is None:
+            return
+        if key == "name" and node_label == "Person":
+            return
+        node_id = (node_label, key, properties[key])
+        if node_id in nodes:
+            nodes[node_id]["properties"].update(properties)
+        else:
+            nodes[node_id] = {"label": node_label, "key": key, "properties": properties}
+        return node_id
+
+    def add_related(record_id, related):
+        if "properties" in related:
+            fields = related["properties"]
+        else:
+            fields = related
+
+        relationship_type = next((fields[k] for k in relationship_type_keys if k in fields), None)
+        node_properties = {
+            k: v for k, v in fields.items()
+            if k not in relationship_type_keys and k not in relationship_property_keys
+        }
+        if "node_name" in node_properties:
+            node_properties["name"] = node_properties.pop("node_name")
+
+        if relationship_type in contact_relationships:
+            if _node_key({k: v for k, v in node_properties.items() if v is not None}) in [None, "name"]:
+                return
+
+        related_id = add_node(node_properties.get("node_type"), node_properties)
+        if related_id is None:
+            return
+
+        if "properties" in related:
+            add_linked(related_id, related)
+
+        if relationship_type is None:
+            return
+
+        if relationship_type in inbound_relationships:
+            start, end = related_id, record_id
+        else:
+            start, end = record_id, related_id
+
+        relationship_properties = {
+            k: fields[k] for k in relationship_property_keys if k in fields and fields[k] is not None
+        }
+        if "reference" not in relationship_properties and "url" in nodes[record_id]["properties"]:
+            relationship_properties["reference"] = nodes[record_id]["properties"]["url"]
+
+        relationship_id = (relationship_type, start, end)
+        if relationship_id in relationships:
+            relationships[relationship_id]["properties"].update(relationship_properties)
+        else:
+            relationships[relationship_id] = {
+                "type": relationship_type,
+                "start_label": start[0],
+                "start_key": start[1],
+                "start": start[2],
+                "end_label": end[0],
+                "end_key": end[1],
+                "end": end[2],
+                "properties": relationship_properties
+            }
+
+    def add_linked(record_id, record):
+        for container, related_items in record.items():
+            if container == "properties":
+                continue
+            if isinstance(related_items, dict):
+                related_items = [i for items in related_items.values() for i in items]
+            if not isinstance(related_items, list):
+                continue
+            for related in related_items:
+                add_related(record_id, related)
+
+    for record in records:
+        if record is None:
+            continue
+        record_id = add_node(record["properties"].get("node_type", label), record["properties"])
+        if record_id is not None:
+            add_linked(record_id, record)
+
+    return list(nodes.values()), list(relationships.values())
+
+
+def node_query(label, key):
+    return (
+        f"UNWIND $rows AS row\n"
+        f"MERGE (n:{_quote(label)} {{{_quote(key)}: row.key}})\n"
+        f"SET n += row.properties"
+    )
+
+
+def relationship_query(relationship_type, start_label, start_key, end_label, end_key):
+    return (
+        f"UNWIND $rows AS row\n"
+        f"MATCH (a:{_quote(start_label)} {{{_quote(start_key)}: row.start}})\n"
+        f"MATCH (b:{_quote(end_label)} {{{_quote(end_key)}: row.end}})\n"
+        f"MERGE (a)-[r:{_quote(relationship_type)}]->(b)\n"
+        f"SET r += row.properties"
+    )
+
+
+def retract_node_query(label, key):
+    return (
+        f"UNWIND $rows AS row\n"
+        f"MATCH (n:{_quote(label)} {{{_quote(key)}: row.key}})\n"
+        f"WHERE NOT EXISTS {{ (n)--() }}\n"
+        f"DELETE n"
+    )
+
+
+def retract_relationship_query(relationship_type, start_label, start_key, end_label, end_key):
+    return (
+        f"UNWIND $rows AS row\n"
+        f"MATCH (a:{_quote(start_label)} {{{_quote(start_key)}: row.start}})"
+        f"-[r:{_quote(relationship_type)}]->"
+        f"(b:{_quote(end_label)} {{{_quote(end_key)}: row.end}})\n"
+        f"WHERE (row.reference IS NULL OR r.reference = row.reference)\n"
+        f"AND (row.date_qualifier IS NULL OR r.date_qualifier = row.date_qualifier)\n"
+        f"DELETE r"
+    )
+
+
+def schema_statements(nodes, relationships=None):
+    '''
+    Returns the Cypher statements creating the index MERGE needs to find nodes quickly for every (label, key) used by
+    nodes and relationship endpoints. These are plain indexes rather than uniqueness constraints: rows of one label
+    are keyed on whichever identifier they carry first, so a key for some rows is an ordinary property on others
+    (two Person nodes merged on different emails can list the same ORCID), and a constraint would fail the whole load
+    on that property instead of just indexing it. The statements use the CREATE INDEX ... IF NOT EXISTS FOR ... ON
+    syntax, which needs Neo4j 4.1 or later.
+    '''
+    node_keys = set([(i["label"], i["key"]) for i in nodes])
+    for relationship in relationships or list():
+        node_keys.add((relationship["start_label"], relationship["start_key"]))
+        node_keys.add((relationship["end_label"], relationship["end_key"]))
+
+    statements = list()
+    for node_label, key in sorted(node_keys):
+        name = f"{node_label}_{key}".replace("`", "")
+        statements.append(
+            f"CREATE INDEX {_quote(name)} IF NOT EXISTS FOR (n:{_quote(node_label)}) ON (n.{_quote(key)})"
+        )
+
+    return statements
+
+
+def fingerprint(properties):
+    '''
+    Returns a digest of a dictionary of property values, taken over its canonical JSON (sorted keys, no whitespace),
+    so that the same values always give the same fingerprint regardless of key order.
+    '''
+    canonical = json.dumps(properties, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class KeyIndex:
+    '''
+    Set of node keys, each with the fingerprint of the node's properties, used to compare incoming records against
+    what is already in the graph. The index lives in memory by default; given a path it is kept in a SQLite file
+    instead, whose primary key index stays sorted on disk, for graphs with more keys than fit comfortably in memory.
+    Keys are also marked as seen while records are compared, so the keys that never turned up can be listed after.
+    :param path: optional SQLite file to keep the index in (replaced if it exists)
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        if path is None:
+            self._fingerprints = dict()
+            self._seen = set()
+            return
+
+        if os.path.exists(path):
+            os.remove(path)
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE node_keys (key TEXT PRIMARY KEY, fingerprint TEXT)")
+        self._db.execute("CREATE TABLE seen_keys (key TEXT PRIMARY KEY)")
+
+    def __len__(self):
+        if self.path is None:
+            return len(self._fingerprints)
+        return self._db.execute("SELECT COUNT(*) FROM node_keys").fetchone()[0]
+
+    def __contains__(self, key):
+        return self.fingerprint(key) is not None
+
+    def add(self, keys_and_fingerprints, batch_size=10000):
+        '''
+        Adds (key, fingerprint) pairs from any iterable, such as a stream of query results.
+        '''
+        if self.path is None:
+            self._fingerprints.update(keys_and_fingerprints)
+            return
+
+        pairs = ((json.dumps(key), node_fingerprint) for key, node_fingerprint in keys_and_fingerprints)
+        for batch in iter(lambda: list(itertools.islice(pairs, batch_size)), list()):
+            self._db.executemany("INSERT OR REPLACE INTO node_keys VALUES (?, ?)", batch)
+        self._db.commit()
+
+    def fingerprint(self, key):
+        if self.path is None:
+            return self._fingerprints.get(key)
+        row = self._db.execute("SELECT fingerprint FROM node_keys WHERE key = ?", (json.dumps(key),)).fetchone()
+        return None if row is None else row[0]
+
+    def mark_seen(self, key):
+        '''
+        Marks a key as seen, returning False if it had already been seen.
+        '''
+        if self.path is None:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+        return self._db.execute("INSERT OR IGNORE INTO seen_keys VALUES (?)", (json.dumps(key),)).rowcount == 1
+
+    def unseen(self):
+        '''
+        Yields the keys in the index that haven't been marked seen.
+        '''
+        if self.path is None:
+            for key in self._fingerprints:
+                if key not in self._seen:
+                    yield key
+            return
+
+        for row in self._db.execute(
+            "SELECT key FROM node_keys WHERE key NOT IN (SELECT key FROM seen_keys) ORDER BY key"
+        ):
+            yield json.loads(row[0])
+
+    def close(self):
+        if self.path is not None:
+            self._db.close()
+
+
+def graph_key_index(driver, label, key, properties=None, database=None, path=None):
+    '''
+    Streams the key, and the listed properties, of every node with a label out of the graph in one query and returns
+    them as a KeyIndex of key to fingerprint (see fingerprint; properties missing from a node count as None).
+    :param driver: neo4j driver, or any object with the same session(database=...) and session.run interface
+    :param label: node label
+    :param key: property the nodes are keyed on
+    :param properties: list of properties to fingerprint for change detection (None to compare keys only)
+    :param database: name of the database to read from
+    :param path: optional SQLite file for the index (see KeyIndex)
+    '''
+    properties = properties or list()
+    query = (
+        f"MATCH (n:{_quote(label)}) WHERE n.{_quote(key)} IS NOT NULL "
+        f"RETURN n.{_quote(key)} AS key, [{', '.join([f'n.{_quote(i)}' for i in properties])}] AS properties"
+    )
+
+    key_index = KeyIndex(path)
+    with driver.session(database=database) as session:
+        key_index.add(
+            (record["key"], fingerprint(dict(zip(properties, record["properties"]))))
+            for record in session.run(query)
+        )
+
+    return key_index
+
+
+def diff_records(key_index, records, key, properties=None, include_missing=True):
+    '''
+    Compares records against a KeyIndex in a single pass. Returns a dictionary of the records whose key isn't in the
+    index (new), those whose properties fingerprint differently (changed), a count of the rest (unchanged), records
+    with no key value (unkeyed), and unless include_missing is False the keys in the index that no record had
+    (missing). Only the first record with a given key is compared.
+    :param key_index: KeyIndex, e.g. from graph_key_index
+    :param records: iterable of dictionaries using the graph's property names
+    :param key: property the records are keyed on
+    :param properties: list of properties to compare, the same list the index was built with
+    :param include_missing: list the keys in the index that no record had
+    '''
+    properties = properties or list()
+    delta = {
+        "new": list(),
+        "changed": list(),
+        "unchanged": 0,
+        "unkeyed": list()
+    }
+
+    for record in records:
+        record_key = record.get(key)
+        if record_key is None:
+            delta["unkeyed"].append(record)
+            continue
+        if not key_index.mark_seen(record_key):
+            continue
+
+        existing = key_index.fingerprint(record_key)
+        if existing is None:
+            delta["new"].append(record)
+        elif existing != fingerprint({i: record.get(i) for i in properties}):
+            delta["changed"].append(record)
+        else:
+            delta["unchanged"] += 1
+
+    if include_missing:
+        delta["missing"] = list(key_index.unseen())
+
+    return delta
+
+
+def diff_graph(driver, label, key, records, properties=None, database=None, path=None, include_missing=True):
+    '''
+    Finds what a reload of records would change for the nodes with a label: the graph's keys are streamed once into
+    a KeyIndex (in memory, or a SQLite file at path for very large graphs) and the records compared against it in
+    one pass. See diff_records for what comes back; sending only the new and changed records to the graph is then
+    enough to bring it up to date.
+    '''
+    key_index = graph_key_index(driver, label, key, properties=properties, database=database, path=path)
+    try:
+        return diff_records(key_index, records, key, properties=properties, include_missing=include_missing)
+    finally:
+        key_index.close()
+
+
+def _node_bucket(label, key, value, buckets):
+    return zlib.crc32(repr((label, key, value)).encode("utf-8")) % buckets
+
+
+def partition_relationships(relationships, buckets):
+    '''
+    Splits relationship rows into partitions keyed on the unordered pair of buckets their two endpoint nodes hash
+    into, so that partitions with no bucket in common never touch the same node.
+    '''
+    partitions = dict()
+    for relationship in relationships:
+        start_bucket = _node_bucket(
+            relationship["start_label"], relationship["start_key"], relationship["start"], buckets
+        )
+        end_bucket = _node_bucket(relationship["end_label"], relationship["end_key"], relationship["end"], buckets)
+        pair = (min(start_bucket, end_bucket), max(start_bucket, end_bucket))
+        partitions.setdefault(pair, list()).append(relationship)
+    return partitions
+
+
+def bucket_rounds(buckets):
+    '''
+    Schedules every pair of buckets, including each bucket paired with itself, into rounds in which no bucket appears
+    twice (a round robin tournament, plus a first round of the buckets on their own). Partitions from
+    partition_relationships that share a round can be loaded at the same time without contending for node locks.
+    '''
+    rounds = [[(i, i) for i in range(buckets)]]
+
+    slots = list(range(buckets))
+    if len(slots) % 2:
+        slots.append(None)
+    for _ in range(len(slots) - 1):
+        pairs = [(slots[i], slots[-1 - i]) for i in range(len(slots) // 2)]
+        pairs = [(min(pair), max(pair)) for pair in pairs if None not in pair]
+        if pairs:
+            rounds.append(pairs)
+        slots = [slots[0], slots[-1]] + slots[1:-1]
+
+    return rounds
+
+
+def _row_properties(element):
+    # Setting a property to null with SET += removes it, which is how properties a source has dropped are cleared
+    properties = dict(element["properties"])
+    properties.update({k: None for k in element.get("removed_properties", list()) if k not in properties})
+    return properties
+
+
+def _is_transient(error):
+    code = getattr(error, "code", None) or ""
+    return code.startswith("Neo.TransientError") or type(error).__name__ in ["TransientError", "DeadlockDetectedError"]
+
+
+class GraphLoader:
+    '''
+    Writes node and relationship rows (see graph_elements) to a Neo4j graph as parameterized UNWIND $rows batches,
+    one query per node label and key or relationship type and endpoints, each batch in its own managed write
+    transaction. This replaces a LOAD CSV statement per file: nothing is written to disk and the graph server doesn't
+    need to read the local cache.
+
+    Relationships can be loaded by several sessions at once. Concurrent MERGEs that lock the same nodes deadlock, so
+    each relationship is assigned to a partition by hashing its two endpoints into buckets, and the partitions are
+    run in rounds in which no two partitions share a bucket (see bucket_rounds). Transient errors, deadlocks included,
+    are retried with a growing, jittered delay on top of whatever retrying the driver does itself; that still matters
+    when one graph node is reached through two different keys, e.g. a person's email and ORCID.
+
+    The driver is only used through driver.session(database=...), session.execute_write (or write_transaction on
+    older drivers) and tx.run(query, rows=...), so a neo4j.GraphDatabase driver or any object with the same shape,
+    such as an in-memory fake for tests, will do. Counts of nodes, relationships, batches and retries, elapsed time and
+    throughput are kept in the load_stats attribute.
+    :param driver: neo4j driver
+    :param database: name of the database to write to (None for the server default)
+    :param batch_size: number of rows sent with each UNWIND query
+    :param workers: number of sessions loading relationships in parallel
+    :param max_retries: number of times a batch that fails with a transient error is retried
+    :param retry_backoff: base number of seconds for the delay between retries
+    :param progress: optional function called with load_stats after each batch
+    '''
+    def __init__(
+        self,
+        driver,
+        database=None,
+        batch_size=1000,
+        workers=1,
+        max_retries=5,
+        retry_backoff=0.1,
+        progress=None
+    ):
+        self.driver = driver
+        self.database = database
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.progress = progress
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.load_stats = {
+            "nodes": 0,
+            "relationships": 0,
+            "retracted_nodes": 0,
+            "retracted_relationships": 0,
+            "batches": 0,
+            "retries": 0,
+            "elapsed_seconds": 0.0,
+            "rows_per_second": 0.0
+        }
+        self._started = None
+
+    def _session(self):
+        return self.driver.session(database=self.database)
+
+    def _write(self, session, query, rows):
+        execute_write = getattr(session, "execute_write", None) or session.write_transaction
+        for attempt in range(self.max_retries + 1):
+            try:
+                return execute_write(lambda tx: tx.run(query, rows=rows).consume())
+            except Exception as e:
+                if not _is_transient(e) or attempt == self.max_retries:
+                    raise
+            with self._stats_lock:
+                self.load_stats["retries"] += 1
+            time.sleep(self.retry_backoff * 2 ** attempt * (1 + random.random()))
+
+    def ensure_schema(self, nodes, relationships=None):
+        '''
+        Creates the indexes from schema_statements before a load, returning the statements run.
+        '''
+        statements = schema_statements(nodes, relationships)
+        with self._session() as session:
+            for statement in statements:
+                session.run(statement).consume()
+        return statements
+
+    def _run_batches(self, groups, row_count_key):
+        row_count_keys = ["nodes", "relationships", "retracted_nodes", "retracted_relationships"]
+        with self._session() as session:
+            for query, rows in groups.items():
+                for start in range(0, len(rows), self.batch_size):
+                    batch = rows[start:start + self.batch_size]
+                    self._write(session, query, batch)
+                    with self._stats_lock:
+                        self.load_stats[row_count_key] += len(batch)
+                        self.load_stats["batches"] += 1
+                        self.load_stats["elapsed_seconds"] = time.perf_counter() - self._started
+                        rows_written = sum([self.load_stats[i] for i in row_count_keys])
+                        self.load_stats["rows_per_second"] = rows_written / self.load_stats["elapsed_seconds"]
+                        if self.progress is not None:
+                            self.progress(self.load_stats)
+
+    def load_nodes(self, nodes):
+        '''
+        MERGEs nodes on their key and sets their properties, leaving properties not in the row alone apart from any
+        listed in the row's removed_properties (see ChangeTracker.changes), which are removed.
+        '''
+        if self._started is None:
+            self._started = time.perf_counter()
+
+        groups = dict()
+        for node in nodes:
+            query = node_query(node["label"], node["key"])
+            groups.setdefault(query, list()).append({
+                "key": node["properties"][node["key"]],
+                "properties": _row_properties(node)
+            })
+        self._run_batches(groups, "nodes")
+        return self.load_stats
+
+    def _relationship_groups(self, relationships, retract=False):
+        groups = dict()
+        for relationship in relationships:
+            endpoints = (
+                relationship["type"],
+                relationship["start_label"],
+                relationship["start_key"],
+                relationship["end_label"],
+                relationship["end_key"]
+            )
+            row = {"start": relationship["start"], "end": relationship["end"]}
+            if retract:
+                query = retract_relationship_query(*endpoints)
+                row["reference"] = relationship["properties"].get("reference")
+                row["date_qualifier"] = relationship["properties"].get("date_qualifier")
+            else:
+                query = relationship_query(*endpoints)
+                row["properties"] = _row_properties(relationship)
+            groups.setdefault(query, list()).append(row)
+        return groups
+
+    def _write_relationships(self, relationships, retract):
+        if self._started is None:
+            self._started = time.perf_counter()
+
+        row_count_key = "retracted_relationships" if retract else "relationships"
+
+        if self.workers <= 1:
+            self._run_batches(self._relationship_groups(relationships, retract), row_count_key)
+            return self.load_stats
+
+        # Twice as many buckets as workers gives rounds of about one partition per worker
+        buckets = self.workers * 2
+        partitions = partition_relationships(relationships, buckets)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for round_pairs in bucket_rounds(buckets):
+                futures = [
+                    executor.submit(
+                        self._run_batches, self._relationship_groups(partitions[pair], retract), row_count_key
+                    )
+                    for pair in round_pairs if pair in partitions
+                ]
+                for future in futures:
+                    future.result()
+
+        return self.load_stats
+
+    def load_relationships(self, relationships):
+        '''
+        MERGEs relationships between existing nodes and sets their properties, removing any listed in the row's
+        removed_properties the same way as load_nodes. Relationships whose endpoints aren't in the graph yet are
+        skipped, so nodes need to be loaded first. With more than one worker, partitions of relationships that share no
+        nodes are loaded in parallel sessions, a round at a time.
+        '''
+        return self._write_relationships(relationships, retract=False)
+
+    def retract_relationships(self, relationships):
+        '''
+        Deletes relationships, but only where the graph's copy still carries the reference and date_qualifier
+        provenance of the row, so an assertion since made again by another source or a newer load is left in place.
+        Runs in parallel partitions the same way as load_relationships.
+        '''
+        return self._write_relationships(relationships, retract=True)
+
+    def retract_nodes(self, nodes):
+        '''
+        Deletes nodes that no longer have any relationships. Nodes still linked from other records or sources stay.
+        '''
+        if self._started is None:
+            self._started = time.perf_counter()
+
+        groups = dict()
+        for node in nodes:
+            query = retract_node_query(node["label"], node["key"])
+            groups.setdefault(query, list()).append({"key": node["properties"][node["key"]]})
+        self._run_batches(groups, "retracted_nodes")
+        return self.load_stats
+
+    def load(self, nodes, relationships, ensure_schema=True):
+        '''
+        Loads nodes and then the relationships between them, after creating the schema they need, and returns
+        load_stats.
+        '''
+        self.reset_stats()
+        if ensure_schema:
+            self.ensure_schema(nodes, relationships)
+        self.load_nodes(nodes)
+        self.load_relationships(relationships)
+        return self.load_stats
+
+    def sync(self, tracker, nodes, relationships, ensure_schema=True):
+        '''
+        Brings the graph up to date with one source's current nodes and relationships, sending only what changed
+        since the last sync recorded by a ChangeTracker: inserted and updated nodes and relationships are loaded,
+        relationships that have gone from the source are retracted by their provenance, and then nodes that have gone
+        are removed if nothing links to them any more. The tracker only records the new state once every write has
+        succeeded, so a failed sync is repeated in full the next time. Returns the counts from ChangeTracker.summary.
+        '''
+        changes = tracker.changes(nodes, relationships)
+
+        self.reset_stats()
+        if ensure_schema:
+            self.ensure_schema(
+                changes["nodes"]["insert"] + changes["nodes"]["update"],
+                changes["relationships"]["insert"] + changes["relationships"]["update"]
+            )
+        self.load_nodes(changes["nodes"]["insert"] + changes["nodes"]["update"])
+        self.load_relationships(changes["relationships"]["insert"] + changes["relationships"]["update"])
+        self.retract_relationships(changes["relationships"]["delete"])
+        self.retract_nodes(changes["nodes"]["delete"])
+
+        tracker.commit(changes)
+        return tracker.summary(changes)
+
+
+def _element_id(kind, element):
+    if kind == "nodes":
+        identity = [element["label"], element["key"], element["properties"][element["key"]]]
+    else:
+        identity = [
+            element["type"],
+            element["start_label"],
+            element["start_key"],
+            element["start"],
+            element["end_label"],
+            element["end_key"],
+            element["end"]
+        ]
+    return json.dumps(identity, ensure_ascii=False, default=str)
+
+
+class ChangeTracker:
+    '''
+    Local record, kept in a SQLite file, of the nodes and relationships last written to the graph from a source
+    (e.g. "doi" or "usgs_profiles"), each with a fingerprint of its properties. Comparing a fresh set of rows from
+    graph_elements against it gives the inserts, updates and deletes since the last sync (see GraphLoader.sync), so
+    a rebuild only has to write what changed. Several sources can share one file.
+
+    Provenance recorded at fetch time rather than taken from the source is left out of fingerprints, so refetching an
+    unchanged record doesn't make it an update: the _date_cached stamp, and the date_qualifier on relationships, which
+    for profile expertise and creative works is that same stamp. A relationship whose date_qualifier is all that
+    changed keeps its earlier one, in the graph and in the tracker alike, so retracting it later still matches.
+    :param path: SQLite file the fingerprints are kept in, created if it doesn't exist
+    :param source: name of the source whose rows are tracked
+    :param ignore_properties: list of properties left out of fingerprints
+    '''
+    def __init__(self, path, source, ignore_properties=None):
+        self.path = path
+        self.source = source
+        if ignore_properties is None:
+            ignore_properties = ["_date_cached", "date_qualifier"]
+        self.ignore_properties = ignore_properties
+
+        self._db = sqlite3.connect(path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS graph_elements (
+                source TEXT,
+                kind TEXT,
+                element_id TEXT,
+                fingerprint TEXT,
+                element TEXT,
+                PRIMARY KEY (source, kind, element_id)
+            )
+        """)
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM graph_elements WHERE source = ?", (self.source,)).fetchone()[0]
+
+    def _fingerprint(self, element):
+        return fingerprint({
+            k: v for k, v in element["properties"].items() if k not in self.ignore_properties
+        })
+
+    def changes(self, nodes, relationships):
+        '''
+        Compares the source's current node and relationship rows with the last synced state, returning
+        {"nodes": {...}, "relationships": {...}}, each with lists of insert, update and delete rows and a count of
+        unchanged rows. Deleted rows come back as they were last written, and update rows list the properties the
+        source no longer has under removed_properties, so that the load clears them. Nothing is recorded until commit.
+        '''
+        changes = dict()
+        for kind, elements in [("nodes", nodes), ("relationships", relationships)]:
+            stored = dict(self._db.execute(
+                "SELECT element_id, fingerprint FROM graph_elements WHERE source = ? AND kind = ?",
+                (self.source, kind)
+            ))
+
+            def stored_element(element_id):
+                row = self._db.execute(
+                    "SELECT element FROM graph_elements WHERE source = ? AND kind = ? AND element_id = ?",
+                    (self.source, kind, element_id)
+                ).fetchone()
+                return json.loads(row[0])
+            kind_changes = {"insert": list(), "update": list(), "delete": list(), "unchanged": 0}
+
+            seen = set()
+            for element in elements:
+                element_id = _element_id(kind, element)
+                if element_id in seen:
+                    continue
+                seen.add(element_id)
+
+                stored_fingerprint = stored.get(element_id)
+                if stored_fingerprint is None:
+                    kind_changes["insert"].append(element)
+                elif stored_fingerprint != self._fingerprint(element):
+                    removed_properties = [
+                        k for k in stored_element(element_id)["properties"] if k not in element["properties"]
+                    ]
+                    if removed_properties:
+                        element = dict(element, removed_properties=removed_properties)
+                    kind_changes["update"].append(element)
+                else:
+                    kind_changes["unchanged"] += 1
+
+            for element_id in stored:
+                if element_id not in seen:
+                    kind_changes["delete"].append(stored_element(element_id))
+
+            changes[kind] = kind_changes
+
+        return changes
+
+    def commit(self, changes):
+        '''
+        Records changes from the changes method as the source's synced state.
+        '''
+        with self._db:
+            for kind, kind_changes in changes.items():
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO graph_elements VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            self.source,
+                            kind,
+                            _element_id(kind, element),
+                            self._fingerprint(element),
+                            json.dumps(
+                                {k: v for k, v in element.items() if k != "removed_properties"},
+                                ensure_ascii=False,
+                                default=str
+                            )
+                        )
+                        for element in kind_changes["insert"] + kind_changes["update"]
+                    ]
+                )
+                self._db.executemany(
+                    "DELETE FROM graph_elements WHERE source = ? AND kind = ? AND element_id = ?",
+                    [(self.source, kind, _element_id(kind, element)) for element in kind_changes["delete"]]
+                )
+
+    def summary(self, changes):
+        return {
+            kind: {
+                "insert": len(kind_changes["insert"]),
+                "update": len(kind_changes["update"]),
+                "delete": len(kind_changes["delete"]),
+                "unchanged": kind_changes["unchanged"]
+            }
+            for kind, kind_changes in changes.items()
+        }
+
+    def close(self):
+        self._db.close()
@@ -1,42 +1,84 @@
+import re
 import requests
 from datetime import datetime
 from . import utilities
 import dateutil.parser
 import validators
-from itertools import groupby
-import collections
 
 
-def filter_usgs_profiles(raw_profiles):
-    identified_profiles = [i for i in raw_profiles if i["email"] is not None or i["orcid"] is not None]
-    identified_profiles.sort(key=lambda x:x['email'])
-    most_likely_profile = dict()
-    for k,v in groupby(identified_profiles,key=lambda x:x['email']):
-        profiles = list([(i["profile"],i["content_size"]) for i in v])
-        if len(profiles) > 1:
-            most_likely_profile[k] = sorted(profiles,key=lambda x:(-x[1],x[0]))[0][0]
-
-    ignore_emails = [
-        None,
-        "ask@usgs.gov",
-        'usgs_yes@usgs.gov',
-        'astro_outreach@usgs.gov',
-        'gs-w-txpublicinfo@usgs.gov',
-        'library@usgs.gov'
-    ]
-    unique_emails = list(set([i["email"] for i in raw_profiles if i["email"] not in ignore_emails]))
-    unique_emails.sort()
+ignore_profile_emails = [
+    None,
+    "ask@usgs.gov",
+    'usgs_yes@usgs.gov',
+    'astro_outreach@usgs.gov',
+    'gs-w-txpublicinfo@usgs.gov',
+    'library@usgs.gov'
+]
+
+def filter_usgs_profiles(raw_profiles, return_report=False):
+    '''
+    Reduces a set of scraped USGS staff profiles to one profile per email address, skipping shared office addresses.
+    Where several profiles carry the same email, the one with the most content is taken as the most likely (the
+    lowest profile URL breaks ties). ORCIDs that still turn up on more than one of the remaining profiles can't be
+    attributed and are set to None. Profiles are indexed in a single pass rather than searched per email, so this
+    scales linearly with the number of profiles; results come back sorted by email.
+    :param raw_profiles: list of profile dictionaries from UsgsWeb.scrape_profile or crawl_staff
+    :param return_report: also return a report of the profiles collapsed into each kept profile and the ORCIDs
+    that were dropped
+    '''
+    first_by_email = dict()
+    first_identified_by_url = dict()
+    email_profiles = dict()
+    for profile in raw_profiles:
+        email = profile["email"]
+        if email is not None and email not in first_by_email:
+            first_by_email[email] = profile
+
+        if email is None and profile["orcid"] is None:
+            continue
+
+        # Mirrors the email ordering of the identified profiles: the first profile with a URL is the one with the
+        # lowest email, or the earliest one among equal emails
+        current = first_identified_by_url.get(profile["profile"])
+        if current is None or (email is not None and (current["email"] is None or email < current["email"])):
+            first_identified_by_url[profile["profile"]] = profile
+
+        if email is not None:
+            email_profiles.setdefault(email, list()).append(profile)
+
+    unique_emails = sorted(i for i in first_by_email if i not in ignore_profile_emails)
+
+    report = {
+        "collapsed": list(),
+        "orcids_removed": dict()
+    }
 
     unique_identified_profiles = list()
     for email in unique_emails:
-        if email in most_likely_profile.keys():
-            unique_identified_profiles.append(next(i for i in identified_profiles if i["profile"] == most_likely_profile[email]))
+        if len(email_profiles[email]) > 1:
+            most_likely_profile = min(email_profiles[email], key=lambda x: (-x["content_size"], x["profile"]))["profile"]
+            unique_identified_profiles.append(first_identified_by_url[most_likely_profile])
+            report["collapsed"].append({
+                "email": email,
+                "kept": most_likely_profile,
+                "dropped": [i["profile"] for i in email_profiles[email] if i["profile"] != most_likely_profile]
+            })
         else:
-            unique_identified_profiles.append(next(i for i in raw_profiles if i["email"] == email))
+            unique_identified_profiles.append(first_by_email[email])
 
-    duplicate_orcids = [item for item, count in collections.Counter([i["orcid"] for i in unique_identified_profiles if i["orcid"] is not None]).items() if count > 1]
-    for profile in [i for i in unique_identified_profiles if i["orcid"] in duplicate_orcids]:
-        profile.update({"orcid": None})
+    orcid_profiles = dict()
+    for profile in unique_identified_profiles:
+        if profile["orcid"] is not None:
+            orcid_profiles.setdefault(profile["orcid"], list()).append(profile)
+
+    for orcid, profiles in orcid_profiles.items():
+        if len(profiles) > 1:
+            report["orcids_removed"][orcid] = [i["profile"] for i in profiles]
+            for profile in profiles:
+                profile.update({"orcid": None})
+
+    if return_report:
+        return unique_identified_profiles, report
 
     return unique_identified_profiles
 
@@ -269,6 +311,46 @@ def package_source_scientific_models():
     return model_items
 
 
+iso_date_prefix = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value]
+
+def parse_iso_dates(values, parsed=None):
+    '''
+    Parses a batch of date strings to ISO 8601 strings, returning None for any that can't be parsed, including values
+    that aren't strings at all (e.g. a list where a source repeats a field). Strings that already look like ISO dates
+    take a fast path through datetime.fromisoformat, everything else goes through dateutil, and each distinct string
+    is only parsed once.
+    :param values: list of date strings
+    :param parsed: optional dictionary of already parsed strings, shared across batches
+    '''
+    if parsed is None:
+        parsed = dict()
+
+    results = list()
+    for value in values:
+        if not isinstance(value, str):
+            results.append(None)
+            continue
+        if value not in parsed:
+            parsed[value] = None
+            if iso_date_prefix.match(value):
+                try:
+                    parsed[value] = datetime.fromisoformat(value).isoformat()
+                except ValueError:
+                    pass
+            if parsed[value] is None:
+                try:
+                    parsed[value] = str(dateutil.parser.parse(value).isoformat())
+                except Exception:
+                    pass
+        results.append(parsed[value])
+
+    return results
+
 def dataset_node_from_sdc_item(item):
     contact_type_mapping = {
         "Organizational": "Organization",
@@ -297,9 +379,8 @@ def dataset_node_from_sdc_item(item):
     }
 
     if "modified" in item:
-        try:
-            date_qualifier = str(dateutil.parser.parse(item["modified"]).isoformat())
-        except:
+        date_qualifier = parse_iso_dates([item["modified"]])[0]
+        if date_qualifier is None:
             date_qualifier = str(datetime.utcnow().isoformat())
     elif "@timestamp" in item:
         date_qualifier = item["@timestamp"]
@@ -352,9 +433,7 @@ def dataset_node_from_sdc_item(item):
             })
 
     if "placeKeyword" in item:
-        if not isinstance(item["placeKeyword"], list):
-            item["placeKeyword"] = [item["placeKeyword"]]
-        for place in item["placeKeyword"]:
+        for place in _as_list(item["placeKeyword"]):
             dataset["relationships"]["places"].append({
                 "name": place,
                 "node_type": "Place",
@@ -364,9 +443,7 @@ def dataset_node_from_sdc_item(item):
             })
 
     if "usgsThesaurusKeyword" in item:
-        if not isinstance(item["usgsThesaurusKeyword"], list):
-            item["usgsThesaurusKeyword"] = [item["usgsThesaurusKeyword"]]
-        for term in item["usgsThesaurusKeyword"]:
+        for term in _as_list(item["usgsThesaurusKeyword"]):
             dataset["relationships"]["defined_terms"].append({
                 "name": term,
                 "node_type": "DefinedSubjectMatter",
@@ -377,9 +454,7 @@ def dataset_node_from_sdc_item(item):
             })
 
     if "isoTopicKeyword" in item:
-        if not isinstance(item["isoTopicKeyword"], list):
-            item["isoTopicKeyword"] = [item["isoTopicKeyword"]]
-        for term in item["isoTopicKeyword"]:
+        for term in _as_list(item["isoTopicKeyword"]):
             dataset["relationships"]["defined_terms"].append({
                 "name": term,
                 "node_type": "DefinedSubjectMatter",
@@ -390,9 +465,7 @@ def dataset_node_from_sdc_item(item):
             })
 
     if "otherKeyword" in item:
-        if not isinstance(item["otherKeyword"], list):
-            item["otherKeyword"] = [item["otherKeyword"]]
-        for term in item["otherKeyword"]:
+        for term in _as_list(item["otherKeyword"]):
             dataset["relationships"]["undefined_terms"].append({
                 "name": term,
                 "node_type": "UndefinedSubjectMatter",
@@ -404,6 +477,110 @@ def dataset_node_from_sdc_item(item):
 
     return dataset
 
+sdc_table_columns = {
+    "datasets": ["url", "name", "description", "issued_year", "last_updated"],
+    "points_of_contact": ["reference", "date_qualifier", "name", "email", "identified"],
+    "authors": ["reference", "date_qualifier", "name", "node_type", "orcid", "identified"],
+    "organizations": ["reference", "date_qualifier", "name"],
+    "places": ["reference", "date_qualifier", "name"],
+    "defined_terms": ["reference", "date_qualifier", "name", "category"],
+    "undefined_terms": ["reference", "date_qualifier", "name", "category"]
+}
+
+def sdc_graph_tables(items):
+    '''
+    Batch form of dataset_node_from_sdc_item that turns a list or iterator of Science Data Catalog items straight into
+    columnar tables, one per node and relationship type, instead of a nested dictionary per item. Each table is a
+    dictionary of column name to list of values (see sdc_table_columns), ready for pandas.DataFrame or a CSV writer.
+    Relationship tables carry the dataset URL as reference along with the date_qualifier; points of contact and
+    authors are flagged identified when they have a valid email or an ORCID. Dates go through parse_iso_dates and
+    contact emails are validated once per distinct address. Items are not modified.
+    '''
+    contact_type_mapping = {
+        "Organizational": "Organization",
+        "Personal": "Person",
+        "USGSPersonal": "Person"
+    }
+
+    tables = {table: {column: list() for column in columns} for table, columns in sdc_table_columns.items()}
+    datasets = tables["datasets"]
+    parsed_dates = dict()
+    valid_emails = dict()
+    batch_time = str(datetime.utcnow().isoformat())
+
+    def add_edges(table, reference, date_qualifier, names, **columns):
+        table["reference"].extend([reference] * len(names))
+        table["date_qualifier"].extend([date_qualifier] * len(names))
+        table["name"].extend(names)
+        for column, value in columns.items():
+            table[column].extend([value] * len(names))
+
+    for item in items:
+        url = f"https://data.usgs.gov/datacatalog/data/{item['identifier']}"
+
+        if "modified" in item:
+            date_qualifier = parse_iso_dates([item["modified"]], parsed_dates)[0] or batch_time
+        elif "@timestamp" in item:
+            date_qualifier = item["@timestamp"]
+        else:
+            date_qualifier = batch_time
+
+        datasets["url"].append(url)
+        datasets["name"].append(item["title"])
+        datasets["description"].append(item["description"].strip())
+        datasets["issued_year"].append(item.get("issued", ""))
+        datasets["last_updated"].append(date_qualifier)
+
+        if "contactPoint" in item and "hasEmail" in item["contactPoint"] and item["contactPoint"]["hasEmail"] is not None:
+            email_string = item["contactPoint"]["hasEmail"].split(" ")[-1].strip().lower()
+            if email_string not in valid_emails:
+                valid_emails[email_string] = bool(validators.email(email_string))
+            poc = tables["points_of_contact"]
+            poc["reference"].append(url)
+            poc["date_qualifier"].append(date_qualifier)
+            poc["name"].append(item["contactPoint"]["fn"])
+            poc["email"].append(email_string if valid_emails[email_string] else None)
+            poc["identified"].append(valid_emails[email_string])
+
+        if "authors" in item:
+            authors = tables["authors"]
+            for author in [a for a in item["authors"] if isinstance(a, dict) and "nametype" in a]:
+                authors["reference"].append(url)
+                authors["date_qualifier"].append(date_qualifier)
+                authors["name"].append(author["authorname"])
+                authors["node_type"].append(contact_type_mapping[author["nametype"]])
+                authors["orcid"].append(author["orcid"] if author["orcid"] else None)
+                authors["identified"].append(bool(author["orcid"]))
+
+        if "datasource" in item:
+            add_edges(
+                tables["organizations"], url, date_qualifier,
+                [i["displayname"] for i in item["datasource"] if "displayname" in i]
+            )
+
+        if "placeKeyword" in item:
+            add_edges(tables["places"], url, date_qualifier, _as_list(item["placeKeyword"]))
+
+        if "usgsThesaurusKeyword" in item:
+            add_edges(
+                tables["defined_terms"], url, date_qualifier, _as_list(item["usgsThesaurusKeyword"]),
+                category="USGS Thesaurus"
+            )
+
+        if "isoTopicKeyword" in item:
+            add_edges(
+                tables["defined_terms"], url, date_qualifier, _as_list(item["isoTopicKeyword"]),
+                category="ISO Topic Keyword for Geospatial Metadata"
+            )
+
+        if "otherKeyword" in item:
+            add_edges(
+                tables["undefined_terms"], url, date_qualifier, _as_list(item["otherKeyword"]),
+                category="dataset descriptive keywords"
+            )
+
+    return tables
+
 def work_node_from_doi_doc(doi_doc):
     if "title" not in doi_doc or doi_doc["title"] is None or len(doi_doc["title"]) == 0:
         return
@@ -442,7 +619,7 @@ def work_node_from_doi_doc(doi_doc):
         "linkages": list()
     }
 
-    date_qualifier = doi_node["issued_year"]
+    date_qualifier = doi_node["properties"]["issued_year"]
 
     if "type" not in doi_doc or doi_doc["type"] is None or doi_doc["type"] not in list(doi_type_mapping.keys()):
         doi_node["properties"]["node_type"] = "Document"
@@ -1,43 +1,70 @@
-import requests
-from datetime import datetime
 from . import utilities
+from .client import default_client, date_cached
 
+orcid_headers = {"accept": "application/ld+json"}
 
-def lookup_orcid(orcid, return_errors=False):
+
+def _orcid_error(orcid, error, return_errors):
+    if return_errors:
+        return {"orcid": orcid, "error": error}
+
+
+def _orcid_from_response(orcid, r, return_errors):
+    try:
+        if r.status_code != 200:
+            return _orcid_error(orcid, f"HTTP Status Code: {str(r.status_code)}", return_errors)
+        raw_doc = r.json()
+    except Exception as e:
+        return _orcid_error(orcid, e, return_errors)
+
+    if "givenName" not in raw_doc or "familyName" not in raw_doc:
+        return _orcid_error(
+            orcid,
+            "Either givenName or familyName are missing from the ORCID record, and therefore it is unusable at this time.",
+            return_errors
+        )
+
+    raw_doc["_date_cached"] = date_cached(r)
+    raw_doc["orcid"] = raw_doc["@id"].split("/")[-1]
+
+    return raw_doc
+
+
+def lookup_orcid(orcid, return_errors=False, client=None):
     '''
-    This function handles the process of fetching a given ORCID using content negotiation to return the 
+    This function handles the process of fetching a given ORCID using content negotiation to return the
     JSON-LD structure from ORCID data. It checks for a number of error conditions and will either pass
     on those cases or return the errors for further consideration in a processing pipeline.
     '''
     identifiers = utilities.actionable_id(orcid)
     if identifiers is None:
-        if return_errors:
-            return {"orcid": orcid, "error": "Not a valid ORCID identifier"}
-        else:
-            return
-    
+        return _orcid_error(orcid, "Not a valid ORCID identifier", return_errors)
+
+    if client is None:
+        client = default_client()
+
     try:
-        r = requests.get(identifiers["url"], headers={"accept": "application/ld+json"})
-        if r.status_code != 200:
-            if return_errors:
-                return {"orcid": orcid, "error": f"HTTP Status Code: {str(r.status_code)}"}
-            else:
-                return
-        else:
-            raw_doc = r.json()
+        r = client.get(identifiers["url"], headers=orcid_headers)
     except Exception as e:
-        if return_errors:
-            return {"orcid": orcid, "error": e}
-        else:
-            return
+        return _orcid_error(orcid, e, return_errors)
 
-    if "givenName" not in raw_doc or "familyName" not in raw_doc:
-        if return_errors:
-            return {"orcid": orcid, "error": "Either givenName or familyName are missing from the ORCID record, and therefore it is unusable at this time."}
-        else:
-            return
+    return _orcid_from_response(orcid, r, return_errors)
 
-    raw_doc["_date_cached"] = str(datetime.utcnow().isoformat())
-    raw_doc["orcid"] = raw_doc["@id"].split("/")[-1]
 
-    return raw_doc
+async def lookup_orcid_async(orcid, return_errors=False, client=None):
+    '''
+    Coroutine form of lookup_orcid that fetches through the shared client without blocking the event loop.
+    '''
+    identifiers = utilities.actionable_id(orcid)
+    if identifiers is None:
+        return _orcid_error(orcid, "Not a valid ORCID identifier", return_errors)
+
+    if client is None:
+        client = default_client()
+
+    try:
+        r = await client.aget(identifiers["url"], headers=orcid_headers)
+    except Exception as e:
+        return _orcid_error(orcid, e, return_errors)
+
+    return _orcid_from_response(orcid, r, return_errors)
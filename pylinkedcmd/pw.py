@@ -1,10 +1,18 @@
-import requests
-from datetime import datetime
+import asyncio
+import gzip
+import json
 import math
+import os
+import time
+import warnings
+from datetime import datetime
+from functools import partial
+from . import utilities
+from .client import default_client, date_cached
 
 publication_api = "https://pubs.er.usgs.gov/pubs-services/publication"
 
-def pw_records(q=None, author_id=None, mod_x_days=None, publication_year=None, page_size=1000):
+def pw_query_url(q=None, author_id=None, mod_x_days=None, publication_year=None, page_size=1000):
     query_url = f"{publication_api}/?page_size={page_size}"
     if q is not None:
         query_url = f"{query_url}&q={q}"
@@ -15,11 +23,12 @@ def pw_records(q=None, author_id=None, mod_x_days=None, publication_year=None, p
     if publication_year is not None:
         query_url = f"{query_url}&startYear={str(publication_year)}&endYear={str(publication_year)}"
 
-    r = requests.get(query_url)
+    return query_url
 
+def _pw_page(page_url, r):
     if r.status_code != 200:
         return {
-            "query_url": query_url,
+            "query_url": page_url,
             "error": f"HTTP error: {r.headers}"
         }
 
@@ -27,25 +36,269 @@ def pw_records(q=None, author_id=None, mod_x_days=None, publication_year=None, p
 
     if "recordCount" not in response_data.keys():
         return {
-            "query_url": query_url,
+            "query_url": page_url,
             "error": "No results in response"
         }
 
+    for record in response_data["records"]:
+        record.update({"_date_cached": date_cached(r)})
+
+    return response_data
+
+def _fetch_pw_page(page_url, client, retries):
+    for attempt in range(retries + 1):
+        try:
+            response_data = _pw_page(page_url, client.get(page_url))
+        except Exception as e:
+            response_data = {"query_url": page_url, "error": e}
+        if "error" not in response_data or response_data["error"] == "No results in response":
+            return response_data
+        time.sleep(attempt + 1)
+
+    return response_data
+
+async def _fetch_pw_page_async(page_url, client, retries):
+    for attempt in range(retries + 1):
+        try:
+            response_data = _pw_page(page_url, await client.aget(page_url))
+        except Exception as e:
+            response_data = {"query_url": page_url, "error": e}
+        if "error" not in response_data or response_data["error"] == "No results in response":
+            return response_data
+        await asyncio.sleep(attempt + 1)
+
+    return response_data
+
+def _pw_page_urls(query_url, record_count, page_size):
+    if record_count <= page_size:
+        return list()
+
+    last_page_number = math.ceil(record_count / page_size) + 1
+    return [f"{query_url}&page_number={page_num}" for page_num in range(1, last_page_number)]
+
+def _report_failed_page(page_data, return_errors):
+    if return_errors:
+        return [page_data]
+
+    warnings.warn(f"Pubs Warehouse page failed after retries and was skipped: {page_data['query_url']} ({page_data['error']})")
+    return list()
+
+def iter_pw_records(
+    q=None, 
+    author_id=None, 
+    mod_x_days=None, 
+    publication_year=None, 
+    page_size=1000, 
+    max_workers=4, 
+    retries=2, 
+    return_errors=False, 
+    client=None):
+    '''
+    Generator form of pw_records that yields publication records page by page as they arrive, without holding the
+    whole result set in memory. The first page is fetched to learn the record count and the rest are fetched
+    concurrently by max_workers threads, so pages (and the records on them) come back in completion order. Pages that
+    still fail after the given number of retries are yielded as {"query_url": ..., "error": ...} dictionaries when
+    return_errors is True and raised as warnings otherwise. If the first page fails, its error dictionary is the only
+    thing yielded.
+    '''
+    query_url = pw_query_url(q, author_id, mod_x_days, publication_year, page_size)
+
+    if client is None:
+        client = default_client()
+
+    response_data = _fetch_pw_page(query_url, client, retries)
+    if "error" in response_data:
+        yield response_data
+        return
+
+    for record in response_data["records"]:
+        yield record
+
+    page_urls = _pw_page_urls(query_url, response_data["recordCount"], page_size)
+    fetch_page = partial(_fetch_pw_page, client=client, retries=retries)
+
+    for page_url, page_data in utilities.concurrent_map(fetch_page, page_urls, max_workers=max_workers):
+        if "error" in page_data:
+            for failed_page in _report_failed_page(page_data, return_errors):
+                yield failed_page
+            continue
+        for record in page_data["records"]:
+            yield record
+
+def pw_records(
+    q=None, 
+    author_id=None, 
+    mod_x_days=None, 
+    publication_year=None, 
+    page_size=1000, 
+    max_workers=4, 
+    retries=2, 
+    return_errors=False, 
+    client=None):
+    '''
+    Runs a query against the Pubs Warehouse publication API and returns the full list of records in page order.
+    Pages after the first are fetched concurrently by max_workers threads and retried on failure; see iter_pw_records
+    for how pages that still fail are reported. If the first page fails, its error dictionary is returned instead of
+    a list.
+    '''
+    query_url = pw_query_url(q, author_id, mod_x_days, publication_year, page_size)
+
+    if client is None:
+        client = default_client()
+
+    response_data = _fetch_pw_page(query_url, client, retries)
+    if "error" in response_data:
+        return response_data
+
     records = response_data["records"]
-    
-    if response_data["recordCount"] > page_size:
-        last_page_number = math.ceil(response_data["recordCount"] / page_size) + 1
-        for page_num in range(1, last_page_number):
-            r = requests.get(f"{query_url}&page_number={page_num}")
-            if r.status_code != 200:
-                break
-            response_data = r.json()
-            if response_data["records"]:
-                records.extend(response_data["records"])
-
-    for record in records:
-        record.update({"_date_cached": str(datetime.utcnow().isoformat())})
+
+    page_urls = _pw_page_urls(query_url, response_data["recordCount"], page_size)
+    fetch_page = partial(_fetch_pw_page, client=client, retries=retries)
+
+    pages = dict(utilities.concurrent_map(fetch_page, page_urls, max_workers=max_workers))
+    for page_url in page_urls:
+        if "error" in pages[page_url]:
+            records.extend(_report_failed_page(pages[page_url], return_errors))
+        elif pages[page_url]["records"]:
+            records.extend(pages[page_url]["records"])
 
     return records
 
+async def pw_records_async(
+    q=None, 
+    author_id=None, 
+    mod_x_days=None, 
+    publication_year=None, 
+    page_size=1000, 
+    retries=2, 
+    return_errors=False, 
+    client=None):
+    '''
+    Coroutine form of pw_records. After the first page establishes the record count, the remaining pages are requested
+    together, with the shared client bounding how many are in flight against the Pubs Warehouse at once.
+    '''
+    query_url = pw_query_url(q, author_id, mod_x_days, publication_year, page_size)
+
+    if client is None:
+        client = default_client()
+
+    response_data = await _fetch_pw_page_async(query_url, client, retries)
+    if "error" in response_data:
+        return response_data
+
+    records = response_data["records"]
+
+    pages = await asyncio.gather(*[
+        _fetch_pw_page_async(page_url, client, retries) for page_url
+        in _pw_page_urls(query_url, response_data["recordCount"], page_size)
+    ])
+    for page_data in pages:
+        if "error" in page_data:
+            records.extend(_report_failed_page(page_data, return_errors))
+        elif page_data["records"]:
+            records.extend(page_data["records"])
+
+    return records
+
+class PwSnapshot:
+    '''
+    Local snapshot of a Pubs Warehouse query, kept as a gzipped JSON file of records keyed by publication id together
+    with a high-water mark (the start time of the last complete sync). Each call to sync only requests records modified
+    since the high-water mark, using the API's mod_x_days filter with a day of margin, and merges them into the
+    snapshot in place, so a nightly refresh pulls a small delta instead of the full corpus. The first sync against a
+    new snapshot file is a full pull.
+    :param path: location of the snapshot file, loaded if it already exists
+    :param q: optional query string, as in pw_records; fixed for the life of the snapshot
+    :param author_id: optional contributor id, as in pw_records; fixed for the life of the snapshot
+    :param publication_year: optional publication year, as in pw_records; fixed for the life of the snapshot
+    '''
+    def __init__(self, path, q=None, author_id=None, publication_year=None):
+        self.path = path
+        self.query = {"q": q, "author_id": author_id, "publication_year": publication_year}
+        self.high_water_mark = None
+        self.records = dict()
+
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot["query"] != self.query:
+                raise ValueError(f"Snapshot at {path} was built for a different query: {snapshot['query']}")
+            self.high_water_mark = snapshot["high_water_mark"]
+            self.records = snapshot["records"]
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump({
+                "query": self.query,
+                "high_water_mark": self.high_water_mark,
+                "records": self.records
+            }, f)
+        os.replace(temp_path, self.path)
+
+    def mod_x_days(self, now=None):
+        if self.high_water_mark is None:
+            return None
+
+        if now is None:
+            now = datetime.utcnow()
+
+        elapsed = now - datetime.fromisoformat(self.high_water_mark)
+        return math.ceil(elapsed.total_seconds() / 86400) + 1
+
+    def sync(self, page_size=1000, max_workers=4, client=None, save=True):
+        '''
+        Fetches records modified since the high-water mark and merges them into the snapshot, overwriting older
+        versions of the same publication. Returns a report with the mod_x_days window used, counts of added, changed
+        and unchanged records (ignoring the _date_cached stamp when comparing), and any pages that failed. The
+        high-water mark only moves forward when every page came back, so a partial sync is picked up again next run.
+        '''
+        sync_started = datetime.utcnow()
+        mod_x_days = self.mod_x_days(sync_started)
+
+        report = {
+            "mod_x_days": mod_x_days,
+            "added": 0,
+            "changed": 0,
+            "unchanged": 0,
+            "failed_pages": list()
+        }
+
+        # Page 1 of the paged requests repeats the first response, so records already counted this sync are skipped
+        synced_ids = set()
+        for record in iter_pw_records(
+            mod_x_days=mod_x_days,
+            page_size=page_size,
+            max_workers=max_workers,
+            return_errors=True,
+            client=client,
+            **self.query
+        ):
+            if "error" in record:
+                report["failed_pages"].append(record)
+                continue
+
+            pub_id = str(record["id"])
+            if pub_id in synced_ids:
+                continue
+            synced_ids.add(pub_id)
+
+            existing = self.records.get(pub_id)
+            if existing is None:
+                report["added"] += 1
+            elif _without_stamp(existing) == _without_stamp(record):
+                report["unchanged"] += 1
+            else:
+                report["changed"] += 1
+            self.records[pub_id] = record
+
+        if not report["failed_pages"]:
+            self.high_water_mark = sync_started.isoformat()
+
+        if save:
+            self.save()
+
+        return report
 
+def _without_stamp(record):
+    return {k: v for k, v in record.items() if k != "_date_cached"}
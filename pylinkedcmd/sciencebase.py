@@ -1,5 +1,5 @@
 from sciencebasepy import SbSession
-import requests
+import asyncio
 import validators
 from datetime import datetime
 import dateutil
@@ -7,11 +7,15 @@ from copy import copy
 import unidecode
 from getpass import getpass
 import re
+from .client import default_client
 
 
 class Directory:
-    def __init__(self, authenticated=False):
+    def __init__(self, authenticated=False, client=None):
         self.authenticated = authenticated
+        if client is None:
+            client = default_client()
+        self.client = client
         self.sb_root_url = "https://www.sciencebase.gov/directory/people?format=json"
         self.sb_org_search_url = "https://www.sciencebase.gov/directory/organizations?format=json"
         self.sb_org_root = "https://www.sciencebase.gov/directory/organization/"
@@ -22,14 +26,7 @@ class Directory:
         if authenticated:
             self.sb.login(input("User Name: "), getpass("Password: "))
 
-    def lookup_person(
-        self, 
-        criteria, 
-        unique=True, 
-        verifier_operator=None, 
-        verifier_criteria=None, 
-        attempt_last_name=True
-    ):
+    def _person_query(self, criteria, unique, verifier_operator, verifier_criteria):
         if validators.email(criteria):
             q_operator = "email"
         elif re.search(self.orcid_pattern, criteria):
@@ -43,14 +40,53 @@ class Directory:
 
         if verifier_operator is not None:
             unique = False
-        
-        query_url = f"{self.sb_root_url}&{q_operator}={criteria}"
+
+        return f"{self.sb_root_url}&{q_operator}={criteria}", criteria, unique, verifier_operator, verifier_criteria
+
+    def _person_from_results(self, sb_results, unique, verifier_operator, verifier_criteria):
+        if unique and len(sb_results["people"]) == 1:
+            return sb_results["people"][0]
+
+        if not unique and verifier_operator is not None and verifier_criteria is not None:
+            return next((i for i in sb_results["people"] if verifier_operator in i and i[verifier_operator] == verifier_criteria), None)
+
+        if unique and len(sb_results["people"]) > 1:
+            list_active = [i for i in sb_results["people"] if i["active"]]
+            if len(list_active) == 1:
+                return list_active[0]
+
+        if not unique and len(sb_results["people"]) > 1:
+            return sb_results["people"]
+
+        return None
+
+    def _get_json(self, query_url):
+        if self.authenticated:
+            return self.sb._session.get(query_url).json()
+        else:
+            return self.client.get(query_url).json()
+
+    async def _get_json_async(self, query_url):
+        if self.authenticated:
+            return await asyncio.get_running_loop().run_in_executor(None, self._get_json, query_url)
+        else:
+            r = await self.client.aget(query_url)
+            return r.json()
+
+    def lookup_person(
+        self, 
+        criteria, 
+        unique=True, 
+        verifier_operator=None, 
+        verifier_criteria=None, 
+        attempt_last_name=True
+    ):
+        query_url, criteria, unique, verifier_operator, verifier_criteria = self._person_query(
+            criteria, unique, verifier_operator, verifier_criteria
+        )
 
         try:
-            if self.authenticated:
-                sb_results = self.sb._session.get(query_url).json()
-            else:
-                sb_results = requests.get(query_url).json()
+            sb_results = self._get_json(query_url)
         except:
             return None
 
@@ -58,34 +94,50 @@ class Directory:
             name_criteria = criteria.split()[-1]
             query_url = f"{self.sb_root_url}&lastName={name_criteria}"
             try:
-                if self.authenticated:
-                    sb_results = self.sb._session.get(query_url).json()
-                else:
-                    sb_results = requests.get(query_url).json()
+                sb_results = self._get_json(query_url)
             except:
                 return None
         elif len(sb_results["people"]) == 0 and not attempt_last_name:
             return None
 
-        if unique and len(sb_results["people"]) == 1:
-            return sb_results["people"][0]
+        return self._person_from_results(sb_results, unique, verifier_operator, verifier_criteria)
 
-        if not unique and verifier_operator is not None and verifier_criteria is not None:
-            return next((i for i in sb_results["people"] if verifier_operator in i and i[verifier_operator] == verifier_criteria), None)
+    async def lookup_person_async(
+        self, 
+        criteria, 
+        unique=True, 
+        verifier_operator=None, 
+        verifier_criteria=None, 
+        attempt_last_name=True
+    ):
+        '''
+        Coroutine form of lookup_person. Unauthenticated lookups go through the shared pylinkedcmd client; authenticated
+        ones still use the ScienceBase session, run on a worker thread so the event loop is not blocked.
+        '''
+        query_url, criteria, unique, verifier_operator, verifier_criteria = self._person_query(
+            criteria, unique, verifier_operator, verifier_criteria
+        )
 
-        if unique and len(sb_results["people"]) > 1:
-            list_active = [i for i in sb_results["people"] if i["active"]]
-            if len(list_active) == 1:
-                return list_active[0]
+        try:
+            sb_results = await self._get_json_async(query_url)
+        except:
+            return None
 
-        if not unique and len(sb_results["people"]) > 1:
-            return sb_results["people"]
+        if len(sb_results["people"]) == 0 and attempt_last_name:
+            name_criteria = criteria.split()[-1]
+            query_url = f"{self.sb_root_url}&lastName={name_criteria}"
+            try:
+                sb_results = await self._get_json_async(query_url)
+            except:
+                return None
+        elif len(sb_results["people"]) == 0 and not attempt_last_name:
+            return None
 
-        return None
+        return self._person_from_results(sb_results, unique, verifier_operator, verifier_criteria)
 
     def person_query_urls(self, limit=1000):
         query_url = f"{self.sb_root_url}&max=1"
-        r_starter_query = requests.get(query_url).json()
+        r_starter_query = self.client.get(query_url).json()
         total_records = int(r_starter_query["total"])
         limit_for_offset = int(limit)
         upper_range = int((total_records / limit_for_offset) + 1)
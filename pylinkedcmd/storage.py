@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import warnings
+import zlib
+
+
+class JsonlStore:
+    '''
+    Record store kept as gzip compressed, line delimited JSON, used in place of pickled lists for the raw caches built
+    from each source. Records are appended as they are fetched instead of being held until the end, and read back one
+    at a time, optionally projected down to a few fields, so downstream steps run in bounded memory. Nothing is
+    unpickled, so a cache file can't run code when it's loaded.
+
+    Each append is written as its own gzip member and records are committed in batches, so a run that dies part way
+    leaves every batch before the failure readable. If the file ends part way through a batch, reading it returns
+    every complete record up to the break, including any from the unfinished batch, and skips the incomplete remainder
+    with a warning; the file is cut back to those records before the next append. values can be used to work out
+    which records still need fetching when a run is resumed.
+    :param path: location of the store file, usually ending in .jsonl.gz
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._checked = False
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _lines(self):
+        if not self.exists():
+            return
+
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if not line.endswith("\n"):
+                        raise EOFError("Record store ends in a partial line")
+                    yield line
+            except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+                warnings.warn(f"Ignoring the incomplete end of a truncated batch in {self.path}: {e}")
+
+    def iter_records(self, fields=None, where=None):
+        '''
+        Yields the stored records in the order they were written.
+        :param fields: optional list of field names to project each record down to (missing fields come back as None)
+        :param where: optional function taking a record and returning True for the records to yield
+        '''
+        for line in self._lines():
+            record = json.loads(line)
+            if where is not None and not where(record):
+                continue
+            if fields is not None:
+                record = {field: record.get(field) for field in fields}
+            yield record
+
+    def values(self, field):
+        '''
+        Yields the value of one field from every stored record that has it, e.g. the identifiers already fetched.
+        '''
+        for record in self.iter_records():
+            if field in record:
+                yield record[field]
+
+    def count(self):
+        return sum(1 for _ in self._lines())
+
+    def _recover(self):
+        # Rewrite the store with only the complete records before a truncation, so that new batches aren't appended
+        # after the broken gzip member where readers would never reach them.
+        if self._checked or not self.exists():
+            self._checked = True
+            return
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            record_count = self.count()
+
+        if caught:
+            temp_path = f"{self.path}.tmp"
+            with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+                for line in self._lines():
+                    f.write(line)
+            os.replace(temp_path, self.path)
+            warnings.warn(f"Cut the incomplete end of a truncated batch from {self.path}; {record_count} records kept")
+
+        self._checked = True
+
+    def append(self, records, batch_size=1000):
+        '''
+        Appends records (any iterable, including a generator that is still fetching) to the store, committing them in
+        batches of batch_size. Returns the number of records written.
+        '''
+        self._recover()
+
+        written = 0
+        batch = list()
+        for record in records:
+            batch.append(json.dumps(record, default=str))
+            if len(batch) >= batch_size:
+                written += self._write_batch(batch)
+                batch = list()
+
+        if batch:
+            written += self._write_batch(batch)
+
+        return written
+
+    def _write_batch(self, lines):
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return len(lines)
+
+    def write(self, records, batch_size=1000):
+        '''
+        Replaces the store's contents with records. The new file only takes the place of the old one once every record
+        has been written.
+        '''
+        temp_store = JsonlStore(f"{self.path}.tmp")
+        if temp_store.exists():
+            os.remove(temp_store.path)
+        temp_store._checked = True
+
+        written = temp_store.append(records, batch_size=batch_size)
+        if not temp_store.exists():
+            gzip.open(temp_store.path, "wt", encoding="utf-8").close()
+        os.replace(temp_store.path, self.path)
+        self._checked = True
+
+        return written
@@ -0,0 +1,260 @@
+import collections
+import itertools
+import multiprocessing
+import time
+
+
+def _is_word_char(character):
+    return character.isalnum() or character == "_"
+
+
+class VocabularyTagger:
+    '''
+    Finds every label from a reference vocabulary (e.g. build_wd_reference output) in a text in a single pass, using
+    an Aho-Corasick automaton built once over all of the labels. Labels are matched literally, so labels containing
+    regex metacharacters need no escaping. With word_boundaries, a match is rejected where a word character (letter,
+    digit or underscore) at either end of it runs on into a word character in the text, so "Ohio" isn't found in
+    "Ohioan". For labels that start and end with word characters that is the same as \\b around the label in a regex,
+    but labels that start or end with punctuation, like "C++" or ".NET", are also found where \\b would reject them,
+    as in "C++ code" or "the .NET runtime". Where matches overlap the leftmost one wins, with the longest label taken
+    among matches starting at the same position. Spans come back spaCy style as (start, end, concept_label) tuples.
+
+    When a label appears under more than one concept in the vocabulary, the first occurrence in vocabulary order
+    supplies its concept_label; every occurrence is still available from references.
+    :param wd_reference: list of concept dictionaries with label and concept_label keys
+    :param reference_sources: optional list of sources to restrict the vocabulary to
+    :param ignore_case: match labels without regard to case
+    :param word_boundaries: reject matches that run on into a word character at either end
+    '''
+    def __init__(self, wd_reference, reference_sources=None, ignore_case=False, word_boundaries=True):
+        self.ignore_case = ignore_case
+        self.word_boundaries = word_boundaries
+        self.labels = list()
+        self.concept_labels = list()
+        self.references = list()
+
+        # Transitions live in one dictionary keyed on state and character code rather than a dictionary per state,
+        # which keeps the automaton for a vocabulary of hundreds of thousands of labels to a manageable size.
+        self._goto = dict()
+        self._fail = [0]
+        self._output = [-1]
+        self._output_link = [0]
+        children = [list()]
+
+        label_index = dict()
+        for item in wd_reference:
+            if reference_sources is not None and item["source"] not in reference_sources:
+                continue
+            if not item["label"] or not item["label"].strip():
+                continue
+
+            key = self._normalize(item["label"])
+            if key in label_index:
+                self.references[label_index[key]].append(item)
+                continue
+
+            label_index[key] = len(self.labels)
+            self.labels.append(item["label"])
+            self.concept_labels.append(item["concept_label"])
+            self.references.append([item])
+
+            state = 0
+            for character in key:
+                transition = state << 21 | ord(character)
+                next_state = self._goto.get(transition)
+                if next_state is None:
+                    next_state = len(self._fail)
+                    self._goto[transition] = next_state
+                    self._fail.append(0)
+                    self._output.append(-1)
+                    self._output_link.append(0)
+                    children.append(list())
+                    children[state].append((ord(character), next_state))
+                state = next_state
+            self._output[state] = label_index[key]
+
+        queue = [child for _, child in children[0]]
+        for state in queue:
+            for code, child in children[state]:
+                fallback = self._fail[state]
+                while fallback and (fallback << 21 | code) not in self._goto:
+                    fallback = self._fail[fallback]
+                fail_state = self._goto.get(fallback << 21 | code, 0)
+                self._fail[child] = fail_state
+                self._output_link[child] = fail_state if self._output[fail_state] >= 0 else self._output_link[fail_state]
+                queue.append(child)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _normalize(self, text):
+        if not self.ignore_case:
+            return text
+        # Lower case character by character so that offsets into the normalized text stay valid for the original
+        return "".join([c if len(c.lower()) != 1 else c.lower() for c in text])
+
+    def matches(self, text):
+        '''
+        Returns every (start, end, label index) occurrence of a vocabulary label in text, overlapping or not, and
+        before word boundaries are checked.
+        '''
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        output_link = self._output_link
+        labels = self.labels
+
+        found = list()
+        state = 0
+        for position, character in enumerate(self._normalize(text)):
+            code = ord(character)
+            while True:
+                next_state = goto.get(state << 21 | code)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+
+            match_state = state if output[state] >= 0 else output_link[state]
+            while match_state:
+                index = output[match_state]
+                found.append((position + 1 - len(labels[index]), position + 1, index))
+                match_state = output_link[match_state]
+
+        return found
+
+    def _on_boundaries(self, text, start, end):
+        if start > 0 and _is_word_char(text[start]) and _is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and _is_word_char(text[end - 1]) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def tag_matches(self, text):
+        '''
+        Resolves the raw matches in text to non-overlapping (start, end, label index) tuples in text order, keeping
+        the leftmost and then longest match.
+        '''
+        candidates = self.matches(text)
+        if self.word_boundaries:
+            candidates = [i for i in candidates if self._on_boundaries(text, i[0], i[1])]
+        candidates.sort(key=lambda i: (i[0], -i[1]))
+
+        resolved = list()
+        last_end = 0
+        for start, end, index in candidates:
+            if start >= last_end:
+                resolved.append((start, end, index))
+                last_end = end
+
+        return resolved
+
+    def tag(self, text):
+        '''
+        Returns the (start, end, concept_label) spans of vocabulary labels found in text.
+        '''
+        return [(start, end, self.concept_labels[index]) for start, end, index in self.tag_matches(text)]
+
+    def tag_texts(self, texts):
+        '''
+        Batch form of tag: yields the list of spans for each text in texts, in order. Texts can be any iterable,
+        including a generator over a file too large to hold in memory.
+        '''
+        for text in texts:
+            yield self.tag(text)
+
+    def ner_training_data(self, texts):
+        '''
+        Yields spaCy NER training records, [text, {"entities": [[start, end, concept_label], ...]}], for the texts in
+        which at least one vocabulary label was found.
+        '''
+        for text in texts:
+            spans = self.tag(text)
+            if spans:
+                yield [text, {"entities": [list(span) for span in spans]}]
+
+    def annotate(self, records, text_key="description", processes=None, chunk_size=200, progress=None):
+        '''
+        Tags a stream of records on a pool of worker processes and yields each record back, in input order, as a new
+        dictionary with an "entities" list of (start, end, concept_label) spans for its text_key value. Records can
+        also be plain strings, which come back as {"text": ..., "entities": ...}.
+
+        Workers get the tagger once rather than with every task: where processes are forked they inherit it from the
+        parent, and elsewhere it is handed to each worker when the pool starts. Only the texts of each chunk of
+        chunk_size records travel to the workers, and only a bounded number of chunks is in flight at a time, so
+        records can come from a generator over a corpus larger than memory.
+
+        Counts of records, chunks and spans, elapsed time and throughput are kept in the annotate_stats attribute as
+        the run goes.
+        :param records: iterable of record dictionaries or strings
+        :param text_key: key of the text to tag in record dictionaries
+        :param processes: number of worker processes (defaults to the number of CPUs)
+        :param chunk_size: number of records handed to a worker at a time
+        :param progress: optional function called with annotate_stats after each chunk completes
+        '''
+        global _worker_tagger
+
+        self.annotate_stats = {
+            "records": 0,
+            "chunks": 0,
+            "spans": 0,
+            "elapsed_seconds": 0.0,
+            "records_per_second": 0.0
+        }
+        started = time.perf_counter()
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            _worker_tagger = self
+            pool_args = dict()
+        else:
+            context = multiprocessing.get_context()
+            pool_args = {"initializer": _init_worker_tagger, "initargs": (self,)}
+
+        def annotated(chunk, chunk_spans):
+            for record, spans in zip(chunk, chunk_spans):
+                if isinstance(record, str):
+                    yield {"text": record, "entities": spans}
+                else:
+                    yield dict(record, entities=spans)
+
+            self.annotate_stats["records"] += len(chunk)
+            self.annotate_stats["chunks"] += 1
+            self.annotate_stats["spans"] += sum(len(i) for i in chunk_spans)
+            self.annotate_stats["elapsed_seconds"] = time.perf_counter() - started
+            self.annotate_stats["records_per_second"] = self.annotate_stats["records"] / self.annotate_stats["elapsed_seconds"]
+            if progress is not None:
+                progress(self.annotate_stats)
+
+        records = iter(records)
+        try:
+            with context.Pool(processes, **pool_args) as pool:
+                pending = collections.deque()
+                for chunk in iter(lambda: list(itertools.islice(records, chunk_size)), list()):
+                    texts = [i if isinstance(i, str) else i.get(text_key) for i in chunk]
+                    pending.append((chunk, pool.apply_async(_tag_chunk, (texts,))))
+                    if len(pending) >= processes * 2:
+                        chunk, result = pending.popleft()
+                        yield from annotated(chunk, result.get())
+                while pending:
+                    chunk, result = pending.popleft()
+                    yield from annotated(chunk, result.get())
+        finally:
+            _worker_tagger = None
+
+
+_worker_tagger = None
+
+
+def _init_worker_tagger(tagger):
+    global _worker_tagger
+    _worker_tagger = tagger
+
+
+def _tag_chunk(texts):
+    return [_worker_tagger.tag(text) if isinstance(text, str) else list() for text in texts]
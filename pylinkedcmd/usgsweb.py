@@ -1,16 +1,42 @@
-import requests
 from datetime import datetime
 import validators
 import re
 import sys
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, UnicodeDammit
 from copy import copy
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from . import utilities
+from .client import Client, default_client, date_cached
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+html_parsers = ["html.parser", "lxml", "lxml-xpath"]
+regex_ns = {"re": "http://exslt.org/regular-expressions"}
 
 
 class UsgsWeb:
-    def __init__(self):
+    '''
+    Scrapers for staff profiles and science center information on the USGS web site.
+    :param client: optional pylinkedcmd.client.Client to fetch pages with instead of the shared client
+    :param parser: HTML parsing backend. "html.parser" (the default) builds BeautifulSoup trees with the pure Python
+    parser; "lxml" builds the same BeautifulSoup trees with the much faster lxml parser; "lxml-xpath" skips
+    BeautifulSoup for profile and staff listing pages and pulls only the needed fields out of an lxml tree with XPath,
+    producing the same dictionaries. Both lxml options require the lxml package.
+    '''
+    def __init__(self, client=None, parser="html.parser"):
+        if parser not in html_parsers:
+            raise ValueError(f"parser must be one of {html_parsers}")
+        if parser != "html.parser" and lxml is None:
+            raise ImportError(f"The {parser} parser requires the lxml package")
+        if client is None:
+            client = default_client()
+        self.client = client
+        self.parser = parser
+        self.soup_parser = "html.parser" if parser == "html.parser" else "lxml"
         self.usgs_pro_page_listing = "https://www.usgs.gov/connect/staff-profiles"
         self.usgs_science_center_listing = "https://www.usgs.gov/usgs-science-centers"
         self.expertise_link_pattern = re.compile(r"^\/science-explorer-results\?*")
@@ -29,7 +55,7 @@ class UsgsWeb:
             'library@usgs.gov'
         ]
 
-    def get_staff_inventory_pages(self, link=None, title_="Go to last page"):
+    def get_staff_inventory_pages(self, link=None, title_="Go to last page", client=None):
         '''
         Unfortunately, the only way to get the entire staff inventory as presented on the USGS web that I've found is to
         iterate over every page in the closed web system and scrape listings. To figure out what pages are contained in
@@ -37,15 +63,18 @@ class UsgsWeb:
         a particular link. This function handles that process and gives us back every URL we need to hit.
         :param title_: title of the link pointing to the last page of the inventory
         :type title_: str
+        :param client: optional pylinkedcmd.client.Client to fetch the first page with instead of the scraper's own
         :return: list of URLs to every page comprising the entire inventory of USGS staff
         '''
         if link is None:
             link = self.usgs_pro_page_listing
+        if client is None:
+            client = self.client
 
-        r = requests.get(link)
+        r = client.get(link)
         if r.status_code != 200:
             return None
-        soup = BeautifulSoup(r.content, 'html.parser')
+        soup = BeautifulSoup(r.content, self.soup_parser)
 
         last_page_link = soup.findAll("a", title=title_)
         if len(last_page_link) == 0:
@@ -73,15 +102,30 @@ class UsgsWeb:
         :return: list of dictionaries containing name, email, and profile from the process_staff_section function for
         each person record found in the specified sections
         '''
-        r = requests.get(page_url)
+        r = self.client.get(page_url)
         if r.status_code != 200:
             return None
-        soup = BeautifulSoup(r.content, 'html.parser')
+
+        return self.parse_staff_listing(r.content, date_cached(r), tag_=tag_, class_=class_)
+
+    def parse_staff_listing(self, content, date_retrieved, tag_="div", class_="views-column"):
+        '''
+        Extracts the staff listing records from the already fetched content of a staff listing page. This is the
+        parsing half of get_staff_listing, split out so that pages can be fetched and parsed in different places.
+        :param content: HTML content of a staff listing page
+        :param date_retrieved: timestamp for the _date_cached value on each record
+        :return: list of staff listing dictionaries as returned by get_staff_listing
+        '''
+        if self.parser == "lxml-xpath":
+            return self._parse_staff_listing_xpath(content, date_retrieved, tag_, class_)
+
+        soup = BeautifulSoup(content, self.soup_parser)
 
         page_staff_listing = list()
 
         for section in soup.findAll(tag_, class_=class_):
             staff_listing = self.process_staff_section(section)
+            staff_listing["_date_cached"] = date_retrieved
             if "profile" in staff_listing.keys() and staff_listing["profile"] is not None:
                 staff_listing["profile_id"] = hashlib.md5(staff_listing['profile'].encode('utf-8')).hexdigest()
                 page_staff_listing.append(staff_listing)
@@ -142,7 +186,7 @@ class UsgsWeb:
 
         return person_record
 
-    def scrape_profile(self, page_url):
+    def scrape_profile(self, page_url, previous_profile=None):
         '''
         Unfortunately, there is no current programmatic way of getting at USGS staff profile pages, where at least some
         staff have put significant effort into rounding out their available online information. For some, these pages
@@ -152,20 +196,39 @@ class UsgsWeb:
         for further analysis, pulls out links from the body (which can be compared with other sources), and shoves the
         body text as a whole into the data for further processing.
         :param page_url: URL to the profile page that can be used as a unique key
+        :param previous_profile: optional profile dictionary from an earlier scrape of the same page; if the page
+        content hashes to the same content_hash, that record is returned as is and the page is not parsed again
         :return: dictionary containing the url, list of expertise keywords (if available), list of links (text and
         href) values in dictionaries, and the full body html as a string
         '''
-        r = requests.get(page_url)
+        r = self.client.get(page_url)
         if r.status_code != 200:
             return {"url": page_url, "error": f"Status-code: {r.status_code}"}
 
-        soup = BeautifulSoup(r.content, 'html.parser')
+        if _unchanged(previous_profile, r.content):
+            return previous_profile
+
+        return self.parse_profile(page_url, r.content, date_cached(r))
+
+    def parse_profile(self, page_url, content, date_retrieved):
+        '''
+        Builds the profile dictionary returned by scrape_profile from the already fetched content of a profile page.
+        :param page_url: URL the content was fetched from
+        :param content: HTML content of the profile page
+        :param date_retrieved: timestamp for the _date_cached value
+        :return: profile dictionary as returned by scrape_profile
+        '''
+        if self.parser == "lxml-xpath":
+            return self._parse_profile_xpath(page_url, content, date_retrieved)
+
+        soup = BeautifulSoup(content, self.soup_parser)
 
         profile_page_data = {
             "profile_id": hashlib.md5(page_url.encode('utf-8')).hexdigest(),
             "profile": page_url,
-            "_date_cached": datetime.utcnow().isoformat(),
-            "content_size": sys.getsizeof(r.content),
+            "_date_cached": date_retrieved,
+            "content_size": sys.getsizeof(content),
+            "content_hash": content_hash(content),
             "display_name": None,
             "title": None,
             "description": None,
@@ -258,10 +321,255 @@ class UsgsWeb:
 
         return profile_page_data
 
+    def _parse_staff_listing_xpath(self, content, date_retrieved, tag_, class_):
+        tree = _lxml_tree(content)
+
+        page_staff_listing = list()
+
+        for section in tree.xpath(f".//{tag_}[{_class_predicate(class_)}]"):
+            profile_page_link = _first(section.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.profile_link_pattern.pattern))
+            email_link = _first(section.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.mailto_link_pattern.pattern))
+            tel_link = _first(section.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.tel_link_pattern.pattern))
+            org_link = _first(section.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.org_link_pattern.pattern))
+
+            staff_listing = {
+                "_date_cached": date_retrieved,
+                "name": None,
+                "title": None,
+                "organization_name": None,
+                "organization_link": None,
+                "email": None,
+                "profile": None,
+                "telephone": None
+            }
+
+            if profile_page_link is not None:
+                staff_listing["name"] = profile_page_link.text_content().replace("\t", "").strip()
+                staff_listing["profile"] = f'{self.usgs_web_root}{profile_page_link.attrib["href"]}'
+            else:
+                name_container = _first(section.xpath(f".//h4[{_class_predicate('field-content')}]"))
+                if name_container is not None:
+                    staff_listing["name"] = name_container.text_content().replace("\t", "").strip()
+
+            if org_link is not None:
+                staff_listing["organization_name"] = org_link.text_content().replace("\t", "").strip()
+                staff_listing["organization_link"] = org_link.attrib["href"].strip()
+
+            if email_link is not None:
+                staff_listing["email"] = email_link.text_content().replace("\t", "").strip().lower()
+
+            if tel_link is not None:
+                staff_listing["telephone"] = tel_link.text_content().replace("\t", "").strip()
+
+            bolded_item = _first(section.xpath(".//b"))
+            if bolded_item is not None:
+                staff_listing["title"] = bolded_item.text_content().replace("\t", "").strip()
+
+            if staff_listing["profile"] is not None:
+                staff_listing["profile_id"] = hashlib.md5(staff_listing['profile'].encode('utf-8')).hexdigest()
+                page_staff_listing.append(staff_listing)
+
+        return page_staff_listing
+
+    def _parse_profile_xpath(self, page_url, content, date_retrieved):
+        tree = _lxml_tree(content)
+
+        profile_page_data = {
+            "profile_id": hashlib.md5(page_url.encode('utf-8')).hexdigest(),
+            "profile": page_url,
+            "_date_cached": date_retrieved,
+            "content_size": sys.getsizeof(content),
+            "content_hash": content_hash(content),
+            "display_name": None,
+            "title": None,
+            "description": None,
+            "profile_image_url": None,
+            "organization_name": None,
+            "organization_link": None,
+            "email": None,
+            "orcid": None,
+            "body_content_links": list(),
+            "expertise": list()
+        }
+
+        title_section = _first(tree.xpath(f".//h2[{_class_predicate('staff-profile-title')}]"))
+        if title_section is not None:
+            title_text = title_section.text_content().strip()
+            if title_text:
+                profile_page_data["title"] = title_text
+
+        profile_lead = _first(tree.xpath(f".//div[{_class_predicate('lead')}]"))
+        if profile_lead is not None:
+            description_text = profile_lead.text_content().strip()
+            if description_text:
+                profile_page_data["description"] = description_text
+
+        expertise_section = _first(tree.xpath(f".//section[{_class_predicate('staff-expertise')}]"))
+        if expertise_section is not None:
+            profile_page_data["expertise"] = [
+                t.text_content().strip() for t in
+                expertise_section.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.expertise_link_pattern.pattern)
+            ]
+
+        # The soup path decomposes the body section before reading its links, so nothing from the body is kept and
+        # later lookups don't see inside it; dropping the element reproduces that exactly.
+        profile_body_content = _first(tree.xpath(f".//div[{_class_predicate('usgs-body')}]"))
+        if profile_body_content is not None:
+            profile_page_data["scraped_body_html"] = None
+            profile_body_content.drop_tree()
+
+        display_name_container = _first(tree.xpath(f".//div[{_class_predicate('full-width col-sm-12')}]"))
+        if display_name_container is not None:
+            display_name_container_inner = _first(display_name_container.xpath(f".//h1[{_class_predicate('page-header')}]"))
+            if display_name_container_inner is not None:
+                profile_page_data["display_name"] = display_name_container_inner.text_content()
+
+        email_container = _first(tree.xpath(f".//div[{_class_predicate('email')}]"))
+        if email_container is not None:
+            email_link = _first(email_container.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.mailto_link_pattern.pattern))
+            if email_link is not None:
+                email_string = email_link.text_content().lower().strip()
+                if validators.email(email_string):
+                    profile_page_data["email"] = email_string
+                else:
+                    profile_page_data["email"] = None
+
+        organization_container = _first(tree.xpath(f".//h3[{_class_predicate('staff-profile-subtitle h4')}]"))
+        if organization_container is not None:
+            organization_link_container = _first(organization_container.xpath(".//a"))
+            if organization_link_container is not None:
+                profile_page_data["organization_link"] = organization_link_container.attrib["href"].strip()
+                profile_page_data["organization_name"] = organization_link_container.text_content().strip()
+
+        profile_image = _first(tree.xpath(f".//img[{_class_predicate('staff-profile-image')}]"))
+        if profile_image is not None:
+            profile_page_data["profile_image_url"] = profile_image.attrib["src"]
+
+        orcid_link = _first(tree.xpath(".//a[re:test(@href, $p)]", namespaces=regex_ns, p=self.orcid_link_pattern.pattern))
+        if orcid_link is not None:
+            check_id = utilities.actionable_id(orcid_link.text_content())
+            if check_id is not None and "orcid" in check_id:
+                profile_page_data["orcid"] = check_id["orcid"]
+
+        other_pubs_container = _first(tree.xpath(
+            f".//div[{_class_predicate('entity entity-field-collection-item field-collection-item-field-non-usgs-publication clearfix')}]"
+        ))
+        if other_pubs_container is not None:
+            profile_page_data["body_content_links"].extend([
+                {
+                    "link_text": l.text_content(),
+                    "link_href": l.attrib["href"]
+                } for l in other_pubs_container.xpath(".//a")
+            ])
+
+        return profile_page_data
+
+    def crawl_staff(
+        self, 
+        max_workers=8, 
+        rate=None, 
+        processes=None, 
+        return_errors=False, 
+        progress=None, 
+        previous_profiles=None
+    ):
+        '''
+        Crawls the full USGS staff inventory in one pipeline: every staff listing page is fetched, the profile pages
+        linked from the listings are fetched as soon as their listing comes back, and profile dictionaries (the same as
+        scrape_profile returns) are yielded as they complete. Fetching runs on max_workers threads over a pooled
+        session, while all HTML parsing runs in a pool of worker processes so that it is not serialized on the GIL.
+        Counts of listing pages, profiles and errors are kept in the crawl_stats attribute as the crawl runs.
+        :param max_workers: number of concurrent page fetches in each stage of the crawl
+        :param rate: optional requests per second to hold the crawl to against www.usgs.gov
+        :param processes: number of parsing processes (defaults to the number of CPUs)
+        :param return_errors: yield {"url": ..., "error": ...} dictionaries for pages that could not be fetched
+        :param progress: optional function called with crawl_stats after each profile completes
+        :param previous_profiles: optional profile dictionaries from an earlier crawl; pages whose content still
+        hashes to the stored content_hash are not parsed again and their earlier record is yielded instead, with
+        crawl_stats counting profiles as new, changed or unchanged
+        '''
+        client = self.client
+        if rate is not None:
+            client = Client(pool_maxsize=max_workers, per_host_rate=rate, cache=self.client.cache)
+
+        try:
+            self.crawl_stats = {
+                "listing_pages": 0,
+                "listing_errors": 0,
+                "profiles": 0,
+                "profile_errors": 0,
+                "profiles_new": 0,
+                "profiles_changed": 0,
+                "profiles_unchanged": 0
+            }
+
+            previous = dict()
+            if previous_profiles is not None:
+                previous = {i["profile"]: i for i in previous_profiles if "profile" in i}
+
+            worker_settings = {k: v for k, v in self.__dict__.items() if k not in ["client", "crawl_stats"]}
+
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=_init_worker_scraper,
+                initargs=(worker_settings,)
+            ) as parse_pool:
+                def fetch_and_parse(page_url, parse_function, *parse_args, previous_record=None):
+                    try:
+                        r = client.get(page_url)
+                    except Exception as e:
+                        return {"url": page_url, "error": e}
+                    if r.status_code != 200:
+                        return {"url": page_url, "error": f"Status-code: {r.status_code}"}
+                    if _unchanged(previous_record, r.content):
+                        return previous_record
+                    return parse_pool.submit(parse_function, *parse_args, r.content, date_cached(r)).result()
+
+                def fetch_listing(page_url):
+                    return fetch_and_parse(page_url, _parse_staff_listing)
+
+                def fetch_profile(page_url):
+                    return fetch_and_parse(page_url, _parse_profile, page_url, previous_record=previous.get(page_url))
+
+                def profile_urls():
+                    seen = set()
+                    listing_urls = self.get_staff_inventory_pages(client=client) or list()
+                    for page_url, listing in utilities.concurrent_map(fetch_listing, listing_urls, max_workers=max_workers):
+                        if isinstance(listing, dict):
+                            self.crawl_stats["listing_errors"] += 1
+                            continue
+                        self.crawl_stats["listing_pages"] += 1
+                        for staff_listing in listing:
+                            if staff_listing["profile"] not in seen:
+                                seen.add(staff_listing["profile"])
+                                yield staff_listing["profile"]
+
+                for page_url, profile in utilities.concurrent_map(fetch_profile, profile_urls(), max_workers=max_workers):
+                    if "error" in profile:
+                        self.crawl_stats["profile_errors"] += 1
+                    else:
+                        self.crawl_stats["profiles"] += 1
+                        if page_url not in previous:
+                            self.crawl_stats["profiles_new"] += 1
+                        elif profile is previous[page_url]:
+                            self.crawl_stats["profiles_unchanged"] += 1
+                        else:
+                            self.crawl_stats["profiles_changed"] += 1
+
+                    if progress is not None:
+                        progress(self.crawl_stats)
+
+                    if "error" not in profile or return_errors:
+                        yield profile
+        finally:
+            # A client made for this crawl's rate is closed with it; the scraper's own client is left open
+            if client is not self.client:
+                client.close()
+
     def science_center_inventory(self):
-        r_sc_listing = requests.get(self.usgs_science_center_listing)
+        r_sc_listing = self.client.get(self.usgs_science_center_listing)
 
-        soup_sc_listing = BeautifulSoup(r_sc_listing.text, 'html.parser')
+        soup_sc_listing = BeautifulSoup(r_sc_listing.text, self.soup_parser)
 
         table_sc_listing = soup_sc_listing.find('table')
 
@@ -299,17 +607,17 @@ class UsgsWeb:
                         science_center_record["state_or_territory"] = [i.strip() for i in col.text.split(",")]
 
                 employee_directory_url = f'{science_center_record["url"]}/employee-directory'
-                r_employee_directory = requests.get(employee_directory_url)
+                r_employee_directory = self.client.get(employee_directory_url)
                 if r_employee_directory.status_code == 200:
                     science_center_record["url_employee_directory"] = employee_directory_url
 
                 science_center_locations_url = f'{science_center_record["url"]}/locations'
-                r_center_locations = requests.get(science_center_locations_url)
+                r_center_locations = self.client.get(science_center_locations_url)
                 if r_center_locations.status_code == 200:
                     science_center_record["url_locations"] = science_center_locations_url
 
                 science_center_science_url = f'{science_center_record["url"]}/science'
-                r_center_science_page = requests.get(science_center_science_url)
+                r_center_science_page = self.client.get(science_center_science_url)
                 if r_center_science_page.status_code == 200:
                     science_center_record["url_science"] = science_center_science_url
 
@@ -328,8 +636,8 @@ class UsgsWeb:
 
         employee_listing = list()
         for url in directory_urls:
-            r = requests.get(url)
-            soup = BeautifulSoup(r.text, 'html.parser')
+            r = self.client.get(url)
+            soup = BeautifulSoup(r.text, self.soup_parser)
             table = soup.findAll("table")[0]
             tbody = table.findAll("tbody")[0]
 
@@ -369,12 +677,12 @@ class UsgsWeb:
         if "url_locations" not in sc_inventory_record:
             return
 
-        r = requests.get(sc_inventory_record["url_locations"])
+        r = self.client.get(sc_inventory_record["url_locations"])
 
         if r.status_code != 200:
             return
 
-        soup = BeautifulSoup(r.text, 'html.parser')
+        soup = BeautifulSoup(r.text, self.soup_parser)
 
         locations = list()
         for loc in soup.findAll("div", {"class": "col-sm-7"}):
@@ -425,12 +733,12 @@ class UsgsWeb:
         if "url_science" not in sc_inventory_record:
             return
 
-        r = requests.get(sc_inventory_record["url_science"])
+        r = self.client.get(sc_inventory_record["url_science"])
 
         if r.status_code != 200:
             return
 
-        soup = BeautifulSoup(r.text, 'html.parser')
+        soup = BeautifulSoup(r.text, self.soup_parser)
 
         subjects_addressed = list()
         subject = {
@@ -466,4 +774,52 @@ class UsgsWeb:
         if not subjects_addressed:
             return
 
-        return subjects_addressed
\ No newline at end of file
+        return subjects_addressed
+
+
+def content_hash(content):
+    return hashlib.md5(content).hexdigest()
+
+
+def _unchanged(previous_record, content):
+    return (
+        previous_record is not None
+        and "content_hash" in previous_record
+        and previous_record["content_hash"] == content_hash(content)
+    )
+
+
+def _lxml_tree(content):
+    return lxml.html.document_fromstring(UnicodeDammit(content, is_html=True).unicode_markup)
+
+
+def _first(elements):
+    if elements:
+        return elements[0]
+
+
+def _class_predicate(class_):
+    '''
+    XPath predicate matching BeautifulSoup's class_ semantics: a single class name matches any element carrying that
+    class, while a string with spaces has to match the whole class attribute.
+    '''
+    if " " in class_:
+        return f"@class='{class_}'"
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_} ')"
+
+
+_worker_scraper = None
+
+
+def _init_worker_scraper(settings):
+    global _worker_scraper
+    _worker_scraper = UsgsWeb(client=Client(pool_maxsize=1))
+    _worker_scraper.__dict__.update(settings)
+
+
+def _parse_staff_listing(content, date_retrieved):
+    return _worker_scraper.parse_staff_listing(content, date_retrieved)
+
+
+def _parse_profile(page_url, content, date_retrieved):
+    return _worker_scraper.parse_profile(page_url, content, date_retrieved)
@@ -1,58 +1,207 @@
+import codecs
 import re
 import validators
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def actionable_id(identifier_string, return_resolver=True):
-    if validators.url(identifier_string) and "/staff-profiles/" in identifier_string.lower():
+identifier_patterns = [
+    ("doi", re.compile(r"10.\d{4,9}\/[\S]+$"), "https://doi.org/"),
+    ("orcid", re.compile(r"\d{4}-\d{4}-\d{4}-\w{4}"), "https://orcid.org/")
+]
+
+def _actionable_id(identifier_string, return_resolver, prechecks):
+    # The prechecks are conditions each validator or pattern needs to have any chance of matching (a URL to a staff
+    # profile contains /staff-profiles/, an email a single @, a DOI "10" and an ORCID a hyphen), so the validators
+    # and regexes only run on strings that might pass them.
+    if (not prechecks or "/staff-profiles/" in identifier_string.lower()) \
+        and validators.url(identifier_string) and "/staff-profiles/" in identifier_string.lower():
         return {
             "url": identifier_string,
             "profile": identifier_string.split("?")[0]
         }
 
-    if validators.email(identifier_string):
+    if (not prechecks or identifier_string.count("@") == 1) and validators.email(identifier_string):
         return {
             "email": identifier_string
         }
 
-    identifiers = {
-        "doi": {
-            "pattern": r"10.\d{4,9}\/[\S]+$",
-            "resolver": "https://doi.org/"
-        },
-        "orcid": {
-            "pattern": r"\d{4}-\d{4}-\d{4}-\w{4}",
-            "resolver": "https://orcid.org/"
-        }
-    }
-    for k,v in identifiers.items():
-        search = re.search(v["pattern"], identifier_string)
+    for k, pattern, resolver in identifier_patterns:
+        if prechecks and ("10" if k == "doi" else "-") not in identifier_string:
+            continue
+        search = pattern.search(identifier_string)
         if search:
             d_identifier = {
                 k: search.group()
             }
-            if return_resolver and v["resolver"] is not None:
-                d_identifier["url"] = f"{v['resolver']}{search.group().upper()}"
+            if return_resolver and resolver is not None:
+                d_identifier["url"] = f"{resolver}{search.group().upper()}"
 
             return d_identifier
 
     return 
 
+@lru_cache(maxsize=65536)
+def _memoized_actionable_id(identifier_string, return_resolver):
+    return _actionable_id(identifier_string, return_resolver, prechecks=True)
+
+def actionable_id(identifier_string, return_resolver=True):
+    '''
+    Classifies an identifier string as a USGS staff profile URL, an email address, a DOI or an ORCID and returns a
+    dictionary with the identifier (and a resolvable URL for DOIs and ORCIDs when return_resolver is True), or None
+    if it is none of those. Results for strings are memoized, so repeated identifiers across a pipeline are only
+    classified once; each call gets its own copy of the dictionary.
+    '''
+    if not isinstance(identifier_string, str):
+        return _actionable_id(identifier_string, return_resolver, prechecks=False)
+
+    identifiers = _memoized_actionable_id(identifier_string, return_resolver)
+    if identifiers is None:
+        return
+
+    return dict(identifiers)
+
+def actionable_ids(identifier_strings, return_resolver=True):
+    '''
+    Batch form of actionable_id: returns the classification of every string in identifier_strings, in order, with
+    each distinct string classified only once.
+    '''
+    classified = dict()
+    results = list()
+    for identifier_string in identifier_strings:
+        if not isinstance(identifier_string, str):
+            results.append(actionable_id(identifier_string, return_resolver))
+            continue
+        if identifier_string not in classified:
+            classified[identifier_string] = _memoized_actionable_id(identifier_string, return_resolver)
+        identifiers = classified[identifier_string]
+        results.append(None if identifiers is None else dict(identifiers))
+
+    return results
+
 def chunks(dict_list, chunk_size=1000):
     for i in range(0, len(dict_list), chunk_size):
         yield dict_list[i:i+chunk_size]
 
+def concurrent_map(func, items, max_workers=8, executor=None):
+    '''
+    Runs func over items on a pool of worker threads and yields (item, result) tuples as each call completes. Only a
+    small window of calls is in flight at any time, so items can be a long-running generator without every item being
+    submitted up front. Results come back in completion order, not the order of items.
+    '''
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    in_flight = dict()
+    try:
+        for item in items:
+            in_flight[executor.submit(func, item)] = item
+            if len(in_flight) >= max_workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future.result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+doi_pattern = re.compile(r'(10[.][0-9]{4,}[^\s"/<>]*/[^\s"<>]+)')
+doi_terminators = re.compile(r'[\s"<>]')
+doi_link_parts = [
+    "/abstract",
+    "/full",
+    "/summary"
+]
+
+def normalize_doi(doi_string):
+    '''
+    Cleans up a DOI pulled out of text: trailing punctuation from the surrounding sentence and publisher landing page
+    suffixes like /abstract or /full are removed.
+    '''
+    stripped = None
+    while stripped != doi_string:
+        stripped = doi_string
+        doi_string = doi_string.rstrip(".,;")
+        for part in doi_link_parts:
+            if doi_string.lower().endswith(part):
+                doi_string = doi_string[:-len(part)]
+
+    return doi_string
+
+def _text_chunks(source, chunk_size):
+    if isinstance(source, str):
+        for position in range(0, len(source), chunk_size):
+            yield source[position:position + chunk_size]
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in iter(lambda: source.read(chunk_size), source.read(0)):
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    final = decoder.decode(b"", final=True)
+    if final:
+        yield final
+
+def iter_dois(source, chunk_size=65536, overlap=1024, normalize=True, dedupe=True):
+    '''
+    Generator over the DOIs found in a string or a file-like object (text or binary, read chunk_size characters at a
+    time), so that large inputs like PDF text dumps are scanned in constant memory. DOIs can't contain whitespace,
+    quotes or angle brackets, so each chunk is scanned up to its last such character and the unfinished run of text
+    after it is carried over into the next chunk. Within a run longer than overlap characters the cut is made overlap
+    characters back from the end instead, which only misses DOIs longer than that.
+    :param source: string or file-like object with a read method
+    :param chunk_size: number of characters read at a time
+    :param overlap: characters carried between chunks inside long unbroken runs of text
+    :param normalize: clean up each DOI with normalize_doi
+    :param dedupe: yield each DOI (compared case insensitively) only the first time it is found
+    '''
+    seen = set()
+
+    def emit(doi_string):
+        if normalize:
+            doi_string = normalize_doi(doi_string)
+        if dedupe:
+            if doi_string.upper() in seen:
+                return
+            seen.add(doi_string.upper())
+        return doi_string
+
+    carry = ""
+    for chunk in _text_chunks(source, chunk_size):
+        buffer = carry + chunk
+
+        cut = 0
+        for terminator in doi_terminators.finditer(buffer, max(0, len(buffer) - overlap)):
+            cut = terminator.end()
+        if cut == 0 and len(buffer) > overlap:
+            cut = len(buffer) - overlap
+            # Don't cut through the start of a DOI that hasn't reached its first slash yet
+            partial = buffer.rfind("10.", max(0, cut - overlap), cut)
+            if partial >= 0:
+                cut = partial
+
+        for match in doi_pattern.finditer(buffer, 0, cut):
+            if match.end() == cut and cut - match.start() <= overlap:
+                cut = match.start()
+                break
+            doi_string = emit(match.group())
+            if doi_string is not None:
+                yield doi_string
+
+        carry = buffer[cut:]
+
+    for match in doi_pattern.finditer(carry):
+        doi_string = emit(match.group())
+        if doi_string is not None:
+            yield doi_string
+
 def doi_from_string(str_value):
-    checker = re.findall(r'(10[.][0-9]{4,}[^\s"/<>]*/[^\s"<>]+)', str_value)
-    link_part_pointers = [
-        "/abstract",
-        "/full",
-        "/summary"
-    ]
-    
-    for doi_string in checker:
-        for part in link_part_pointers:
-            if part in doi_string:
-                doi_string.replace(part, '')
-        if doi_string[-1] == ".":
-            doi_string = doi_string[0:-1]
-        
-    return checker
+    '''
+    Returns the distinct, normalized DOIs found in a string (or file-like object); see iter_dois.
+    '''
+    return list(iter_dois(str_value))
@@ -1,6 +1,21 @@
-import requests
+import bz2
+import collections
 import datetime
+import gzip
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
 import time
+import warnings
+from functools import partial
+import unidecode
+from . import utilities
+from .client import Client, default_client, date_cached
 
 wikidata_reference = [
     {
@@ -223,93 +238,536 @@ wikidata_reference = [
     }
 ]
 
-def execute_wd_query(query, wd_api='https://query.wikidata.org/sparql'):
-    results = requests.get(
+def execute_wd_query(query, wd_api='https://query.wikidata.org/sparql', client=None):
+    if client is None:
+        client = default_client()
+
+    results = client.get(
         wd_api, 
         params = {'format': 'json', 'query': query}
     )
 
     if results.status_code == 200:
-        return results.json()
+        wd_results = results.json()
+        wd_results["_date_cached"] = date_cached(results)
+        return wd_results
     else:
         return results
 
-def get_wd_concepts(wd_source, wd_reference=wikidata_reference, limit=10000):
-    source_config = next((i for i in wd_reference if i["source_label"] == wd_source), None)
-    if source_config is None:
-        return list()
+async def execute_wd_query_async(query, wd_api='https://query.wikidata.org/sparql', client=None):
+    '''
+    Coroutine form of execute_wd_query that runs the SPARQL request through the shared client.
+    '''
+    if client is None:
+        client = default_client()
+
+    results = await client.aget(
+        wd_api, 
+        params = {'format': 'json', 'query': query}
+    )
+
+    if results.status_code == 200:
+        wd_results = results.json()
+        wd_results["_date_cached"] = date_cached(results)
+        return wd_results
+    else:
+        return results
+
+def _iter_sparql_bindings(text_chunks):
+    '''
+    Incrementally parses the results.bindings array out of a SPARQL JSON response arriving as text chunks, yielding
+    each binding as soon as it is complete so that a large result never has to be held in memory as a whole.
+    '''
+    decoder = json.JSONDecoder()
+    chunks = iter(text_chunks)
+    buffer = ""
 
-    wd_query_start = 'SELECT ?item ?itemLabel ?itemDescription ?itemAltLabel WHERE {SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }'
-    wd_query_end = "} LIMIT 20000"
+    while True:
+        bindings_start = buffer.find('"bindings"')
+        if bindings_start >= 0 and buffer.find("[", bindings_start) >= 0:
+            buffer = buffer[buffer.find("[", bindings_start) + 1:]
+            break
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buffer += chunk
+
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+
+        try:
+            binding, position = decoder.raw_decode(buffer, position)
+            yield binding
+            continue
+        except json.JSONDecodeError:
+            pass
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError("SPARQL results ended before the bindings array was closed")
+        buffer = buffer[position:] + chunk
+        position = 0
 
+def iter_wd_query(query, wd_api='https://query.wikidata.org/sparql', client=None, chunk_size=65536):
+    '''
+    Streaming form of execute_wd_query: returns the time the results were fetched and a generator over the result
+    bindings, which are parsed out of the response body as it is read. Returns the response instead if the query
+    service did not answer 200.
+    '''
+    if client is None:
+        client = default_client()
+
+    results = client.get(
+        wd_api, 
+        params = {'format': 'json', 'query': query},
+        stream=True
+    )
+
+    if results.status_code != 200:
+        results.close()
+        return results
+
+    if results.encoding is None:
+        results.encoding = "utf-8"
+
+    def bindings():
+        try:
+            for binding in _iter_sparql_bindings(results.iter_content(chunk_size=chunk_size, decode_unicode=True)):
+                yield binding
+        finally:
+            results.close()
+
+    return date_cached(results), bindings()
+
+def wd_query_criteria(source_config):
     if source_config["retrieval_type"] == "source relationship":
-        wd_query_criteria = f'?item wdt:{source_config["source_rel"]} wd:{source_config["source_reference"].split("/")[-1]}.'
+        return f'?item wdt:{source_config["source_rel"]} wd:{source_config["source_reference"].split("/")[-1]}.'
 
     elif source_config["retrieval_type"] == "identifier list":
-        wd_query_criteria = 'VALUES ?item {' + " ".join([f"wd:{i}" for i in source_config["identifier_list"]]) + '}'
+        return 'VALUES ?item {' + " ".join([f"wd:{i}" for i in source_config["identifier_list"]]) + '}'
 
     elif source_config["retrieval_type"] == "specialized query":
-        wd_query_criteria = source_config["query_criteria"]
+        return source_config["query_criteria"]
 
     elif source_config["retrieval_type"] == "source relationship multi":
-        wd_query_criteria = " UNION ".join(["{?item wdt:" + source_config["source_rel"] + " wd:" + i + "}" for i in source_config["identifier_list"]])
+        return " UNION ".join(["{?item wdt:" + source_config["source_rel"] + " wd:" + i + "}" for i in source_config["identifier_list"]])
+
+def _wd_query_error(wd_source, wd_results):
+    if hasattr(wd_results, "status_code"):
+        return {"source": wd_source, "error": f"HTTP Status Code: {str(wd_results.status_code)}"}
+    return {"source": wd_source, "error": wd_results}
 
-    wd_results = execute_wd_query(wd_query_start + wd_query_criteria + wd_query_end)
+def _count_wd_items(wd_source, criteria, client):
+    try:
+        wd_results = execute_wd_query(
+            'SELECT (COUNT(DISTINCT ?item) AS ?count) WHERE {' + criteria + '}',
+            client=client
+        )
+    except Exception as e:
+        wd_results = e
+
+    if not isinstance(wd_results, dict):
+        return _wd_query_error(wd_source, wd_results)
+
+    return int(wd_results["results"]["bindings"][0]["count"]["value"])
+
+def _wd_concepts_page(offset, source_config, criteria, page_size, item_count, client):
+    wd_query = (
+        'SELECT ?item ?itemLabel ?itemDescription ?itemAltLabel WHERE {'
+        '{SELECT DISTINCT ?item WHERE {' + criteria + '} '
+        f'ORDER BY ?item LIMIT {min(page_size, item_count - offset)} OFFSET {offset}}}'
+        'SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }}'
+    )
+
+    preferred = list()
+    alternate = list()
+    try:
+        wd_results = iter_wd_query(wd_query, client=client)
+        if not isinstance(wd_results, tuple):
+            return _wd_query_error(source_config["source_label"], wd_results)
+
+        date_retrieved, bindings = wd_results
+        for binding in bindings:
+            _add_wd_concepts(binding, source_config, date_retrieved, preferred, alternate)
+    except Exception as e:
+        return _wd_query_error(source_config["source_label"], e)
+
+    return {"preferred": preferred, "alternate": alternate}
+
+def _add_wd_concepts(binding, source_config, date_retrieved, preferred, alternate):
+    if binding["itemLabel"]["value"] == binding["item"]["value"].split("/")[-1]:
+        return
+
+    concept = {
+        "_date_cached": date_retrieved,
+        "source": source_config["source_label"],
+        "source_reference": source_config["source_reference"], 
+        "label": binding["itemLabel"]["value"],
+        "concept_label": source_config["concept_label"],
+        "identifier": binding["item"]["value"],
+        "label_source": "preferred"
+    }
+    if "itemDescription" in binding:
+        concept["description"] = binding["itemDescription"]["value"]
+    preferred.append(concept)
+
+    if source_config["include_alt_names"] and "itemAltLabel" in binding:
+        for alt_label in binding["itemAltLabel"]["value"].split(","):
+            if alt_label.strip() != binding["itemLabel"]["value"]:
+                alt_concept = {
+                        "_date_cached": date_retrieved,
+                        "source": source_config["source_label"],
+                        "source_reference": source_config["source_reference"], 
+                        "label": alt_label.strip(),
+                        "concept_label": source_config["concept_label"],
+                        "label_preferred": binding["itemLabel"]["value"],
+                        "identifier": binding["item"]["value"],
+                        "label_source": "alternate"
+                    }
+                if "itemDescription" in binding:
+                    alt_concept["description"] = binding["itemDescription"]["value"]
+                alternate.append(alt_concept)
+
+def get_wd_concepts(
+    wd_source, 
+    wd_reference=wikidata_reference, 
+    limit=None, 
+    page_size=5000, 
+    max_workers=4, 
+    return_errors=False, 
+    client=None):
+    '''
+    Queries the Wikidata SPARQL service for the concepts making up one of the sources configured in wd_reference and
+    returns them as a list of concept dictionaries (preferred labels first, then alternate labels where the source
+    calls for them). The source's items are counted first and then retrieved in pages of page_size items, ordered on
+    the item IRI and fetched concurrently by max_workers threads, so that large classes don't time out on the query
+    service or get silently cut off by a single LIMIT. Each page's JSON bindings are parsed as the response streams in.
+
+    A limit caps the number of items taken from the source; a warning says so when a source has more items than that.
+    If any query fails (an HTTP error after the client's retries, or a timeout), None is returned, or an error
+    dictionary with the source label when return_errors is True.
+    '''
+    source_config = next((i for i in wd_reference if i["source_label"] == wd_source), None)
+    if source_config is None:
+        return list()
+
+    if client is None:
+        client = default_client()
+
+    criteria = wd_query_criteria(source_config)
+
+    item_count = _count_wd_items(wd_source, criteria, client)
+    if isinstance(item_count, dict):
+        return item_count if return_errors else None
+
+    if limit is not None and item_count > limit:
+        warnings.warn(f"Wikidata source {wd_source} has {item_count} items; only the first {limit} were retrieved")
+        item_count = limit
+
+    offsets = list(range(0, item_count, page_size))
+    fetch_page = partial(
+        _wd_concepts_page,
+        source_config=source_config,
+        criteria=criteria,
+        page_size=page_size,
+        item_count=item_count,
+        client=client
+    )
+    pages = dict(utilities.concurrent_map(fetch_page, offsets, max_workers=max_workers))
 
     concept_list = list()
-    for i in wd_results["results"]["bindings"]:
-        if i["itemLabel"]["value"] != i["item"]["value"].split("/")[-1]:
-            concept = {
-                "_date_cached": datetime.datetime.utcnow().isoformat(),
-                "source": source_config["source_label"],
-                "source_reference": source_config["source_reference"], 
-                "label": i["itemLabel"]["value"],
-                "concept_label": source_config["concept_label"],
-                "identifier": i["item"]["value"],
-                "label_source": "preferred"
-            }
-            if "itemDescription" in i:
-                concept["description"] = i["itemDescription"]["value"]
-            concept_list.append(concept)
-
-    if source_config["include_alt_names"]:
-        for item in [i for i in wd_results["results"]["bindings"] if "itemAltLabel" in i]:
-            if item["itemLabel"]["value"] != item["item"]["value"].split("/")[-1]:
-                for alt_label in item["itemAltLabel"]["value"].split(","):
-                    if alt_label.strip() != item["itemLabel"]["value"]:
-                        alt_concept = {
-                                "_date_cached": datetime.datetime.utcnow().isoformat(),
-                                "source": source_config["source_label"],
-                                "source_reference": source_config["source_reference"], 
-                                "label": alt_label.strip(),
-                                "concept_label": source_config["concept_label"],
-                                "label_preferred": item["itemLabel"]["value"],
-                                "identifier": item["item"]["value"],
-                                "label_source": "alternate"
-                            }
-                        if "itemDescription" in item:
-                            alt_concept["description"] = item["itemDescription"]["value"]
-                        concept_list.append(alt_concept)
-
-    return concept_list
+    alternate_list = list()
+    for offset in offsets:
+        if "error" in pages[offset]:
+            return pages[offset] if return_errors else None
+        concept_list.extend(pages[offset]["preferred"])
+        alternate_list.extend(pages[offset]["alternate"])
+
+    return concept_list + alternate_list
+
+def _dump_filters(sources, wd_reference):
+    '''
+    Translates the wd_reference entries for the given sources into filters that can be checked against entities from a
+    Wikidata JSON dump: a list of (property, allowed values) statement conditions that must all hold, or a set of
+    entity ids. Specialized queries are supported as long as their criteria are plain "?item wdt:P wd:Q." patterns.
+    '''
+    filters = list()
+    for source_config in [i for i in wd_reference if i["source_label"] in sources]:
+        if source_config["retrieval_type"] == "source relationship":
+            conditions = [(source_config["source_rel"], {source_config["source_reference"].split("/")[-1]})]
+            filters.append({"source_config": source_config, "conditions": conditions})
+
+        elif source_config["retrieval_type"] == "source relationship multi":
+            conditions = [(source_config["source_rel"], set(source_config["identifier_list"]))]
+            filters.append({"source_config": source_config, "conditions": conditions})
+
+        elif source_config["retrieval_type"] == "identifier list":
+            filters.append({"source_config": source_config, "identifiers": set(source_config["identifier_list"])})
+
+        elif source_config["retrieval_type"] == "specialized query":
+            patterns = re.findall(r"\?item\s+wdt:(P\d+)\s+wd:(Q\d+)\s*\.", source_config["query_criteria"])
+            if not patterns or re.sub(r"\?item\s+wdt:P\d+\s+wd:Q\d+\s*\.", "", source_config["query_criteria"]).strip():
+                warnings.warn(f"Wikidata source {source_config['source_label']} uses a query that can't be run against a dump and was skipped")
+                continue
+            filters.append({"source_config": source_config, "conditions": [(p, {q}) for p, q in patterns]})
+
+    return filters
+
+def _truthy_values(entity, prop):
+    '''
+    Item values of an entity's best-ranked statements for prop, the same set SPARQL matches with wdt:prop.
+    '''
+    statements = [i for i in entity.get("claims", dict()).get(prop, list()) if i.get("rank") != "deprecated"]
+    if any(i.get("rank") == "preferred" for i in statements):
+        statements = [i for i in statements if i.get("rank") == "preferred"]
+
+    values = set()
+    for statement in statements:
+        datavalue = statement["mainsnak"].get("datavalue")
+        if datavalue is not None and isinstance(datavalue["value"], dict) and "id" in datavalue["value"]:
+            values.add(datavalue["value"]["id"])
+    return values
+
+def _entity_binding(entity):
+    '''
+    Shapes a dump entity like a row from the label service queries in get_wd_concepts (English label, description and
+    comma-joined aliases, with the entity id standing in for a missing label) so both paths share concept building.
+    '''
+    binding = {
+        "item": {"value": f"http://www.wikidata.org/entity/{entity['id']}"},
+        "itemLabel": {"value": entity.get("labels", dict()).get("en", {"value": entity["id"]})["value"]}
+    }
+    if "en" in entity.get("descriptions", dict()):
+        binding["itemDescription"] = {"value": entity["descriptions"]["en"]["value"]}
+    if entity.get("aliases", dict()).get("en"):
+        binding["itemAltLabel"] = {"value": ", ".join(i["value"] for i in entity["aliases"]["en"])}
+    return binding
+
+_dump_worker_filters = None
+_dump_worker_needles = None
+
+def _init_dump_worker(filters):
+    global _dump_worker_filters, _dump_worker_needles
+    _dump_worker_filters = filters
+    _dump_worker_needles = set()
+    for dump_filter in filters:
+        for qid in dump_filter.get("identifiers", set()):
+            _dump_worker_needles.add(f'"{qid}"')
+        for prop, values in dump_filter.get("conditions", list()):
+            _dump_worker_needles.update(f'"{qid}"' for qid in values)
+
+def _filter_dump_lines(lines):
+    '''
+    Parses a batch of dump lines and returns (source label, binding) pairs for the entities matching a source filter.
+    Lines that don't mention any of the ids the filters look for are skipped without being parsed.
+    '''
+    matches = list()
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if not line.startswith("{") or not any(needle in line for needle in _dump_worker_needles):
+            continue
+
+        entity = json.loads(line)
+        for dump_filter in _dump_worker_filters:
+            if "identifiers" in dump_filter:
+                matched = entity["id"] in dump_filter["identifiers"]
+            else:
+                matched = all(_truthy_values(entity, prop) & values for prop, values in dump_filter["conditions"])
+            if matched:
+                matches.append((dump_filter["source_config"]["source_label"], _entity_binding(entity)))
+
+    return matches
+
+def _open_dump(dump_path):
+    '''
+    Opens a dump for reading text lines. Compressed dumps are piped through pigz or lbzip2 when one is installed, so
+    decompression runs on its own cores alongside the parsing workers; otherwise the gzip or bz2 module is used.
+    '''
+    if dump_path.endswith(".gz") or dump_path.endswith(".bz2"):
+        tool = "pigz" if dump_path.endswith(".gz") else "lbzip2"
+        if shutil.which(tool) is not None:
+            process = subprocess.Popen([tool, "-dc", dump_path], stdout=subprocess.PIPE)
+            return io.TextIOWrapper(process.stdout, encoding="utf-8"), process
+        if dump_path.endswith(".gz"):
+            return gzip.open(dump_path, "rt", encoding="utf-8"), None
+        return bz2.open(dump_path, "rt", encoding="utf-8"), None
+
+    return open(dump_path, "r", encoding="utf-8"), None
+
+def read_wd_dump(
+    dump_path, 
+    sources=[i["source_label"] for i in wikidata_reference], 
+    wd_reference=wikidata_reference, 
+    processes=None, 
+    batch_size=2000):
+    '''
+    Builds concept lists for the given sources from a local Wikidata JSON dump (the one-entity-per-line
+    latest-all.json format, plain, .gz or .bz2, or any filtered subset in the same shape) instead of the SPARQL
+    service. The dump is streamed in batches of batch_size lines to a pool of processes that parse the entities and
+    match them against the P31/P279 criteria declared for each source in wd_reference, using English labels,
+    descriptions and aliases exactly as get_wd_concepts would. Concepts are stamped with the dump file's modification
+    time. Returns a dictionary of source label to concept list.
+    :param dump_path: path to the dump file
+    :param sources: source labels from wd_reference to build
+    :param wd_reference: source configuration, as for get_wd_concepts
+    :param processes: number of parsing processes (defaults to the number of CPUs)
+    :param batch_size: number of dump lines handed to a process at a time
+    '''
+    filters = _dump_filters(sources, wd_reference)
+    date_retrieved = datetime.datetime.utcfromtimestamp(os.path.getmtime(dump_path)).isoformat()
+
+    preferred = {i["source_config"]["source_label"]: list() for i in filters}
+    alternate = {i["source_config"]["source_label"]: list() for i in filters}
+    source_configs = {i["source_config"]["source_label"]: i["source_config"] for i in filters}
+
+    def add_matches(matches):
+        for source_label, binding in matches:
+            _add_wd_concepts(
+                binding, 
+                source_configs[source_label], 
+                date_retrieved, 
+                preferred[source_label], 
+                alternate[source_label]
+            )
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # Pool.imap would read the whole dump ahead into its task queue, so batches are submitted through a bounded
+    # window instead and collected in order.
+    dump_file, decompressor = _open_dump(dump_path)
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_dump_worker, initargs=(filters,)) as pool:
+            pending = collections.deque()
+            for line_batch in iter(lambda: list(itertools.islice(dump_file, batch_size)), list()):
+                pending.append(pool.apply_async(_filter_dump_lines, (line_batch,)))
+                if len(pending) >= processes * 4:
+                    add_matches(pending.popleft().get())
+            while pending:
+                add_matches(pending.popleft().get())
+    finally:
+        dump_file.close()
+        if decompressor is not None:
+            decompressor.wait()
+
+    return {source_label: preferred[source_label] + alternate[source_label] for source_label in preferred}
+
+def _source_cache_file(cache_path, source):
+    return os.path.join(cache_path, f"{re.sub(r'[^A-Za-z0-9]+', '_', source).strip('_').lower()}.json")
+
+def _cached_wd_concepts(source, cache_path, cache_ttl):
+    if cache_path is None:
+        return
+    cache_file = _source_cache_file(cache_path, source)
+    if os.path.exists(cache_file):
+        if cache_ttl is not None and time.time() - os.path.getmtime(cache_file) >= cache_ttl:
+            return
+        with open(cache_file, "r") as f:
+            return json.load(f)
+
+def _cache_wd_concepts(source, concepts, cache_path):
+    if cache_path is None:
+        return
+    os.makedirs(cache_path, exist_ok=True)
+    cache_file = _source_cache_file(cache_path, source)
+    with open(f"{cache_file}.tmp", "w") as f:
+        json.dump(concepts, f)
+    os.replace(f"{cache_file}.tmp", cache_file)
+
+def _get_wd_concepts_with_retries(source, retries, cache_path, cache_ttl, page_size, page_workers, client):
+    concepts = _cached_wd_concepts(source, cache_path, cache_ttl)
+    if concepts is not None:
+        return concepts
+
+    for attempt in range(retries + 1):
+        concepts = get_wd_concepts(
+            source,
+            page_size=page_size,
+            max_workers=page_workers,
+            return_errors=True,
+            client=client
+        )
+        if isinstance(concepts, list):
+            _cache_wd_concepts(source, concepts, cache_path)
+            return concepts
+        if attempt < retries:
+            time.sleep(5 * 2 ** attempt)
+
+    return concepts
 
 def build_wd_reference(
     sources=[i["source_label"] for i in wikidata_reference], 
     existing_data=None, 
-    include_uncertainty=True):
-    
+    include_uncertainty=True,
+    max_workers=3,
+    page_workers=2,
+    page_size=5000,
+    query_rate=1,
+    retries=2,
+    cache_path=None,
+    cache_ttl=7 * 86400,
+    dump_path=None,
+    processes=None,
+    client=None):
+    '''
+    Builds the Wikidata reference vocabulary from the given sources, adding to existing_data if supplied (sources
+    already present there are skipped). Sources are retrieved on max_workers threads, each fetching its pages of
+    page_size items on page_workers threads of its own (see get_wd_concepts), all through a client whose per-host
+    token bucket starts at query_rate queries per second and backs off whenever the query service answers 429,
+    honoring its Retry-After. Sources whose query still fails are retried with a growing pause, and any that never
+    succeed are left out with a warning. With a cache_path directory, each source's concepts are written to their own
+    JSON file as soon as they arrive and reused on later builds, so a failed source can be rerun without querying the
+    rest again. A source file older than cache_ttl seconds (a week by default; None keeps files until they are
+    deleted) is ignored and the source queried again, so the vocabulary doesn't go stale between builds. Concepts are
+    added in the order of sources regardless of which query finishes first.
+
+    Given a dump_path, the vocabulary is built offline from a local Wikidata JSON dump with read_wd_dump on
+    processes worker processes instead, and none of the query settings apply.
+    '''
     wd_reference = list()
+    new_items_start = None
     if existing_data is not None:
         wd_reference = existing_data
         existing_sources = list(set([i["source"] for i in existing_data]))
         sources = [i for i in sources if i not in existing_sources]
+        new_items_start = len(existing_data)
+
+    if dump_path is not None:
+        source_concepts = read_wd_dump(dump_path, sources=sources, processes=processes)
+        sources = [i for i in sources if i in source_concepts]
+    else:
+        own_client = client is None
+        if own_client:
+            client = Client(pool_maxsize=max_workers * page_workers, per_host_rate=query_rate, adaptive_rate=True)
+
+        get_source = partial(
+            _get_wd_concepts_with_retries,
+            retries=retries,
+            cache_path=cache_path,
+            cache_ttl=cache_ttl,
+            page_size=page_size,
+            page_workers=page_workers,
+            client=client
+        )
+        try:
+            source_concepts = dict(utilities.concurrent_map(get_source, sources, max_workers=max_workers))
+        finally:
+            # A client passed in belongs to the caller and stays open
+            if own_client:
+                client.close()
 
     for source in sources:
-        wd_reference.extend(get_wd_concepts(source))
-        time.sleep(5)
+        if isinstance(source_concepts[source], dict):
+            warnings.warn(f"Wikidata source {source} failed after retries and was skipped: {source_concepts[source]['error']}")
+            continue
+        wd_reference.extend(source_concepts[source])
 
     if len(sources) > 0 and include_uncertainty:
-        wd_reference = wd_reference_uncertainty_factor(wd_reference)
+        wd_reference = wd_reference_uncertainty_factor(wd_reference, new_items_start=new_items_start)
 
     return wd_reference
 
@@ -322,6 +780,16 @@ def search_wd_reference(
     preferred_only=False,
     return_original_label=False):
 
+    if isinstance(wd_reference, WdReferenceIndex):
+        return wd_reference.search(
+            search_label,
+            wd_source=wd_source,
+            return_var=return_var,
+            source_priority_list=source_priority_list,
+            preferred_only=preferred_only,
+            return_original_label=return_original_label
+        )
+
     items_from_label = [i for i in wd_reference if i["label"] == search_label]
     
     if wd_source is not None:
@@ -353,30 +821,127 @@ def search_wd_reference(
 
         return items_from_label
 
+class WdReferenceIndex:
+    '''
+    Hash index over a Wikidata reference list from build_wd_reference, built once so that label lookups don't scan
+    the whole vocabulary. Items are indexed on label, on label plus source, and on label plus label_source, with each
+    index keeping items in their original list order so that search gives exactly the results search_wd_reference
+    gives on the list itself. An index can be passed to search_wd_reference in place of the list.
+
+    Labels can optionally be indexed (and searched) in a normalized form: case folded and/or transliterated to ASCII
+    with unidecode, so that "Kilauea" finds "Kīlauea".
+    :param wd_reference: list of concept dictionaries from build_wd_reference
+    :param casefold: match labels without regard to case
+    :param ascii_fold: match labels after transliterating them to ASCII
+    '''
+    def __init__(self, wd_reference, casefold=False, ascii_fold=False):
+        self.casefold = casefold
+        self.ascii_fold = ascii_fold
+        self.by_label = dict()
+        self.by_label_and_source = dict()
+        self.by_label_and_label_source = dict()
+
+        for item in wd_reference:
+            label_key = self.label_key(item["label"])
+            self.by_label.setdefault(label_key, list()).append(item)
+            self.by_label_and_source.setdefault((label_key, item["source"]), list()).append(item)
+            self.by_label_and_label_source.setdefault((label_key, item["label_source"]), list()).append(item)
+
+    def __len__(self):
+        return sum(len(i) for i in self.by_label.values())
+
+    def label_key(self, label):
+        if self.ascii_fold:
+            label = unidecode.unidecode(label)
+        if self.casefold:
+            label = label.casefold()
+        return label
+
+    def lookup(self, search_label, wd_source=None, preferred_only=False):
+        label_key = self.label_key(search_label)
+
+        if wd_source is not None:
+            items_from_label = self.by_label_and_source.get((label_key, wd_source), list())
+            if preferred_only:
+                items_from_label = [i for i in items_from_label if i["label_source"] == "preferred"]
+        elif preferred_only:
+            items_from_label = self.by_label_and_label_source.get((label_key, "preferred"), list())
+        else:
+            items_from_label = self.by_label.get(label_key, list())
+
+        return list(items_from_label)
+
+    def search(
+        self,
+        search_label,
+        wd_source=None,
+        return_var=None,
+        source_priority_list=None,
+        preferred_only=False,
+        return_original_label=False):
+        '''
+        Same parameters and results as search_wd_reference, without the reference list.
+        '''
+        items_from_label = self.lookup(search_label, wd_source=wd_source, preferred_only=preferred_only)
+
+        if not items_from_label:
+            if return_original_label:
+                return search_label
+            else:
+                return
+
+        if len(items_from_label) == 1:
+            if return_var is None:
+                return items_from_label[0]
+            else:
+                return items_from_label[0][return_var]
+        else:
+            if source_priority_list is not None:
+                preferred_wd_item = next((i for i in items_from_label if i["source"] in source_priority_list), None)
+                if preferred_wd_item is not None:
+                    if return_var is None:
+                        return preferred_wd_item
+                    else:
+                        return preferred_wd_item[return_var]
+
+            return items_from_label
+
 def duplicates(lst, item):
     return [i for i, x in enumerate(lst) if x == item]
 
-def wd_reference_uncertainty_factor(wd_reference_list):
+def wd_reference_uncertainty_factor(wd_reference_list, new_items_start=None):
     '''
     Takes a given Wikidata reference set, finds any duplicate labels, and introduces an uncertainty factor
     (number of label occurrences) and a "see also" reference of the other Wikidata entities in the given set
-    for follow up.
+    for follow up. Labels are grouped in a single pass, so this runs in time linear to the size of the set.
+
+    In incremental mode (new_items_start given), only the items at and after that position in the list are treated
+    as new, and uncertainty is only recalculated for the labels they carry; items whose labels did not pick up any
+    new occurrences are left as they were.
     '''
-    wd_reference_labels = [i["label"] for i in wd_reference_list]
-    duplicate_labels = dict(
-        (x, duplicates(wd_reference_labels, x)) for x in set(wd_reference_labels) if wd_reference_labels.count(x) > 1
-    )
+    label_indices = dict()
+    for index, wd_ref in enumerate(wd_reference_list):
+        label_indices.setdefault(wd_ref["label"], list()).append(index)
 
-    for wd_ref in [i for i in wd_reference_list if i["label"] in duplicate_labels.keys()]:
-        wd_ref.update(
-            {
-                "uncertainty_factor": len(duplicate_labels[wd_ref["label"]]),
-                "uncertainty_see_also": [
-                    i["identifier"] for index, i in enumerate(wd_reference_list) 
-                    if index in duplicate_labels[wd_ref["label"]]
-                    and i["identifier"] != wd_ref["identifier"]
-                ]
-            }
-        )
+    if new_items_start is None:
+        update_labels = label_indices.keys()
+    else:
+        update_labels = set(i["label"] for i in wd_reference_list[new_items_start:])
+
+    for label in update_labels:
+        indices = label_indices[label]
+        if len(indices) < 2:
+            continue
+
+        identifiers = [wd_reference_list[index]["identifier"] for index in indices]
+        for index in indices:
+            wd_reference_list[index].update(
+                {
+                    "uncertainty_factor": len(indices),
+                    "uncertainty_see_also": [
+                        i for i in identifiers if i != wd_reference_list[index]["identifier"]
+                    ]
+                }
+            )
 
-    return wd_reference_list
\ No newline at end of file
+    return wd_reference_list
@@ -20,9 +20,13 @@ requirements = [
     'Unidecode'
 ]
 
+extra_requirements = {
+    'lxml': ['lxml']
+}
+
 setup_requirements = [ ]
 
-test_requirements = [ ]
+test_requirements = ['requests_mock']
 
 setup(
     author="R. Sky Bristol",
@@ -46,6 +50,7 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require=extra_requirements,
     license="Unlicense",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.cache` through a Client, with HTTP mocked by requests_mock."""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from pylinkedcmd.cache import SqliteCache
+from pylinkedcmd.client import Client
+
+url = "https://doi.org/10.5066/F7TEST"
+
+
+class TestSqliteCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = SqliteCache(os.path.join(self.temp_dir.name, "cache.db"), default_ttl=60)
+        self.client = Client(cache=self.cache, max_retries=0)
+        self.now = 1000000.0
+        self.clock = mock.patch("pylinkedcmd.cache.time.time", lambda: self.now)
+        self.clock.start()
+
+    def tearDown(self):
+        self.clock.stop()
+        self.client.close()
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_fresh_hit(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, text="first", headers={"ETag": '"v1"'})
+            self.assertEqual(self.client.get(url).text, "first")
+            self.now += 30
+            r = self.client.get(url)
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(r.text, "first")
+        self.assertTrue(r.from_cache)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "revalidations": 0, "misses": 1})
+
+    def test_ttl_expiry_without_validators(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, [{"text": "first"}, {"text": "second"}])
+            self.client.get(url)
+            self.now += 61
+            r = self.client.get(url)
+
+        self.assertEqual(m.call_count, 2)
+        self.assertEqual(r.text, "second")
+        self.assertNotIn("If-None-Match", m.request_history[1].headers)
+        self.assertEqual(self.cache.stats(), {"hits": 0, "revalidations": 0, "misses": 2})
+
+    def test_source_ttl(self):
+        cache = SqliteCache(os.path.join(self.temp_dir.name, "ttl.db"), default_ttl=60, source_ttl={"doi.org": 3600})
+        self.assertEqual(cache.ttl(url), 3600)
+        self.assertEqual(cache.ttl("https://www.usgs.gov/"), 60)
+        cache.close()
+
+    def test_revalidation(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, [
+                {"text": "first", "headers": {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jun 2020 00:00:00 GMT"}},
+                {"status_code": 304, "headers": {"ETag": '"v2"', "Cache-Control": "max-age=600"}},
+                {"status_code": 304}
+            ])
+            self.client.get(url)
+            self.now += 61
+            revalidated = self.client.get(url)
+            self.now += 61
+            self.client.get(url)
+
+        conditional_headers = m.request_history[1].headers
+        self.assertEqual(conditional_headers["If-None-Match"], '"v1"')
+        self.assertEqual(conditional_headers["If-Modified-Since"], "Mon, 01 Jun 2020 00:00:00 GMT")
+        self.assertEqual(revalidated.text, "first")
+        self.assertEqual(revalidated.headers["Cache-Control"], "max-age=600")
+        self.assertEqual(revalidated.fetched_at, "1970-01-12T13:47:41")
+
+        # The validator sent with the 304 is the one used next time
+        self.assertEqual(m.request_history[2].headers["If-None-Match"], '"v2"')
+        self.assertEqual(
+            m.request_history[2].headers["If-Modified-Since"], "Mon, 01 Jun 2020 00:00:00 GMT"
+        )
+        self.assertEqual(self.cache.stats(), {"hits": 0, "revalidations": 2, "misses": 1})
+
+    def test_changed_content_replaced(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, [{"text": "first", "headers": {"ETag": '"v1"'}}, {"text": "second", "headers": {"ETag": '"v2"'}}])
+            self.client.get(url)
+            self.now += 61
+            self.assertEqual(self.client.get(url).text, "second")
+            self.assertEqual(self.client.get(url).text, "second")
+
+        self.assertEqual(m.call_count, 2)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "revalidations": 0, "misses": 2})
+
+    def test_accept_header_separates_entries(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, request_headers={"Accept": "application/json"}, text='{"format": "json"}')
+            m.get(url, request_headers={"Accept": "text/x-bibliography"}, text="Doe, J. (2019)")
+            json_text = self.client.get(url, headers={"Accept": "application/json"}).text
+            bibliography = self.client.get(url, headers={"Accept": "text/x-bibliography"}).text
+            cached_json = self.client.get(url, headers={"accept": "application/json"}).text
+
+        self.assertEqual(json_text, '{"format": "json"}')
+        self.assertEqual(bibliography, "Doe, J. (2019)")
+        self.assertEqual(cached_json, json_text)
+        self.assertEqual(m.call_count, 2)
+
+    def test_errors_not_cached(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, [{"status_code": 404}, {"text": "found"}])
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.assertEqual(self.client.get(url).text, "found")
+
+        self.assertEqual(self.cache.stats(), {"hits": 0, "revalidations": 0, "misses": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
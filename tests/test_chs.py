@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.chs` against an in-memory stand-in for the CHS cache API."""
+
+
+import os
+import tempfile
+import threading
+import unittest
+
+from pylinkedcmd import chs, storage
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeScrollClient:
+    '''
+    Serves documents through scroll ids, slicing them when slice_id and slice_max are sent (unless honour_slices is
+    off), and fails the request numbered fail_on_request.
+    '''
+    def __init__(self, docs, honour_slices=True, fail_on_request=None):
+        self.docs = docs
+        self.honour_slices = honour_slices
+        self.fail_on_request = fail_on_request
+        self.requests = 0
+        self.scrolls = dict()
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None):
+        with self.lock:
+            self.requests += 1
+            if self.requests == self.fail_on_request:
+                return FakeResponse(503, {"error": "unavailable"})
+
+            page_size = params["page_size"]
+            if "scroll_id" in params:
+                scroll_id = params["scroll_id"]
+                docs, position = self.scrolls[scroll_id]
+            else:
+                docs = self.docs
+                if self.honour_slices and "slice_id" in params:
+                    docs = docs[params["slice_id"]::params["slice_max"]]
+                scroll_id = f"scroll{len(self.scrolls)}"
+                position = 0
+            self.scrolls[scroll_id] = (docs, position + page_size)
+
+        page = docs[position:position + page_size]
+        return FakeResponse(200, {
+            "_scroll_id": scroll_id,
+            "hits": {"hits": [{"_id": doc["id"], "_source": doc} for doc in page]}
+        })
+
+
+def cached_docs(count):
+    return [
+        {"id": f"doc{n}", "title": f"Cached record {n}"} if n % 10 else {"id": f"doc{n}", "error": "Not found"}
+        for n in range(count)
+    ]
+
+
+class TestIterDocs(unittest.TestCase):
+    def test_single_scroll(self):
+        docs = cached_docs(95)
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(docs))
+        self.assertEqual(
+            list(chs_cache.iter_docs("doi", page_size=10)),
+            [i for i in docs if "error" not in i]
+        )
+
+    def test_slices(self):
+        docs = cached_docs(95)
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(docs))
+        sliced_docs = list(chs_cache.iter_docs("doi", page_size=10, slices=3, exclude_errors=False))
+        self.assertEqual(sorted(i["id"] for i in sliced_docs), sorted(i["id"] for i in docs))
+
+    def test_slices_ignored_by_api(self):
+        docs = cached_docs(95)
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(docs, honour_slices=False))
+        seen = list()
+        with self.assertRaises(ValueError):
+            for doc in chs_cache.iter_docs("doi", page_size=10, slices=3):
+                seen.append(doc["id"])
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = storage.JsonlStore(os.path.join(self.temp_dir.name, "doi.jsonl.gz"))
+        self.checkpoint_path = os.path.join(self.temp_dir.name, "doi.checkpoint")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_export(self):
+        docs = cached_docs(95)
+        self.store.write([{"id": "stale"}])
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(docs))
+        count = chs_cache.export("doi", self.store, page_size=10, exclude_errors=False)
+        self.assertEqual(count, 95)
+        self.assertEqual(list(self.store), docs)
+        self.assertFalse(os.path.exists(f"{self.store.path}.partial"))
+
+    def test_failed_export_keeps_previous_store(self):
+        self.store.write([{"id": "previous"}])
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(cached_docs(95), fail_on_request=4))
+        with self.assertRaises(ValueError):
+            chs_cache.export("doi", self.store, page_size=10, checkpoint_path=self.checkpoint_path)
+        self.assertEqual(list(self.store), [{"id": "previous"}])
+        self.assertTrue(os.path.exists(self.checkpoint_path))
+
+    def test_resume(self):
+        docs = cached_docs(95)
+        client = FakeScrollClient(docs, fail_on_request=5)
+        chs_cache = chs.ChsCache("http://cache.example/", client=client)
+        with self.assertRaises(ValueError):
+            chs_cache.export("doi", self.store, page_size=10, slices=3, checkpoint_path=self.checkpoint_path)
+
+        count = chs_cache.export("doi", self.store, page_size=10, slices=3, checkpoint_path=self.checkpoint_path)
+        expected_ids = sorted(i["id"] for i in docs if "error" not in i)
+        self.assertEqual(count, len(expected_ids))
+        self.assertEqual(sorted(i["id"] for i in self.store), expected_ids)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_resume_cuts_pages_stored_after_checkpoint(self):
+        docs = cached_docs(40)
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(docs, fail_on_request=3))
+        with self.assertRaises(ValueError):
+            chs_cache.export("doi", self.store, page_size=10, checkpoint_path=self.checkpoint_path)
+
+        # A page written just before the process died, without its checkpoint
+        partial_store = storage.JsonlStore(f"{self.store.path}.partial")
+        partial_store.append(docs[20:30])
+
+        chs_cache.export("doi", self.store, page_size=10, checkpoint_path=self.checkpoint_path)
+        self.assertEqual(list(self.store), [i for i in docs if "error" not in i])
+
+    def test_checkpoint_for_other_settings(self):
+        chs_cache = chs.ChsCache("http://cache.example/", client=FakeScrollClient(cached_docs(40), fail_on_request=2))
+        with self.assertRaises(ValueError):
+            chs_cache.export("doi", self.store, page_size=10, checkpoint_path=self.checkpoint_path)
+        with self.assertRaises(ValueError):
+            chs_cache.export("doi", self.store, page_size=20, checkpoint_path=self.checkpoint_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.client`, with the clock faked and HTTP mocked by requests_mock."""
+
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from pylinkedcmd import client
+from pylinkedcmd.client import Client, RateLimiter
+
+url = "https://api.example.org/items"
+
+
+class FakeClock:
+    '''
+    Stands in for time.monotonic and time.sleep: sleeping moves the clock on instead of blocking.
+    '''
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = list()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patchers = [
+            mock.patch("pylinkedcmd.client.time.monotonic", self.clock.monotonic),
+            mock.patch("pylinkedcmd.client.time.sleep", self.clock.sleep)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestRateLimiter(ClockTestCase):
+    def test_token_bucket_pacing(self):
+        limiter = RateLimiter(rate=4)
+        for _ in range(5):
+            limiter.wait("a.example.org")
+        self.assertEqual(self.clock.sleeps, [0.25] * 4)
+
+    def test_burst(self):
+        limiter = RateLimiter(rate=2, burst=3)
+        for _ in range(4):
+            limiter.wait("a.example.org")
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+        # Tokens build back up while the host is idle, but never beyond the burst
+        self.clock.now += 60
+        for _ in range(3):
+            limiter.wait("a.example.org")
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_hosts_paced_separately(self):
+        limiter = RateLimiter(rate=1)
+        limiter.wait("a.example.org")
+        limiter.wait("b.example.org")
+        self.assertEqual(self.clock.sleeps, list())
+
+    def test_no_rate(self):
+        limiter = RateLimiter()
+        for _ in range(10):
+            limiter.wait("a.example.org")
+        self.assertEqual(self.clock.sleeps, list())
+
+    def test_pause(self):
+        limiter = RateLimiter()
+        limiter.pause("a.example.org", 5)
+        limiter.pause("a.example.org", 2)
+        limiter.wait("a.example.org")
+        limiter.wait("b.example.org")
+        self.assertEqual(self.clock.sleeps, [5])
+
+    def test_adaptive_back_off(self):
+        limiter = RateLimiter(rate=8, adaptive=True, min_rate=1)
+        limiter.throttled("a.example.org")
+        self.assertEqual(limiter.host_rate("a.example.org"), 4)
+        for _ in range(3):
+            limiter.throttled("a.example.org")
+        self.assertEqual(limiter.host_rate("a.example.org"), 1)
+        self.assertEqual(limiter.host_rate("b.example.org"), 8)
+
+        limiter.succeeded("a.example.org")
+        self.assertEqual(limiter.host_rate("a.example.org"), 2)
+        for _ in range(6):
+            limiter.succeeded("a.example.org")
+        self.assertEqual(limiter.host_rate("a.example.org"), 8)
+        self.assertNotIn("a.example.org", limiter._host_rates)
+
+    def test_adaptive_without_rate(self):
+        limiter = RateLimiter(adaptive=True, min_rate=0.5)
+        limiter.succeeded("a.example.org")
+        self.assertIsNone(limiter.host_rate("a.example.org"))
+        limiter.throttled("a.example.org")
+        self.assertEqual(limiter.host_rate("a.example.org"), 0.5)
+
+    def test_not_adaptive(self):
+        limiter = RateLimiter(rate=8)
+        limiter.throttled("a.example.org")
+        self.assertEqual(limiter.host_rate("a.example.org"), 8)
+
+
+class TestRetries(ClockTestCase):
+    def test_retry_after_seconds(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, [
+                {"status_code": 429, "headers": {"Retry-After": "7"}},
+                {"status_code": 503, "headers": {"Retry-After": "3"}},
+                {"text": "ok"}
+            ])
+            r = Client(max_retries=3).get(url)
+
+        self.assertEqual(r.text, "ok")
+        self.assertEqual(m.call_count, 3)
+        self.assertEqual(self.clock.sleeps, [7, 3])
+
+    def test_retry_after_date(self):
+        response = mock.Mock(headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        self.assertEqual(client.retry_after_seconds(response), 0.0)
+        self.assertIsNone(client.retry_after_seconds(mock.Mock(headers={"Retry-After": "soon"})))
+        self.assertIsNone(client.retry_after_seconds(mock.Mock(headers=dict())))
+
+    def test_backoff_without_retry_after(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, [{"status_code": 502}, {"status_code": 504}, {"text": "ok"}])
+            Client(max_retries=3, backoff_factor=0.5).get(url)
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0])
+
+    def test_retries_exhausted(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, status_code=503)
+            r = Client(max_retries=2, backoff_factor=0).get(url)
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(m.call_count, 3)
+
+    def test_other_errors_not_retried(self):
+        with requests_mock.Mocker() as m:
+            m.get(url, status_code=404)
+            r = Client(max_retries=2).get(url)
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(m.call_count, 1)
+
+    def test_adaptive_client_slows_down_for_throttled_host(self):
+        http_client = Client(per_host_rate=8, adaptive_rate=True, max_retries=1)
+        with requests_mock.Mocker() as m:
+            m.get(url, [{"status_code": 429, "headers": {"Retry-After": "0"}}, {"text": "ok"}])
+            http_client.get(url)
+            self.assertEqual(http_client.limiter.host_rate("api.example.org"), 4.1)
+
+
+class TestDefaultClient(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(client.set_default_client, client._default_client)
+
+    def test_shared(self):
+        client.set_default_client(None)
+        self.assertIs(client.default_client(), client.default_client())
+
+    def test_set_default_client(self):
+        replacement = Client(pool_maxsize=2)
+        client.set_default_client(replacement)
+        self.assertIs(client.default_client(), replacement)
+
+
+class TestAget(unittest.TestCase):
+    def test_per_host_concurrency(self):
+        http_client = Client(pool_maxsize=8, per_host_concurrency=2)
+        in_flight = {"a.example.org": 0, "b.example.org": 0}
+        peak = dict(in_flight)
+        lock = threading.Lock()
+
+        def fake_get(request_url, **kwargs):
+            host = request_url.split("/")[2]
+            with lock:
+                in_flight[host] += 1
+                peak[host] = max(peak[host], in_flight[host])
+            time.sleep(0.02)
+            with lock:
+                in_flight[host] -= 1
+            return request_url
+
+        http_client.get = fake_get
+
+        async def fetch_all():
+            return await asyncio.gather(*[
+                http_client.aget(f"https://{host}/item/{n}")
+                for n in range(6) for host in ["a.example.org", "b.example.org"]
+            ])
+
+        # Each event loop gets its own semaphores, so the client can be used from one loop after another
+        for _ in range(2):
+            results = asyncio.run(fetch_all())
+            self.assertEqual(len(results), 12)
+            self.assertEqual(peak, {"a.example.org": 2, "b.example.org": 2})
+        http_client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.doi` content negotiation, with doi.org mocked by requests_mock."""
+
+
+import threading
+import unittest
+from unittest import mock
+
+import requests
+import requests_mock
+
+from pylinkedcmd import doi
+from pylinkedcmd.client import Client
+
+csl_json = {"DOI": "10.5066/F7GOOD", "title": "A good data release", "type": "dataset"}
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class SlowClient:
+    '''
+    Answers every DOI with its CSL JSON straight away, except slow_url, which waits until release is set. This stays
+    outside requests_mock, which answers one request at a time.
+    '''
+    def __init__(self, slow_url):
+        self.slow_url = slow_url
+        self.release = threading.Event()
+
+    def get(self, url, headers=None):
+        if url == self.slow_url:
+            self.release.wait(10)
+        return FakeResponse({"DOI": url.replace("https://doi.org/", "")})
+
+
+class TestNegotiateDois(unittest.TestCase):
+    def setUp(self):
+        self.mocker = requests_mock.Mocker()
+        self.mocker.start()
+        self.addCleanup(self.mocker.stop)
+        self.mocker.get("https://doi.org/10.5066/F7GOOD", json=csl_json)
+        self.mocker.get("https://doi.org/10.5066/F7GONE", status_code=404)
+        self.mocker.get("https://doi.org/10.5066/F7HTML", text="<html>landing page</html>")
+        self.mocker.get("https://doi.org/10.5066/F7DOWN", exc=requests.exceptions.ConnectTimeout)
+
+    def test_mixed_results(self):
+        http_client = Client(backoff_factor=0)
+        results = dict(doi.negotiate_dois(
+            ["10.5066/F7GOOD", "10.5066/F7GONE", "10.5066/F7HTML", "10.5066/F7DOWN", "not a doi"],
+            return_errors=True,
+            max_workers=2,
+            client=http_client
+        ))
+        http_client.close()
+
+        self.assertEqual(results["10.5066/F7GOOD"]["title"], "A good data release")
+        self.assertEqual(results["10.5066/F7GOOD"]["_identifiers"]["url"], "https://doi.org/10.5066/F7GOOD")
+        self.assertEqual(results["10.5066/F7GONE"], {"doi": "10.5066/F7GONE", "error": "HTTP Status Code: 404"})
+        self.assertEqual(
+            results["10.5066/F7HTML"],
+            {"doi": "10.5066/F7HTML", "error": "Content type with an accept header for JSON was not JSON"}
+        )
+        self.assertIsInstance(results["10.5066/F7DOWN"]["error"], requests.exceptions.ConnectTimeout)
+        self.assertEqual(len([i for i in self.mocker.request_history if i.url.endswith("F7DOWN")]), 4)
+        self.assertEqual(results["not a doi"], {"doi": "not a doi", "error": "Not a valid DOI identifier"})
+
+        self.assertTrue(all(
+            i.headers["accept"] == "application/vnd.citationstyles.csl+json" for i in self.mocker.request_history
+        ))
+
+    def test_invalid_without_errors(self):
+        results = dict(doi.negotiate_dois(["not a doi", "10.5066/F7GOOD"]))
+        self.assertIsNone(results["not a doi"])
+        self.assertEqual(results["10.5066/F7GOOD"]["DOI"], "10.5066/F7GOOD")
+
+    def test_reference_string(self):
+        self.mocker.get("https://doi.org/10.5066/F7GOOD", text="Doe, J., 2021, A good data release.")
+        results = dict(doi.negotiate_dois(["10.5066/F7GOOD"], response_type="reference_string"))
+        self.assertEqual(results["10.5066/F7GOOD"]["reference_string"], "Doe, J., 2021, A good data release.")
+        self.assertEqual(self.mocker.last_request.headers["accept"], "text/x-bibliography")
+
+    def test_completion_order(self):
+        http_client = SlowClient("https://doi.org/10.5066/F7SLOW")
+
+        order = list()
+        for doi_string, response_doc in doi.negotiate_dois(["10.5066/F7SLOW", "10.5066/F7GOOD"], max_workers=2, client=http_client):
+            order.append(doi_string)
+            # The slow DOI can only finish once the fast one has been yielded
+            http_client.release.set()
+
+        self.assertEqual(order, ["10.5066/F7GOOD", "10.5066/F7SLOW"])
+        self.assertEqual(response_doc["DOI"], "10.5066/F7SLOW")
+
+    def test_generator_input(self):
+        dois = ("10.5066/F7GOOD" for _ in range(20))
+        self.assertEqual(len(list(doi.negotiate_dois(dois, max_workers=3))), 20)
+
+
+class TestNegotiateDoisClient(unittest.TestCase):
+    def setUp(self):
+        self.mocker = requests_mock.Mocker()
+        self.mocker.start()
+        self.addCleanup(self.mocker.stop)
+        self.mocker.get("https://doi.org/10.5066/F7GOOD", json=csl_json)
+
+        close = mock.patch.object(Client, "close", autospec=True, side_effect=Client.close)
+        self.close = close.start()
+        self.addCleanup(close.stop)
+
+    def test_own_client_closed(self):
+        list(doi.negotiate_dois(["10.5066/F7GOOD"] * 3))
+        self.assertEqual(self.close.call_count, 1)
+
+    def test_own_client_closed_when_abandoned(self):
+        results = doi.negotiate_dois(["10.5066/F7GOOD"] * 3, max_workers=1)
+        next(results)
+        results.close()
+        self.assertEqual(self.close.call_count, 1)
+
+    def test_own_client_rate(self):
+        with mock.patch("pylinkedcmd.doi.Client", wraps=Client) as client_class:
+            list(doi.negotiate_dois(["10.5066/F7GOOD"], max_workers=4, per_host_rate=2))
+        client_class.assert_called_once_with(pool_maxsize=4, per_host_rate=2)
+
+    def test_client_passed_in_stays_open(self):
+        http_client = Client(max_retries=0)
+        list(doi.negotiate_dois(["10.5066/F7GOOD"] * 3, client=http_client))
+        self.assertEqual(self.close.call_count, 0)
+        self.assertEqual(self.mocker.call_count, 3)
+        http_client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
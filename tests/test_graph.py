@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.graph` against an in-memory fake of the neo4j driver."""
+
+
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+
+from pylinkedcmd import graph, isaid
+
+
+class FakeResult:
+    def consume(self):
+        return None
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, **parameters):
+        self.driver.writes.append((query, parameters["rows"]))
+        return FakeResult()
+
+
+class FakeSession:
+    def __init__(self, driver, database):
+        self.driver = driver
+        self.database = database
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def run(self, query, **parameters):
+        self.driver.statements.append(query)
+        return FakeResult()
+
+    def execute_write(self, transaction_function):
+        self.driver.transactions += 1
+        return transaction_function(FakeTransaction(self.driver))
+
+
+class FakeDriver:
+    def __init__(self):
+        self.statements = list()
+        self.writes = list()
+        self.transactions = 0
+        self.databases = list()
+
+    def session(self, database=None):
+        self.databases.append(database)
+        return FakeSession(self, database)
+
+
+doi_doc = {
+    "title": "Streamflow in the Upper Colorado",
+    "URL": "https://doi.org/10.5066/F7TEST",
+    "DOI": "10.5066/F7TEST",
+    "issued": {"date-parts": [[2019]]},
+    "type": "dataset",
+    "publisher": "US Geological Survey",
+    "subject": ["hydrology", "streamflow"],
+    "funder": [{"name": "National Science Foundation", "award": ["EAR-1234"]}],
+    "author": [
+        {
+            "given": "Jane",
+            "family": "Doe",
+            "ORCID": "http://orcid.org/0000-0001-2345-6789",
+            "sequence": "first",
+            "affiliation": ["U.S. Geological Survey"]
+        },
+        {"family": "Roe"},
+        {"sequence": "additional"}
+    ]
+}
+
+
+class TestGraphElements(unittest.TestCase):
+    """Tests for flattening transformed records into graph rows."""
+
+    def setUp(self):
+        self.nodes, self.relationships = graph.graph_elements([isaid.work_node_from_doi_doc(doi_doc), None])
+        self.node_index = {(i["label"], i["properties"][i["key"]]): i for i in self.nodes}
+
+    def test_record_node(self):
+        work = self.node_index[("Dataset", "10.5066/F7TEST")]
+        self.assertEqual(work["key"], "doi")
+        self.assertEqual(work["properties"]["issued_year"], 2019)
+        self.assertNotIn("node_type", work["properties"])
+
+    def test_related_node_keys(self):
+        self.assertEqual(self.node_index[("Person", "0000-0001-2345-6789")]["key"], "orcid")
+        self.assertNotIn(("Person", "Roe"), self.node_index)
+        self.assertFalse(any(i["label"] == "Person" and i["key"] == "name" for i in self.nodes))
+        self.assertEqual(self.node_index[("SubjectMatter", "hydrology")]["key"], "name")
+        funder = self.node_index[("Organization", "National Science Foundation")]
+        self.assertEqual(funder["properties"]["category"], "Funding Institution")
+        self.assertNotIn("award", funder["properties"])
+
+    def test_relationship_direction(self):
+        relationships = {(i["type"], i["start"], i["end"]): i for i in self.relationships}
+        self.assertIn(("ADDRESSES_SUBJECT", "10.5066/F7TEST", "hydrology"), relationships)
+        self.assertIn(("AUTHOR_OF", "0000-0001-2345-6789", "10.5066/F7TEST"), relationships)
+        self.assertIn(("AFFILIATED_WITH", "0000-0001-2345-6789", "U.S. Geological Survey"), relationships)
+
+        funder_of = relationships[("FUNDER_OF", "National Science Foundation", "10.5066/F7TEST")]
+        self.assertEqual(funder_of["properties"]["award"], ["EAR-1234"])
+        self.assertEqual(funder_of["properties"]["reference"], "https://doi.org/10.5066/F7TEST")
+
+        author_of = relationships[("AUTHOR_OF", "0000-0001-2345-6789", "10.5066/F7TEST")]
+        self.assertEqual(author_of["properties"]["relationship_qualifier"], "first")
+        self.assertEqual(author_of["properties"]["date_qualifier"], 2019)
+
+    def test_unkeyed_nodes_dropped(self):
+        self.assertEqual(len([i for i in self.relationships if i["type"] == "AUTHOR_OF"]), 1)
+
+    def test_unidentified_contacts_dropped(self):
+        item = {
+            "identifier": "item1",
+            "title": "Dataset 1",
+            "description": "Measurements",
+            "modified": "2020-05-01",
+            "contactPoint": {"fn": "Pat Smith", "hasEmail": "mailto: not-an-email"},
+            "authors": [
+                {"authorname": "Water Science Center", "nametype": "Organizational", "orcid": ""},
+                {"authorname": "Pat Smith", "nametype": "Personal", "orcid": "0000-0000-0000-0001"}
+            ],
+            "datasource": [{"displayname": "U.S. Geological Survey"}]
+        }
+        nodes, relationships = graph.graph_elements([isaid.dataset_node_from_sdc_item(item)])
+        node_index = {(i["label"], i["properties"][i["key"]]) for i in nodes}
+
+        self.assertIn(("Person", "0000-0000-0000-0001"), node_index)
+        self.assertNotIn(("Person", "Pat Smith"), node_index)
+        self.assertNotIn(("Organization", "Water Science Center"), node_index)
+        # Named institutions that aren't contacts are still keyed on their names
+        self.assertIn(("Organization", "U.S. Geological Survey"), node_index)
+        self.assertEqual(sorted(i["type"] for i in relationships), ["AUTHOR_OF", "DATA_SOURCE"])
+
+    def test_duplicates_combined(self):
+        nodes, relationships = graph.graph_elements([isaid.work_node_from_doi_doc(doi_doc)] * 2)
+        self.assertEqual(len(nodes), len(self.nodes))
+        self.assertEqual(len(relationships), len(self.relationships))
+
+    def test_default_label(self):
+        properties = {"email": "jdoe@usgs.gov", "name": "Jane Doe"}
+        nodes, _ = graph.graph_elements([{"properties": properties}], label="Person")
+        self.assertEqual(nodes, [{"label": "Person", "key": "email", "properties": properties}])
+
+
+class TestGraphLoader(unittest.TestCase):
+    """Tests for batched UNWIND loading."""
+
+    def setUp(self):
+        self.nodes, self.relationships = graph.graph_elements([isaid.work_node_from_doi_doc(doi_doc)])
+        self.driver = FakeDriver()
+
+    def test_schema(self):
+        statements = graph.schema_statements(self.nodes, self.relationships)
+        self.assertIn("CREATE INDEX `Dataset_doi` IF NOT EXISTS FOR (n:`Dataset`) ON (n.`doi`)", statements)
+        self.assertIn("CREATE INDEX `Organization_name` IF NOT EXISTS FOR (n:`Organization`) ON (n.`name`)", statements)
+        self.assertNotIn("CREATE INDEX `Person_name` IF NOT EXISTS FOR (n:`Person`) ON (n.`name`)", statements)
+        self.assertFalse(any("CONSTRAINT" in i for i in statements))
+
+    def test_load(self):
+        loader = graph.GraphLoader(self.driver, database="isaid", batch_size=2)
+        stats = loader.load(self.nodes, self.relationships)
+
+        self.assertEqual(stats["nodes"], len(self.nodes))
+        self.assertEqual(stats["relationships"], len(self.relationships))
+        self.assertEqual(stats["batches"], self.driver.transactions)
+        self.assertTrue(all(len(rows) <= 2 for _, rows in self.driver.writes))
+        self.assertEqual(set(self.driver.databases), set(["isaid"]))
+        self.assertEqual(len(self.driver.statements), len(graph.schema_statements(self.nodes, self.relationships)))
+
+        node_writes = [i for i in self.driver.writes if "MERGE (n:" in i[0]]
+        relationship_writes = [i for i in self.driver.writes if "MERGE (a)-[r:" in i[0]]
+        self.assertEqual(self.driver.writes, node_writes + relationship_writes)
+        node_rows = [row for _, rows in node_writes for row in rows]
+        self.assertIn({"key": "hydrology", "properties": {"name": "hydrology"}}, node_rows)
+
+    def test_quoting(self):
+        self.assertEqual(
+            graph.node_query("Odd`Label", "name"),
+            "UNWIND $rows AS row\nMERGE (n:`Odd``Label` {`name`: row.key})\nSET n += row.properties"
+        )
+
+    def test_progress(self):
+        seen = list()
+        loader = graph.GraphLoader(self.driver, batch_size=1, progress=lambda stats: seen.append(stats["batches"]))
+        loader.load(self.nodes, self.relationships, ensure_schema=False)
+        self.assertEqual(seen, list(range(1, len(self.nodes) + len(self.relationships) + 1)))
+        self.assertEqual(self.driver.statements, list())
+
+
+class FakeTransientError(Exception):
+    code = "Neo.TransientError.Transaction.DeadlockDetected"
+
+
+class LockingTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, **parameters):
+        touched = set()
+        for row in parameters["rows"]:
+            touched.update([row.get("start"), row.get("end"), row.get("key")])
+        touched.discard(None)
+
+        with self.driver.lock:
+            if touched & self.driver.locked:
+                self.driver.conflicts += 1
+                raise FakeTransientError("Deadlock detected")
+            self.driver.locked.update(touched)
+            self.driver.writes.append((query, parameters["rows"]))
+
+        time.sleep(0.001)
+        with self.driver.lock:
+            self.driver.locked.difference_update(touched)
+        return FakeResult()
+
+
+class LockingSession(FakeSession):
+    def execute_write(self, transaction_function):
+        if self.driver.failures_left:
+            self.driver.failures_left -= 1
+            raise FakeTransientError("Deadlock detected")
+        return transaction_function(LockingTransaction(self.driver))
+
+
+class LockingDriver(FakeDriver):
+    """Fake driver that fails transactions which lock a node another transaction holds, as a deadlock would."""
+
+    def __init__(self, failures=0):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.locked = set()
+        self.conflicts = 0
+        self.failures_left = failures
+
+    def session(self, database=None):
+        return LockingSession(self, database)
+
+
+def synthetic_relationships(count=300, seed=7):
+    generator = random.Random(seed)
+    relationships = dict()
+    while len(relationships) < count:
+        person = f"person{generator.randrange(40)}@usgs.gov"
+        work = f"10.5066/WORK{generator.randrange(60)}"
+        relationships[(person, work)] = {
+            "type": "AUTHOR_OF",
+            "start_label": "Person",
+            "start_key": "email",
+            "start": person,
+            "end_label": "CreativeWork",
+            "end_key": "doi",
+            "end": work,
+            "properties": {"reference": work}
+        }
+    return list(relationships.values())
+
+
+class TestParallelRelationships(unittest.TestCase):
+    """Tests for partitioned, parallel relationship loading."""
+
+    def test_bucket_rounds(self):
+        for buckets in range(1, 10):
+            rounds = graph.bucket_rounds(buckets)
+            pairs = [pair for round_pairs in rounds for pair in round_pairs]
+            expected = [(i, j) for i in range(buckets) for j in range(i, buckets)]
+            self.assertEqual(sorted(pairs), expected)
+            for round_pairs in rounds:
+                round_buckets = [bucket for pair in round_pairs for bucket in set(pair)]
+                self.assertEqual(len(round_buckets), len(set(round_buckets)))
+
+    def test_partitions_cover_endpoints(self):
+        relationships = synthetic_relationships()
+        partitions = graph.partition_relationships(relationships, 8)
+        self.assertEqual(sum(len(i) for i in partitions.values()), len(relationships))
+        for pair, members in partitions.items():
+            for relationship in members:
+                start_bucket = graph._node_bucket("Person", "email", relationship["start"], 8)
+                end_bucket = graph._node_bucket("CreativeWork", "doi", relationship["end"], 8)
+                self.assertEqual(pair, (min(start_bucket, end_bucket), max(start_bucket, end_bucket)))
+
+    def test_parallel_load_without_conflicts(self):
+        relationships = synthetic_relationships()
+        driver = LockingDriver()
+        loader = graph.GraphLoader(driver, batch_size=10, workers=4, retry_backoff=0)
+        stats = loader.load_relationships(relationships)
+
+        self.assertEqual(driver.conflicts, 0)
+        self.assertEqual(stats["retries"], 0)
+        self.assertEqual(stats["relationships"], len(relationships))
+        written = sorted((row["start"], row["end"]) for _, rows in driver.writes for row in rows)
+        self.assertEqual(written, sorted((i["start"], i["end"]) for i in relationships))
+
+    def test_transient_errors_retried(self):
+        driver = LockingDriver(failures=2)
+        loader = graph.GraphLoader(driver, batch_size=100, retry_backoff=0)
+        stats = loader.load_relationships(synthetic_relationships(count=50))
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["relationships"], 50)
+
+    def test_retries_exhausted(self):
+        driver = LockingDriver(failures=3)
+        loader = graph.GraphLoader(driver, max_retries=2, retry_backoff=0)
+        with self.assertRaises(FakeTransientError):
+            loader.load_relationships(synthetic_relationships(count=5))
+
+
+class GraphStateDriver(FakeDriver):
+    """Fake driver whose read queries return a fixed list of records."""
+
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def session(self, database=None):
+        driver = self
+
+        class ReadSession(FakeSession):
+            def run(self, query, **parameters):
+                driver.statements.append(query)
+                return iter(driver.records)
+
+        return ReadSession(self, database)
+
+
+class TestGraphDiff(unittest.TestCase):
+    """Tests for comparing incoming records with the keys already in the graph."""
+
+    properties = ["name", "source"]
+
+    def setUp(self):
+        self.driver = GraphStateDriver([
+            {"key": "https://example.org/a", "properties": ["Alpha", "Thesaurus"]},
+            {"key": "https://example.org/b", "properties": ["Beta", None]},
+            {"key": "https://example.org/c", "properties": ["Gamma", "Thesaurus"]}
+        ])
+        self.records = [
+            {"url": "https://example.org/a", "name": "Alpha", "source": "Thesaurus"},
+            {"url": "https://example.org/b", "name": "Beta", "source": "Thesaurus"},
+            {"url": "https://example.org/d", "name": "Delta", "source": "Thesaurus"},
+            {"url": "https://example.org/d", "name": "Delta again", "source": "Thesaurus"},
+            {"url": None, "name": "Unkeyed", "source": "Thesaurus"}
+        ]
+
+    def check_delta(self, delta):
+        self.assertEqual([i["name"] for i in delta["new"]], ["Delta"])
+        self.assertEqual([i["name"] for i in delta["changed"]], ["Beta"])
+        self.assertEqual(delta["unchanged"], 1)
+        self.assertEqual([i["name"] for i in delta["unkeyed"]], ["Unkeyed"])
+        self.assertEqual(delta["missing"], ["https://example.org/c"])
+
+    def test_diff_in_memory(self):
+        delta = graph.diff_graph(self.driver, "DefinedSubjectMatter", "url", self.records, properties=self.properties)
+        self.check_delta(delta)
+        self.assertEqual(
+            self.driver.statements,
+            [
+                "MATCH (n:`DefinedSubjectMatter`) WHERE n.`url` IS NOT NULL "
+                "RETURN n.`url` AS key, [n.`name`, n.`source`] AS properties"
+            ]
+        )
+
+    def test_diff_on_disk(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            delta = graph.diff_graph(
+                self.driver, "DefinedSubjectMatter", "url", iter(self.records),
+                properties=self.properties, path=os.path.join(temp_dir, "keys.db")
+            )
+        self.check_delta(delta)
+
+    def test_keys_only(self):
+        delta = graph.diff_graph(self.driver, "DefinedSubjectMatter", "url", self.records, include_missing=False)
+        self.assertEqual(len(delta["changed"]), 0)
+        self.assertEqual(delta["unchanged"], 2)
+        self.assertNotIn("missing", delta)
+
+    def test_fingerprint_key_order(self):
+        self.assertEqual(graph.fingerprint({"a": 1, "b": [2, 3]}), graph.fingerprint({"b": [2, 3], "a": 1}))
+        self.assertNotEqual(graph.fingerprint({"a": 1}), graph.fingerprint({"a": "1"}))
+
+
+def profile_record(email, expertise, date_cached="2021-06-01", title=None):
+    profile_scrape = {
+        "profile": f"https://www.usgs.gov/staff-profiles/{email.split('@')[0]}",
+        "_date_cached": date_cached,
+        "display_name": email.split("@")[0].title(),
+        "organization_name": "Water Resources Mission Area",
+        "organization_link": "https://www.usgs.gov/mission-areas/water-resources",
+        "email": email,
+        "body_content_links": list(),
+        "expertise": expertise
+    }
+    if title is not None:
+        profile_scrape["title"] = title
+    return isaid.person_from_usgs_profile(profile_scrape)
+
+
+class TestIncrementalSync(unittest.TestCase):
+    """Tests for fingerprint change tracking and syncing only the changes."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.tracker = graph.ChangeTracker(os.path.join(self.temp_dir.name, "sync.db"), "usgs_profiles")
+        self.records = [
+            profile_record("ann@usgs.gov", ["hydrology", "geology"], title="Hydrologist"),
+            profile_record("bob@usgs.gov", ["geology"])
+        ]
+
+    def tearDown(self):
+        self.tracker.close()
+        self.temp_dir.cleanup()
+
+    def sync(self, records, driver=None):
+        driver = driver or FakeDriver()
+        nodes, relationships = graph.graph_elements(records, label="Person")
+        summary = graph.GraphLoader(driver).sync(self.tracker, nodes, relationships, ensure_schema=False)
+        return summary, driver
+
+    def test_first_sync_inserts_everything(self):
+        summary, driver = self.sync(self.records)
+        self.assertEqual(summary["nodes"], {"insert": 4, "update": 0, "delete": 0, "unchanged": 0})
+        self.assertEqual(summary["relationships"], {"insert": 3, "update": 0, "delete": 0, "unchanged": 0})
+        self.assertEqual(len(self.tracker), 7)
+
+    def test_unchanged_sync_writes_nothing(self):
+        self.sync(self.records)
+        refetched = [
+            profile_record("ann@usgs.gov", ["hydrology", "geology"], date_cached="2021-07-01", title="Hydrologist"),
+            profile_record("bob@usgs.gov", ["geology"], date_cached="2021-07-01")
+        ]
+        summary, driver = self.sync(refetched)
+        self.assertEqual(summary["nodes"]["unchanged"], 4)
+        self.assertEqual(summary["relationships"]["unchanged"], 3)
+        self.assertEqual(driver.writes, list())
+
+    def test_changes_and_retractions(self):
+        self.sync(self.records)
+        summary, driver = self.sync([profile_record("ann@usgs.gov", ["hydrology"], title="Research Hydrologist")])
+
+        self.assertEqual(summary["nodes"], {"insert": 0, "update": 1, "delete": 2, "unchanged": 1})
+        self.assertEqual(summary["relationships"], {"insert": 0, "update": 0, "delete": 2, "unchanged": 1})
+
+        retracted_relationships = [row for query, rows in driver.writes if "DELETE r" in query for row in rows]
+        self.assertEqual(
+            sorted((i["start"], i["end"], i["reference"], i["date_qualifier"]) for i in retracted_relationships),
+            [
+                ("ann@usgs.gov", "geology", "https://www.usgs.gov/staff-profiles/ann", "2021-06-01"),
+                ("bob@usgs.gov", "geology", "https://www.usgs.gov/staff-profiles/bob", "2021-06-01")
+            ]
+        )
+        retracted_nodes = [row["key"] for query, rows in driver.writes if "DELETE n" in query for row in rows]
+        self.assertEqual(sorted(retracted_nodes), ["bob@usgs.gov", "geology"])
+
+        query_order = [query.splitlines()[-1] for query, _ in driver.writes]
+        self.assertEqual(query_order, sorted(query_order, key=["SET n += row.properties", "DELETE r", "DELETE n"].index))
+        self.assertEqual(len(self.tracker), 3)
+
+    def test_refetched_relationship_keeps_provenance(self):
+        self.sync(self.records)
+        refetched = profile_record("ann@usgs.gov", ["hydrology", "geology"], date_cached="2021-07-01", title="Hydrologist")
+        self.sync([refetched, self.records[1]])
+
+        summary, driver = self.sync([self.records[1]])
+        retracted_relationships = [row for query, rows in driver.writes if "DELETE r" in query for row in rows]
+        self.assertEqual(sorted(i["date_qualifier"] for i in retracted_relationships), ["2021-06-01", "2021-06-01"])
+
+    def test_dropped_properties_removed(self):
+        self.sync(self.records)
+        summary, driver = self.sync([profile_record("ann@usgs.gov", ["hydrology", "geology"]), self.records[1]])
+
+        self.assertEqual(summary["nodes"]["update"], 1)
+        node_rows = [row for query, rows in driver.writes if "SET n +=" in query for row in rows]
+        self.assertEqual(len(node_rows), 1)
+        self.assertIsNone(node_rows[0]["properties"]["title"])
+        self.assertEqual(node_rows[0]["key"], "ann@usgs.gov")
+
+        # The recorded state doesn't keep the removal, so syncing the same records again changes nothing
+        summary, driver = self.sync([profile_record("ann@usgs.gov", ["hydrology", "geology"]), self.records[1]])
+        self.assertEqual(driver.writes, list())
+
+    def test_failed_sync_not_recorded(self):
+        self.sync(self.records)
+        nodes, relationships = graph.graph_elements([profile_record("cat@usgs.gov", ["ecology"])], label="Person")
+        loader = graph.GraphLoader(LockingDriver(failures=10), max_retries=1, retry_backoff=0)
+        with self.assertRaises(FakeTransientError):
+            loader.sync(self.tracker, nodes, relationships, ensure_schema=False)
+
+        self.assertEqual(len(self.tracker), 7)
+        self.assertEqual(len(self.tracker.changes(nodes, relationships)["nodes"]["insert"]), 2)
+
+    def test_sources_tracked_separately(self):
+        self.sync(self.records)
+        other = graph.ChangeTracker(self.tracker.path, "doi")
+        nodes, relationships = graph.graph_elements(self.records, label="Person")
+        self.assertEqual(len(other.changes(nodes, relationships)["nodes"]["insert"]), 4)
+        other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""Tests for the batch transforms in `pylinkedcmd.isaid`."""
+
+
+import unittest
+
+from pylinkedcmd import isaid
+
+
+def sdc_item(n, **fields):
+    item = {
+        "identifier": f"item{n}",
+        "title": f"Dataset {n}",
+        "description": f"  Measurements for dataset {n}  ",
+        "modified": "2020-05-0{}".format(n % 9 + 1),
+        "issued": "2019",
+        "contactPoint": {"fn": f"Contact {n}", "hasEmail": f"mailto: Contact{n}@usgs.gov"},
+        "authors": [
+            {"authorname": f"Author {n}", "nametype": "Personal", "orcid": f"0000-0000-0000-{n:04d}"},
+            {"authorname": "Water Science Center", "nametype": "Organizational", "orcid": ""},
+            "not an author record"
+        ],
+        "datasource": [{"displayname": "USGS"}, {"name": "no display name"}],
+        "placeKeyword": ["Ohio", "Kentucky"],
+        "usgsThesaurusKeyword": "hydrology",
+        "isoTopicKeyword": ["inlandWaters"],
+        "otherKeyword": ["streamflow", "gages"]
+    }
+    item.update(fields)
+    return item
+
+
+def rowwise_tables(items):
+    # The tables sdc_graph_tables should produce, built from dataset_node_from_sdc_item one item at a time
+    tables = {table: {column: list() for column in columns} for table, columns in isaid.sdc_table_columns.items()}
+
+    def add_row(table, **row):
+        for column in isaid.sdc_table_columns[table]:
+            tables[table][column].append(row.get(column))
+
+    for item in items:
+        node = isaid.dataset_node_from_sdc_item(item)
+        add_row("datasets", **node["properties"])
+
+        relationships = node["relationships"]
+        for poc in relationships["identified_points_of_contact"]:
+            add_row("points_of_contact", identified=True, **poc)
+        for poc in relationships["unidentified_points_of_contact"]:
+            add_row("points_of_contact", identified=False, **poc)
+        for author in relationships["identified_authors"]:
+            add_row("authors", identified=True, **author)
+        for author in relationships["unidentified_authors"]:
+            add_row("authors", identified=False, **author)
+        for table in ["organizations", "places", "defined_terms", "undefined_terms"]:
+            for related in relationships[table]:
+                add_row(table, **related)
+
+    return tables
+
+
+def table_rows(table):
+    return sorted(zip(*table.values()), key=repr)
+
+
+class TestParseIsoDates(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(
+            isaid.parse_iso_dates(["2020-05-01", "2020-05-01T10:30:00", "May 1, 2020", "20200501"]),
+            ["2020-05-01T00:00:00", "2020-05-01T10:30:00", "2020-05-01T00:00:00", "2020-05-01T00:00:00"]
+        )
+
+    def test_unparseable(self):
+        self.assertEqual(isaid.parse_iso_dates(["not a date", "", None]), [None, None, None])
+
+    def test_unhashable_values(self):
+        self.assertEqual(isaid.parse_iso_dates([["2020-05-01", "2020-06-01"], {"date": "2020"}]), [None, None])
+
+    def test_shared_cache(self):
+        parsed = dict()
+        isaid.parse_iso_dates(["2020-05-01"], parsed)
+        self.assertEqual(parsed, {"2020-05-01": "2020-05-01T00:00:00"})
+
+
+class TestSdcGraphTables(unittest.TestCase):
+    def test_matches_rowwise_transform(self):
+        items = [sdc_item(n) for n in range(12)]
+        items.append(sdc_item(12, contactPoint={"fn": "No Email", "hasEmail": "mailto: not-an-email"}))
+        items.append(sdc_item(13, modified="May 3, 2021"))
+        items.append(sdc_item(14, **{"@timestamp": "2021-01-01T00:00:00"}))
+        del items[-1]["modified"]
+        del items[-2]["authors"]
+
+        tables = isaid.sdc_graph_tables(iter(items))
+        expected = rowwise_tables(items)
+        self.assertEqual(set(tables), set(expected))
+        for table in tables:
+            self.assertEqual(list(tables[table]), isaid.sdc_table_columns[table], table)
+            self.assertEqual(table_rows(tables[table]), table_rows(expected[table]), table)
+
+    def test_unusable_modified_dates(self):
+        items = [sdc_item(0, modified=["2020-05-01", "2020-06-01"]), sdc_item(1, modified="not a date")]
+        tables = isaid.sdc_graph_tables(items)
+        self.assertEqual(len(set(tables["datasets"]["last_updated"])), 1)
+        self.assertIsNotNone(tables["datasets"]["last_updated"][0])
+        self.assertIsNotNone(isaid.dataset_node_from_sdc_item(items[0])["properties"]["last_updated"])
+
+    def test_items_not_modified(self):
+        item = sdc_item(0)
+        isaid.sdc_graph_tables([item])
+        self.assertEqual(item, sdc_item(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.pw`, with the Pubs Warehouse API mocked by requests_mock."""
+
+
+import os
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import requests_mock
+
+from pylinkedcmd import pw
+from pylinkedcmd.client import Client
+
+
+class FakePubsWarehouse:
+    '''
+    Serves records in pages the way the publication API does, with page_number counting from 1 and the unnumbered
+    request returning the first page. Page numbers listed in failing_pages answer 500.
+    '''
+    def __init__(self, records, failing_pages=None):
+        self.records = records
+        self.failing_pages = failing_pages or list()
+        self.queries = list()
+
+    def __call__(self, request, context):
+        query = parse_qs(urlparse(request.url).query)
+        self.queries.append(query)
+        page_size = int(query["page_size"][0])
+        page_number = int(query.get("page_number", ["1"])[0])
+
+        if page_number in self.failing_pages:
+            context.status_code = 500
+            return dict()
+
+        start = (page_number - 1) * page_size
+        return {"recordCount": len(self.records), "records": [dict(i) for i in self.records[start:start + page_size]]}
+
+
+def publication(pub_id, title=None):
+    return {"id": pub_id, "title": title or f"Publication {pub_id}"}
+
+
+class PwTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = Client(max_retries=0)
+        sleep = mock.patch("pylinkedcmd.pw.time.sleep")
+        sleep.start()
+        self.addCleanup(sleep.stop)
+        self.addCleanup(self.client.close)
+
+    def mock_api(self, fake_api):
+        mocker = requests_mock.Mocker()
+        mocker.get(pw.publication_api + "/", json=fake_api)
+        mocker.start()
+        self.addCleanup(mocker.stop)
+
+
+class TestIterPwRecords(PwTestCase):
+    def test_all_pages(self):
+        self.mock_api(FakePubsWarehouse([publication(i) for i in range(5)]))
+        records = list(pw.iter_pw_records(page_size=2, max_workers=2, client=self.client))
+        self.assertEqual(sorted(set(i["id"] for i in records)), list(range(5)))
+        self.assertTrue(all("_date_cached" in i for i in records))
+
+    def test_failed_page_warning(self):
+        self.mock_api(FakePubsWarehouse([publication(i) for i in range(5)], failing_pages=[2]))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            records = list(pw.iter_pw_records(page_size=2, retries=1, client=self.client))
+
+        self.assertEqual(sorted(set(i["id"] for i in records)), [0, 1, 4])
+        self.assertEqual(len(caught), 1)
+        self.assertIn("page_number=2", str(caught[0].message))
+
+    def test_failed_page_error_record(self):
+        self.mock_api(FakePubsWarehouse([publication(i) for i in range(5)], failing_pages=[2]))
+        records = list(pw.iter_pw_records(page_size=2, return_errors=True, client=self.client))
+
+        errors = [i for i in records if "error" in i]
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0]["query_url"].endswith("&page_number=2"))
+
+    def test_first_page_failure(self):
+        self.mock_api(FakePubsWarehouse([publication(i) for i in range(5)], failing_pages=[1]))
+        records = list(pw.iter_pw_records(page_size=2, client=self.client))
+        self.assertEqual(len(records), 1)
+        self.assertIn("error", records[0])
+
+
+class TestPwSnapshot(PwTestCase):
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "snapshot.json.gz")
+        self.fake_api = FakePubsWarehouse([publication(i) for i in range(5)])
+        self.mock_api(self.fake_api)
+
+    def test_sync_counts(self):
+        snapshot = pw.PwSnapshot(self.path, q="volcano")
+        report = snapshot.sync(page_size=2, client=self.client)
+        self.assertEqual(
+            report,
+            {"mod_x_days": None, "added": 5, "changed": 0, "unchanged": 0, "failed_pages": list()}
+        )
+        self.assertNotIn("mod_x_days", self.fake_api.queries[0])
+
+        self.fake_api.records[3] = publication(3, "Revised publication 3")
+        self.fake_api.records.append(publication(5))
+        snapshot = pw.PwSnapshot(self.path, q="volcano")
+        report = snapshot.sync(page_size=2, client=self.client)
+
+        self.assertEqual((report["added"], report["changed"], report["unchanged"]), (1, 1, 4))
+        self.assertEqual(self.fake_api.queries[-1]["mod_x_days"], [str(report["mod_x_days"])])
+        self.assertEqual(self.fake_api.queries[-1]["q"], ["volcano"])
+        self.assertEqual(snapshot.records["3"]["title"], "Revised publication 3")
+        self.assertEqual(len(pw.PwSnapshot(self.path, q="volcano").records), 6)
+
+    def test_failed_page_holds_high_water_mark(self):
+        snapshot = pw.PwSnapshot(self.path)
+        snapshot.sync(page_size=2, client=self.client)
+        high_water_mark = snapshot.high_water_mark
+        self.assertIsNotNone(high_water_mark)
+
+        self.fake_api.failing_pages = [3]
+        self.fake_api.records[1] = publication(1, "Revised publication 1")
+        report = snapshot.sync(page_size=2, client=self.client)
+
+        self.assertEqual(len(report["failed_pages"]), 1)
+        self.assertTrue(report["failed_pages"][0]["query_url"].endswith("&page_number=3"))
+        self.assertEqual((report["added"], report["changed"], report["unchanged"]), (0, 1, 3))
+        self.assertEqual(snapshot.high_water_mark, high_water_mark)
+        self.assertEqual(pw.PwSnapshot(self.path).high_water_mark, high_water_mark)
+
+        self.fake_api.failing_pages = list()
+        snapshot.sync(page_size=2, client=self.client)
+        self.assertGreater(snapshot.high_water_mark, high_water_mark)
+
+    def test_different_query(self):
+        pw.PwSnapshot(self.path, q="volcano").sync(page_size=2, client=self.client)
+        with self.assertRaises(ValueError):
+            pw.PwSnapshot(self.path, q="earthquake")
+
+
+if __name__ == "__main__":
+    unittest.main()
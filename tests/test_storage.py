@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.storage`."""
+
+
+import gzip
+import os
+import tempfile
+import unittest
+import warnings
+
+from pylinkedcmd import storage
+
+
+def records(start, stop):
+    return [{"id": f"rec{n}", "title": f"Record {n}", "n": n} for n in range(start, stop)]
+
+
+class TestJsonlStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "cache.jsonl.gz")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def truncate(self, byte_count):
+        with open(self.path, "rb+") as f:
+            f.truncate(os.path.getsize(self.path) - byte_count)
+
+    def test_round_trip(self):
+        store = storage.JsonlStore(self.path)
+        self.assertEqual(store.write(records(0, 25), batch_size=10), 25)
+        self.assertEqual(store.append(iter(records(25, 30))), 5)
+        self.assertEqual(list(store), records(0, 30))
+        self.assertEqual(store.count(), 30)
+        self.assertEqual(list(store.values("n"))[-1], 29)
+
+    def test_projection_and_filter(self):
+        store = storage.JsonlStore(self.path)
+        store.write(records(0, 10))
+        self.assertEqual(
+            list(store.iter_records(fields=["id", "missing"], where=lambda i: i["n"] % 5 == 0)),
+            [{"id": "rec0", "missing": None}, {"id": "rec5", "missing": None}]
+        )
+
+    def test_empty_write(self):
+        store = storage.JsonlStore(self.path)
+        store.write(list())
+        self.assertTrue(store.exists())
+        self.assertEqual(list(store), list())
+
+    def test_write_replaces_only_when_finished(self):
+        store = storage.JsonlStore(self.path)
+        store.write(records(0, 5))
+
+        def failing_fetch():
+            yield from records(5, 8)
+            raise ValueError("fetch failed")
+
+        with self.assertRaises(ValueError):
+            store.write(failing_fetch(), batch_size=2)
+        self.assertEqual(list(store), records(0, 5))
+
+    def test_truncated_batch_read(self):
+        store = storage.JsonlStore(self.path)
+        store.append(records(0, 10))
+        store.append(records(10, 1000))
+        self.truncate(200)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            recovered = list(storage.JsonlStore(self.path))
+        self.assertEqual(len(caught), 1)
+
+        # Every batch before the break comes back whole, along with the complete records decoded from the broken one
+        self.assertGreater(len(recovered), 10)
+        self.assertLess(len(recovered), 1000)
+        self.assertEqual(recovered, records(0, len(recovered)))
+
+    def test_partial_line(self):
+        store = storage.JsonlStore(self.path)
+        store.append(records(0, 3))
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write('{"id": "rec3", "tit')
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.assertEqual(list(store), records(0, 3))
+        self.assertEqual(len(caught), 1)
+
+    def test_append_after_truncation(self):
+        store = storage.JsonlStore(self.path)
+        store.append(records(0, 10))
+        store.append(records(10, 1000))
+        self.truncate(200)
+
+        resumed_store = storage.JsonlStore(self.path)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            kept = resumed_store.count()
+            resumed_store.append(records(kept, 1200))
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.assertEqual(list(resumed_store), records(0, 1200))
+        self.assertEqual(caught, list())
+
+
+if __name__ == "__main__":
+    unittest.main()
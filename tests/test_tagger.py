@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.tagger`."""
+
+
+import re
+import unittest
+
+from pylinkedcmd.tagger import VocabularyTagger
+
+
+def concept(label, concept_label, source="Test"):
+    return {"label": label, "concept_label": concept_label, "source": source}
+
+
+vocabulary = [
+    concept("Ohio", "place"),
+    concept("Ohio River", "place"),
+    concept("River", "feature"),
+    concept("C++", "language"),
+    concept(".NET", "framework"),
+    concept("U.S. Geological Survey", "organization"),
+    concept("ohio", "other", source="Other")
+]
+
+
+class TestVocabularyTagger(unittest.TestCase):
+    def setUp(self):
+        self.tagger = VocabularyTagger(vocabulary)
+
+    def test_tag(self):
+        text = "Sampling on the Ohio River by the U.S. Geological Survey"
+        self.assertEqual(
+            self.tagger.tag(text),
+            [(16, 26, "place"), (34, 56, "organization")]
+        )
+        self.assertEqual(text[16:26], "Ohio River")
+
+    def test_leftmost_longest(self):
+        self.assertEqual([i[2] for i in self.tagger.tag("Ohio River")], ["place"])
+        self.assertEqual(self.tagger.tag("River Ohio"), [(0, 5, "feature"), (6, 10, "place")])
+
+    def test_word_boundaries(self):
+        self.assertEqual(self.tagger.tag("Ohioan rivers"), list())
+        self.assertEqual(self.tagger.tag("(Ohio)"), [(1, 5, "place")])
+        self.assertEqual(len(VocabularyTagger(vocabulary, word_boundaries=False).tag("Ohioan")), 1)
+
+    def test_same_as_regex_for_word_labels(self):
+        texts = ["Ohio", "Ohioan", "in Ohio.", "Ohio_1", "xOhio", "Ohio-based", "Ohio2"]
+        for text in texts:
+            regex_spans = [(m.start(), m.end()) for m in re.finditer(r"\bOhio\b", text)]
+            self.assertEqual([i[:2] for i in self.tagger.tag(text)], regex_spans, text)
+
+    def test_labels_ending_in_punctuation(self):
+        # \b after "C++" needs a word character to follow, so a regex would miss these
+        self.assertEqual(re.findall(r"\bC\+\+\b", "C++ code"), list())
+        self.assertEqual(self.tagger.tag("C++ code"), [(0, 3, "language")])
+        self.assertEqual(self.tagger.tag("the .NET runtime"), [(4, 8, "framework")])
+        self.assertEqual(self.tagger.tag("ASP.NETCore"), list())
+        self.assertEqual(self.tagger.tag("xC++"), list())
+
+    def test_regex_metacharacters_literal(self):
+        self.assertEqual(self.tagger.tag("U.S. Geological Survey"), [(0, 22, "organization")])
+        self.assertEqual(self.tagger.tag("UxSx Geological Survey"), list())
+
+    def test_ignore_case(self):
+        self.assertEqual(self.tagger.tag("OHIO"), list())
+        self.assertEqual(VocabularyTagger(vocabulary, ignore_case=True).tag("OHIO"), [(0, 4, "place")])
+
+    def test_duplicate_labels(self):
+        tagger = VocabularyTagger(vocabulary, ignore_case=True)
+        ohio = tagger.labels.index("Ohio")
+        self.assertEqual(tagger.concept_labels[ohio], "place")
+        self.assertEqual([i["source"] for i in tagger.references[ohio]], ["Test", "Other"])
+
+    def test_reference_sources(self):
+        tagger = VocabularyTagger(vocabulary, reference_sources=["Other"])
+        self.assertEqual(len(tagger), 1)
+        self.assertEqual(tagger.tag("ohio"), [(0, 4, "other")])
+
+    def test_ner_training_data(self):
+        self.assertEqual(
+            list(self.tagger.ner_training_data(["Ohio", "nothing here"])),
+            [["Ohio", {"entities": [[0, 4, "place"]]}]]
+        )
+
+
+class TestAnnotate(unittest.TestCase):
+    def setUp(self):
+        self.tagger = VocabularyTagger(vocabulary)
+
+    def test_records_in_order(self):
+        records = [
+            {"id": n, "description": "Ohio River survey" if n % 3 else "no labels"}
+            for n in range(50)
+        ]
+        annotated = list(self.tagger.annotate(iter(records), processes=2, chunk_size=4))
+
+        self.assertEqual([i["id"] for i in annotated], list(range(50)))
+        for record, result in zip(records, annotated):
+            self.assertEqual(result["entities"], self.tagger.tag(record["description"]))
+            self.assertNotIn("entities", record)
+
+    def test_strings_and_missing_text(self):
+        annotated = list(self.tagger.annotate(
+            ["C++ code", {"title": "Ohio"}, {"abstract": "Ohio", "id": 1}],
+            text_key="abstract",
+            processes=1
+        ))
+        self.assertEqual(annotated[0], {"text": "C++ code", "entities": [(0, 3, "language")]})
+        self.assertEqual(annotated[1], {"title": "Ohio", "entities": list()})
+        self.assertEqual(annotated[2]["entities"], [(0, 4, "place")])
+
+    def test_stats_and_progress(self):
+        progress_records = list()
+        texts = ["Ohio River"] * 10
+        list(self.tagger.annotate(
+            texts,
+            processes=2,
+            chunk_size=3,
+            progress=lambda stats: progress_records.append(stats["records"])
+        ))
+        self.assertEqual(progress_records, [3, 6, 9, 10])
+        self.assertEqual(self.tagger.annotate_stats["chunks"], 4)
+        self.assertEqual(self.tagger.annotate_stats["spans"], 10)
+
+    def test_empty_input(self):
+        self.assertEqual(list(self.tagger.annotate(list(), processes=1)), list())
+
+
+if __name__ == "__main__":
+    unittest.main()
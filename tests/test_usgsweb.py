@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.usgsweb` against HTML fixtures served by an in-memory stand-in for www.usgs.gov."""
+
+
+import threading
+import unittest
+
+from pylinkedcmd import usgsweb
+
+listing_url = "https://www.usgs.gov/connect/staff-profiles"
+
+listing_page = '''<html><body>
+<div class="view-content">
+  <div class="views-column">
+    <h4 class="field-content"><a href="/staff-profiles/{0}-doe">	{1} Doe </a></h4>
+    <b>Research Geologist</b>
+    <a href="https://www.usgs.gov/centers/volcanoes">Volcano Science Center</a>
+    <a href="mailto:{0}doe@usgs.gov">{0}Doe@usgs.gov</a>
+    <a href="tel:+1 555-0100">555-0100</a>
+  </div>
+  <div class="views-column">
+    <h4 class="field-content">Unlinked Person</h4>
+  </div>
+  <div class="views-column">
+    <h4 class="field-content"><a href="/staff-profiles/{0}-roe">{1} Roe</a></h4>
+  </div>
+</div>
+<a title="Go to last page" href="/connect/staff-profiles?page=1">last</a>
+</body></html>'''
+
+profile_page = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{name}</title></head><body>
+<div class="full-width col-sm-12"><h1 class="page-header">{name}</h1></div>
+<h2 class="staff-profile-title">Research Geologist</h2>
+<h3 class="staff-profile-subtitle h4"><a href=" https://www.usgs.gov/centers/volcanoes ">Volcano Science Center</a></h3>
+<img class="staff-profile-image img-responsive" src="https://www.usgs.gov/images/{slug}.jpg">
+<div class="email"><a href="mailto:{slug}@usgs.gov"> {slug}@USGS.gov </a></div>
+<a href="https://orcid.org/0000-0002-1825-0097">https://orcid.org/0000-0002-1825-0097</a>
+<div class="lead"> Studies lava flows on Kīlauea &amp; Mauna Loa. </div>
+<section class="block staff-expertise">
+  <a href="/science-explorer-results?es=Volcanology">Volcanology</a>
+  <a href="/science-explorer-results?es=Geochemistry"> Geochemistry </a>
+  <a href="/other">Not expertise</a>
+</section>
+<div class="field usgs-body">
+  <p>Biography with a <a href="https://example.org/paper">paper</a>.</p>
+</div>
+<div class="entity entity-field-collection-item field-collection-item-field-non-usgs-publication clearfix">
+  <a href="https://doi.org/10.1000/one">First outside publication</a>
+  <a href="https://doi.org/10.1000/two">Second outside publication</a>
+</div>
+</body></html>'''
+
+
+class FakeResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.fetched_at = "2021-03-01T00:00:00"
+
+
+class FakeUsgsWeb:
+    '''
+    Serves a two page staff listing and a profile page for each person on it; paths listed in failing get a 500.
+    '''
+    def __init__(self, failing=None):
+        self.pages = {
+            f"{listing_url}?page={n}": listing_page.format(slug, slug.title()).encode("utf-8")
+            for n, slug in enumerate(["jane", "john"])
+        }
+        self.pages[listing_url] = self.pages[f"{listing_url}?page=0"]
+        for slug in ["jane-doe", "jane-roe", "john-doe", "john-roe"]:
+            self.pages[f"https://www.usgs.gov/staff-profiles/{slug}"] = profile_page.format(
+                name=slug.replace("-", " ").title(), slug=slug
+            ).encode("utf-8")
+        self.failing = failing or list()
+        self.requests = list()
+        self.lock = threading.Lock()
+        self.cache = None
+
+    def get(self, url):
+        with self.lock:
+            self.requests.append(url)
+        if url in self.failing or url not in self.pages:
+            return FakeResponse(500, b"")
+        return FakeResponse(200, self.pages[url])
+
+
+class TestParsers(unittest.TestCase):
+    def parse_with(self, parser):
+        scraper = usgsweb.UsgsWeb(client=FakeUsgsWeb(), parser=parser)
+        profile_url = "https://www.usgs.gov/staff-profiles/jane-doe"
+        return (
+            scraper.parse_profile(profile_url, scraper.client.pages[profile_url], "2021-03-01T00:00:00"),
+            scraper.parse_staff_listing(scraper.client.pages[listing_url], "2021-03-01T00:00:00")
+        )
+
+    def test_profile(self):
+        profile, listing = self.parse_with("html.parser")
+
+        self.assertEqual(profile["display_name"], "Jane Doe")
+        self.assertEqual(profile["title"], "Research Geologist")
+        self.assertEqual(profile["description"], "Studies lava flows on Kīlauea & Mauna Loa.")
+        self.assertEqual(profile["email"], "jane-doe@usgs.gov")
+        self.assertEqual(profile["organization_name"], "Volcano Science Center")
+        self.assertEqual(profile["organization_link"], "https://www.usgs.gov/centers/volcanoes")
+        self.assertEqual(profile["profile_image_url"], "https://www.usgs.gov/images/jane-doe.jpg")
+        self.assertEqual(profile["orcid"], "0000-0002-1825-0097")
+        self.assertEqual(profile["expertise"], ["Volcanology", "Geochemistry"])
+        self.assertEqual(
+            [i["link_href"] for i in profile["body_content_links"]],
+            ["https://doi.org/10.1000/one", "https://doi.org/10.1000/two"]
+        )
+
+        self.assertEqual([i["name"] for i in listing], ["Jane Doe", "Jane Roe"])
+        self.assertEqual(listing[0]["email"], "janedoe@usgs.gov")
+        self.assertEqual(listing[0]["telephone"], "555-0100")
+        self.assertEqual(listing[0]["title"], "Research Geologist")
+        self.assertEqual(listing[0]["organization_name"], "Volcano Science Center")
+        self.assertIsNone(listing[1]["email"])
+
+    def test_backends_identical(self):
+        expected = self.parse_with("html.parser")
+        for parser in ["lxml", "lxml-xpath"]:
+            self.assertEqual(self.parse_with(parser), expected, parser)
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            usgsweb.UsgsWeb(client=FakeUsgsWeb(), parser="html5lib")
+
+
+class TestCrawlStaff(unittest.TestCase):
+    def test_crawl(self):
+        fake_web = FakeUsgsWeb(failing=["https://www.usgs.gov/staff-profiles/john-roe"])
+        scraper = usgsweb.UsgsWeb(client=fake_web)
+        profiles = list(scraper.crawl_staff(max_workers=2, processes=1, return_errors=True))
+
+        self.assertEqual(
+            sorted(i.get("profile", i.get("url")) for i in profiles),
+            [f"https://www.usgs.gov/staff-profiles/{i}" for i in ["jane-doe", "jane-roe", "john-doe", "john-roe"]]
+        )
+        self.assertEqual(
+            scraper.crawl_stats,
+            {
+                "listing_pages": 2,
+                "listing_errors": 0,
+                "profiles": 3,
+                "profile_errors": 1,
+                "profiles_new": 3,
+                "profiles_changed": 0,
+                "profiles_unchanged": 0
+            }
+        )
+        self.assertEqual(
+            next(i for i in profiles if i.get("profile", "").endswith("jane-doe")),
+            scraper.parse_profile(
+                "https://www.usgs.gov/staff-profiles/jane-doe",
+                fake_web.pages["https://www.usgs.gov/staff-profiles/jane-doe"],
+                "2021-03-01T00:00:00"
+            )
+        )
+
+    def test_recrawl_unchanged(self):
+        fake_web = FakeUsgsWeb()
+        scraper = usgsweb.UsgsWeb(client=fake_web)
+        first_crawl = list(scraper.crawl_staff(max_workers=2, processes=1))
+        self.assertEqual(scraper.crawl_stats["profiles_new"], 4)
+
+        second_crawl = list(scraper.crawl_staff(max_workers=2, processes=1, previous_profiles=first_crawl))
+        self.assertEqual(
+            (scraper.crawl_stats["profiles"], scraper.crawl_stats["profiles_new"], scraper.crawl_stats["profiles_changed"], scraper.crawl_stats["profiles_unchanged"]),
+            (4, 0, 0, 4)
+        )
+        self.assertTrue(all(any(i is j for j in first_crawl) for i in second_crawl))
+
+        changed_url = "https://www.usgs.gov/staff-profiles/john-doe"
+        fake_web.pages[changed_url] = fake_web.pages[changed_url].replace(b"Research Geologist", b"Supervisory Geologist")
+        third_crawl = list(scraper.crawl_staff(max_workers=2, processes=1, previous_profiles=first_crawl))
+        self.assertEqual((scraper.crawl_stats["profiles_changed"], scraper.crawl_stats["profiles_unchanged"]), (1, 3))
+        self.assertEqual(next(i for i in third_crawl if i["profile"] == changed_url)["title"], "Supervisory Geologist")
+
+    def test_listing_error(self):
+        fake_web = FakeUsgsWeb(failing=[f"{listing_url}?page=1"])
+        scraper = usgsweb.UsgsWeb(client=fake_web)
+        profiles = list(scraper.crawl_staff(max_workers=2, processes=1))
+
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual((scraper.crawl_stats["listing_pages"], scraper.crawl_stats["listing_errors"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.utilities` identifier handling."""
+
+
+import unittest
+
+from pylinkedcmd import utilities
+
+
+class TestActionableId(unittest.TestCase):
+    """Tests for actionable_id and actionable_ids."""
+
+    def test_staff_profile_url(self):
+        self.assertEqual(
+            utilities.actionable_id("https://www.usgs.gov/staff-profiles/sky-bristol?qt-staff_profile=0"),
+            {
+                "url": "https://www.usgs.gov/staff-profiles/sky-bristol?qt-staff_profile=0",
+                "profile": "https://www.usgs.gov/staff-profiles/sky-bristol"
+            }
+        )
+
+    def test_staff_profile_path_without_scheme_is_not_a_url(self):
+        self.assertIsNone(utilities.actionable_id("www.usgs.gov/staff-profiles/sky-bristol"))
+
+    def test_other_url(self):
+        self.assertIsNone(utilities.actionable_id("https://www.usgs.gov/centers/core-science-systems"))
+
+    def test_email(self):
+        self.assertEqual(utilities.actionable_id("sbristol@usgs.gov"), {"email": "sbristol@usgs.gov"})
+
+    def test_invalid_email(self):
+        self.assertIsNone(utilities.actionable_id("a@b@c.com"))
+
+    def test_doi_url(self):
+        self.assertEqual(
+            utilities.actionable_id("https://doi.org/10.5066/p9abc123"),
+            {"doi": "10.5066/p9abc123", "url": "https://doi.org/10.5066/P9ABC123"}
+        )
+
+    def test_doi_without_resolver(self):
+        self.assertEqual(
+            utilities.actionable_id("doi:10.1016/j.jhydrol.2020.125", return_resolver=False),
+            {"doi": "10.1016/j.jhydrol.2020.125"}
+        )
+
+    def test_doi_must_run_to_end_of_string(self):
+        self.assertIsNone(utilities.actionable_id("10.1234/abc def"))
+
+    def test_doi_prefix_dot_matches_any_character(self):
+        self.assertEqual(
+            utilities.actionable_id("10x1234/abc"),
+            {"doi": "10x1234/abc", "url": "https://doi.org/10X1234/ABC"}
+        )
+
+    def test_doi_wins_over_email_that_fails_validation(self):
+        self.assertEqual(
+            utilities.actionable_id("user@10.1234/abc"),
+            {"doi": "10.1234/abc", "url": "https://doi.org/10.1234/ABC"}
+        )
+
+    def test_orcid(self):
+        self.assertEqual(
+            utilities.actionable_id("0000-0002-1234-567x"),
+            {"orcid": "0000-0002-1234-567x", "url": "https://orcid.org/0000-0002-1234-567X"}
+        )
+
+    def test_doi_checked_before_orcid(self):
+        self.assertEqual(
+            utilities.actionable_id("0000-0003-1682-4031 10.1234/xyz"),
+            {"doi": "10.1234/xyz", "url": "https://doi.org/10.1234/XYZ"}
+        )
+
+    def test_orcid_when_doi_does_not_reach_end(self):
+        self.assertEqual(
+            utilities.actionable_id("10.1234/x https://orcid.org/0000-0003-1682-4031"),
+            {"orcid": "0000-0003-1682-4031", "url": "https://orcid.org/0000-0003-1682-4031"}
+        )
+
+    def test_unrecognized(self):
+        self.assertIsNone(utilities.actionable_id(""))
+        self.assertIsNone(utilities.actionable_id("Hello"))
+
+    def test_non_string_raises(self):
+        with self.assertRaises(TypeError):
+            utilities.actionable_id(None)
+
+    def test_memoized_results_are_copies(self):
+        first = utilities.actionable_id("sbristol@usgs.gov")
+        first["email"] = "changed"
+        self.assertEqual(utilities.actionable_id("sbristol@usgs.gov"), {"email": "sbristol@usgs.gov"})
+
+    def test_actionable_ids_matches_actionable_id(self):
+        identifier_strings = [
+            "sbristol@usgs.gov",
+            "Hello",
+            "https://doi.org/10.5066/p9abc123",
+            "sbristol@usgs.gov",
+            "0000-0002-1234-567x"
+        ]
+        self.assertEqual(
+            utilities.actionable_ids(identifier_strings),
+            [utilities.actionable_id(i) for i in identifier_strings]
+        )
+
+    def test_actionable_ids_results_are_independent(self):
+        results = utilities.actionable_ids(["sbristol@usgs.gov", "sbristol@usgs.gov"])
+        results[0]["email"] = "changed"
+        self.assertEqual(results[1], {"email": "sbristol@usgs.gov"})
+
+
+class TestIterDois(unittest.TestCase):
+    """Tests for iter_dois and doi_from_string."""
+
+    def test_normalizes_and_dedupes(self):
+        self.assertEqual(
+            utilities.doi_from_string(
+                "See https://doi.org/10.1002/abc.123/abstract. and 10.1002/ABC.123, also 10.5066/P9X1Y2Z3."
+            ),
+            ["10.1002/abc.123", "10.5066/P9X1Y2Z3"]
+        )
+
+    def test_doi_spanning_chunks(self):
+        text = "lorem ipsum " * 20 + "doi:10.5066/P9ABCDEF trailing text"
+        for chunk_size in [3, 7, 16]:
+            self.assertEqual(list(utilities.iter_dois(text, chunk_size=chunk_size)), ["10.5066/P9ABCDEF"])
+
+    def test_file_like_bytes(self):
+        import io
+        stream = io.BytesIO(("x " * 100000 + "10.1016/j.jhydrol.2020.125 " + "y " * 100000).encode("utf-8"))
+        self.assertEqual(list(utilities.iter_dois(stream, chunk_size=4096)), ["10.1016/j.jhydrol.2020.125"])
+
+    def test_raw_matches_without_cleanup(self):
+        self.assertEqual(
+            list(utilities.iter_dois("10.1002/abc/full. 10.1002/abc/full.", normalize=False, dedupe=False)),
+            ["10.1002/abc/full.", "10.1002/abc/full."]
+        )
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+
+"""Tests for `pylinkedcmd.wikidata`, with the SPARQL service mocked by requests_mock."""
+
+
+import bz2
+import copy
+import gzip
+import itertools
+import json
+import os
+import re
+import tempfile
+import unittest
+import warnings
+from urllib.parse import parse_qs, urlparse
+
+import requests_mock
+
+from pylinkedcmd import wikidata
+from pylinkedcmd.client import Client
+
+wd_api = "https://query.wikidata.org/sparql"
+
+wd_source = {
+    "source_label": "Test Volcanos",
+    "concept_label": "NAMED_VOLCANO",
+    "retrieval_type": "source relationship",
+    "source_reference": "https://www.wikidata.org/wiki/Q8072",
+    "source_rel": "P31",
+    "include_alt_names": True
+}
+
+
+def item_binding(n):
+    binding = {
+        "item": {"type": "uri", "value": f"http://www.wikidata.org/entity/Q{n}"},
+        "itemLabel": {"xml:lang": "en", "type": "literal", "value": f"Volcano \"{n}\" é"},
+        "itemDescription": {"xml:lang": "en", "type": "literal", "value": f"volcano number {n}"}
+    }
+    if n % 2 == 0:
+        binding["itemAltLabel"] = {"xml:lang": "en", "type": "literal", "value": f"Mount {n}, Peak {n}"}
+    return binding
+
+
+def item_bindings(item_count):
+    return [item_binding(n) for n in range(item_count)]
+
+
+def sparql_json(bindings):
+    return json.dumps({
+        "head": {"vars": ["item", "itemLabel", "itemDescription", "itemAltLabel"]},
+        "results": {"bindings": bindings}
+    })
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeWikidata:
+    '''
+    Answers the COUNT query and the paged item queries get_wd_concepts sends, recording the pages asked for.
+    '''
+    def __init__(self, bindings, truncate_offset=None):
+        self.bindings = bindings
+        self.truncate_offset = truncate_offset
+        self.pages = list()
+
+    def __call__(self, request, context):
+        query = parse_qs(urlparse(request.url).query)["query"][0]
+        if "COUNT" in query:
+            return sparql_json([{"count": {"datatype": "http://www.w3.org/2001/XMLSchema#integer", "type": "literal", "value": str(len(self.bindings))}}])
+
+        limit, offset = [int(i) for i in re.search(r"LIMIT (\d+) OFFSET (\d+)", query).groups()]
+        self.pages.append((offset, limit))
+        body = sparql_json(self.bindings[offset:offset + limit])
+        if offset == self.truncate_offset:
+            body = body[:len(body) // 2]
+        return body
+
+
+class TestSparqlBindings(unittest.TestCase):
+    def test_whole_response(self):
+        bindings = [item_binding(n) for n in range(5)]
+        self.assertEqual(list(wikidata._iter_sparql_bindings([sparql_json(bindings)])), bindings)
+
+    def test_any_chunk_boundary(self):
+        bindings = [item_binding(n) for n in range(4)]
+        text = sparql_json(bindings)
+        # Chunk sizes down to one character split bindings, keys and escape sequences at every possible point
+        for size in [1, 2, 3, 7, 16, 50]:
+            self.assertEqual(list(wikidata._iter_sparql_bindings(chunked(text, size))), bindings, size)
+
+    def test_split_escape(self):
+        text = sparql_json([item_binding(1)])
+        split_at = text.index("\\\"") + 1
+        self.assertEqual(
+            list(wikidata._iter_sparql_bindings([text[:split_at], text[split_at:]])),
+            [item_binding(1)]
+        )
+
+    def test_no_bindings(self):
+        self.assertEqual(list(wikidata._iter_sparql_bindings(chunked(sparql_json(list()), 3))), list())
+        self.assertEqual(list(wikidata._iter_sparql_bindings(list())), list())
+
+    def test_truncated_stream(self):
+        bindings = [item_binding(n) for n in range(4)]
+        text = sparql_json(bindings)
+        truncated = text[:text.index("Q3")]
+
+        parsed = list()
+        with self.assertRaises(ValueError):
+            for binding in wikidata._iter_sparql_bindings(chunked(truncated, 10)):
+                parsed.append(binding)
+        self.assertEqual(parsed, bindings[:3])
+
+
+class TestGetWdConcepts(unittest.TestCase):
+    def setUp(self):
+        self.client = Client(max_retries=0)
+
+    def tearDown(self):
+        self.client.close()
+
+    def get_wd_concepts(self, fake_wikidata, **kwargs):
+        with requests_mock.Mocker() as m:
+            m.get(wd_api, text=fake_wikidata)
+            return wikidata.get_wd_concepts(
+                wd_source["source_label"],
+                wd_reference=[wd_source],
+                max_workers=2,
+                client=self.client,
+                **kwargs
+            )
+
+    def test_pages_from_count(self):
+        fake_wikidata = FakeWikidata(item_bindings(5))
+        concepts = self.get_wd_concepts(fake_wikidata, page_size=2)
+
+        self.assertEqual(sorted(fake_wikidata.pages), [(0, 2), (2, 2), (4, 1)])
+        preferred = [i for i in concepts if i["label_source"] == "preferred"]
+        alternate = [i for i in concepts if i["label_source"] == "alternate"]
+        self.assertEqual(concepts, preferred + alternate)
+        self.assertEqual(
+            [i["identifier"] for i in preferred],
+            [f"http://www.wikidata.org/entity/Q{n}" for n in range(5)]
+        )
+        self.assertEqual([i["label"] for i in alternate], ["Mount 0", "Peak 0", "Mount 2", "Peak 2", "Mount 4", "Peak 4"])
+        self.assertEqual(preferred[1]["label"], "Volcano \"1\" é")
+
+    def test_limit_warning(self):
+        fake_wikidata = FakeWikidata(item_bindings(5))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            concepts = self.get_wd_concepts(fake_wikidata, page_size=2, limit=3)
+
+        self.assertEqual(sorted(fake_wikidata.pages), [(0, 2), (2, 1)])
+        self.assertEqual(len([i for i in concepts if i["label_source"] == "preferred"]), 3)
+        self.assertEqual(len(caught), 1)
+        self.assertIn("has 5 items; only the first 3 were retrieved", str(caught[0].message))
+
+    def test_no_warning_under_limit(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.get_wd_concepts(FakeWikidata(item_bindings(3)), page_size=2, limit=3)
+        self.assertEqual(caught, list())
+
+    def test_truncated_page(self):
+        self.assertIsNone(self.get_wd_concepts(FakeWikidata(item_bindings(5), truncate_offset=2), page_size=2))
+
+        error = self.get_wd_concepts(FakeWikidata(item_bindings(5), truncate_offset=2), page_size=2, return_errors=True)
+        self.assertEqual(error["source"], wd_source["source_label"])
+        self.assertIsInstance(error["error"], ValueError)
+
+    def test_http_error(self):
+        with requests_mock.Mocker() as m:
+            m.get(wd_api, status_code=500)
+            error = wikidata.get_wd_concepts(
+                wd_source["source_label"],
+                wd_reference=[wd_source],
+                return_errors=True,
+                client=self.client
+            )
+        self.assertEqual(error, {"source": wd_source["source_label"], "error": "HTTP Status Code: 500"})
+
+
+def statement(prop, qid, rank="normal"):
+    return {
+        "mainsnak": {"snaktype": "value", "property": prop, "datavalue": {"value": {"entity-type": "item", "id": qid}, "type": "wikibase-entityid"}},
+        "type": "statement",
+        "rank": rank
+    }
+
+
+def dump_entity(qid, label=None, description=None, aliases=None, claims=None):
+    entity = {"type": "item", "id": qid, "labels": dict(), "descriptions": dict(), "aliases": dict(), "claims": claims or dict()}
+    if label is not None:
+        entity["labels"]["en"] = {"language": "en", "value": label}
+        entity["labels"]["de"] = {"language": "de", "value": f"{label} (de)"}
+    if description is not None:
+        entity["descriptions"]["en"] = {"language": "en", "value": description}
+    if aliases is not None:
+        entity["aliases"]["en"] = [{"language": "en", "value": i} for i in aliases]
+    return entity
+
+
+commodity_source = {
+    "source_label": "Test Commodities",
+    "concept_label": "GEOLOGIC_COMMODITY_OR_MATERIAL",
+    "retrieval_type": "identifier list",
+    "source_reference": "Wikidata specific identifiers",
+    "identifier_list": ["Q83437", "Q223995"],
+    "include_alt_names": True
+}
+
+dump_entities = [
+    dump_entity("Q188", "Kīlauea", "volcano in Hawaii", ["Kilauea", "Kīlauea"], {"P31": [statement("P31", "Q8072")]}),
+    dump_entity("Q189", "Mauna Loa", None, ["Mokuaweoweo"], {"P31": [statement("P31", "Q8072")]}),
+    dump_entity("Q190", "Old Volcano", "no longer a volcano", None, {"P31": [statement("P31", "Q8072", "deprecated")]}),
+    dump_entity("Q191", "Cinder Cone", "cone", None, {"P31": [statement("P31", "Q8072"), statement("P31", "Q5", "preferred")]}),
+    dump_entity("Q192", None, None, None, {"P31": [statement("P31", "Q8072")]}),
+    dump_entity("Q223995", "Sand", "granular material", ["Sands"]),
+    dump_entity("Q83437", "Gravel", "loose rock", None),
+    dump_entity("Q5", "Human", "person", None),
+]
+
+# Label service rows for the entities the SPARQL path would match, in the ?item order it pages them in
+sparql_bindings = {
+    wd_source["source_label"]: [
+        {
+            "item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q188"},
+            "itemLabel": {"xml:lang": "en", "type": "literal", "value": "Kīlauea"},
+            "itemDescription": {"xml:lang": "en", "type": "literal", "value": "volcano in Hawaii"},
+            "itemAltLabel": {"xml:lang": "en", "type": "literal", "value": "Kilauea, Kīlauea"}
+        },
+        {
+            "item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q189"},
+            "itemLabel": {"xml:lang": "en", "type": "literal", "value": "Mauna Loa"},
+            "itemAltLabel": {"xml:lang": "en", "type": "literal", "value": "Mokuaweoweo"}
+        },
+        {
+            "item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q192"},
+            "itemLabel": {"type": "literal", "value": "Q192"}
+        }
+    ],
+    commodity_source["source_label"]: [
+        {
+            "item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q223995"},
+            "itemLabel": {"xml:lang": "en", "type": "literal", "value": "Sand"},
+            "itemDescription": {"xml:lang": "en", "type": "literal", "value": "granular material"},
+            "itemAltLabel": {"xml:lang": "en", "type": "literal", "value": "Sands"}
+        },
+        {
+            "item": {"type": "uri", "value": "http://www.wikidata.org/entity/Q83437"},
+            "itemLabel": {"xml:lang": "en", "type": "literal", "value": "Gravel"},
+            "itemDescription": {"xml:lang": "en", "type": "literal", "value": "loose rock"}
+        }
+    ]
+}
+
+
+def without_stamps(concepts):
+    return [{k: v for k, v in i.items() if k != "_date_cached"} for i in concepts]
+
+
+class TestReadWdDump(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.dump_lines = "[\n" + ",\n".join(json.dumps(i, ensure_ascii=False) for i in dump_entities) + "\n]\n"
+
+    def write_dump(self, file_name, opener):
+        dump_path = os.path.join(self.temp_dir.name, file_name)
+        with opener(dump_path, "wt", encoding="utf-8") as f:
+            f.write(self.dump_lines)
+        return dump_path
+
+    def sparql_concepts(self, source):
+        client = Client(max_retries=0)
+        with requests_mock.Mocker() as m:
+            m.get(wd_api, text=FakeWikidata(sparql_bindings[source]))
+            concepts = wikidata.get_wd_concepts(source, wd_reference=[wd_source, commodity_source], client=client)
+        client.close()
+        return concepts
+
+    def test_matches_sparql(self):
+        sources = [wd_source["source_label"], commodity_source["source_label"]]
+        for dump_path in [self.write_dump("dump.json.gz", gzip.open), self.write_dump("dump.json.bz2", bz2.open)]:
+            dump_concepts = wikidata.read_wd_dump(
+                dump_path,
+                sources=sources,
+                wd_reference=[wd_source, commodity_source],
+                processes=1,
+                batch_size=3
+            )
+            self.assertEqual(list(dump_concepts.keys()), sources)
+            for source in sources:
+                self.assertEqual(without_stamps(dump_concepts[source]), without_stamps(self.sparql_concepts(source)))
+
+        volcano_labels = [i["label"] for i in dump_concepts[wd_source["source_label"]]]
+        self.assertEqual(volcano_labels, ["Kīlauea", "Mauna Loa", "Kilauea", "Mokuaweoweo"])
+        self.assertEqual(
+            [i["label"] for i in dump_concepts[commodity_source["source_label"]]],
+            ["Sand", "Gravel", "Sands"]
+        )
+
+    def test_plain_dump(self):
+        dump_path = self.write_dump("dump.json", open)
+        dump_concepts = wikidata.read_wd_dump(
+            dump_path,
+            sources=[wd_source["source_label"]],
+            wd_reference=[wd_source, commodity_source],
+            processes=2
+        )
+        self.assertEqual(list(dump_concepts.keys()), [wd_source["source_label"]])
+        self.assertEqual(len(dump_concepts[wd_source["source_label"]]), 4)
+
+
+def quadratic_uncertainty_factor(wd_reference_list):
+    '''
+    The original implementation of wd_reference_uncertainty_factor, kept here as the reference for its results.
+    '''
+    wd_reference_labels = [i["label"] for i in wd_reference_list]
+    duplicate_labels = dict(
+        (x, wikidata.duplicates(wd_reference_labels, x)) for x in set(wd_reference_labels) if wd_reference_labels.count(x) > 1
+    )
+
+    for wd_ref in [i for i in wd_reference_list if i["label"] in duplicate_labels.keys()]:
+        wd_ref.update(
+            {
+                "uncertainty_factor": len(duplicate_labels[wd_ref["label"]]),
+                "uncertainty_see_also": [
+                    i["identifier"] for index, i in enumerate(wd_reference_list) 
+                    if index in duplicate_labels[wd_ref["label"]]
+                    and i["identifier"] != wd_ref["identifier"]
+                ]
+            }
+        )
+
+    return wd_reference_list
+
+
+def reference_item(label, identifier, source, label_source="preferred"):
+    return {
+        "label": label,
+        "identifier": f"http://www.wikidata.org/entity/{identifier}",
+        "source": source,
+        "label_source": label_source
+    }
+
+
+uncertainty_reference = [
+    reference_item("Mercury", "Q308", "Planets"),
+    reference_item("Mercury", "Q925", "Chemical Elements"),
+    reference_item("Hg", "Q925", "Chemical Elements", "alternate"),
+    reference_item("Iron", "Q677", "Chemical Elements"),
+    reference_item("Mercury", "Q308", "Roman Gods"),
+    reference_item("Georgia", "Q1428", "US States"),
+    reference_item("Georgia", "Q230", "Sovereign States"),
+    reference_item("Kilauea", "Q188", "Volcanos"),
+]
+
+new_reference_items = [
+    reference_item("Iron", "Q677", "Commodities"),
+    reference_item("Mercury", "Q925", "Commodities"),
+    reference_item("Mauna Loa", "Q189", "Volcanos"),
+    reference_item("Iron", "Q1999", "Films"),
+]
+
+
+class TestUncertaintyFactor(unittest.TestCase):
+    def test_matches_quadratic(self):
+        expected = quadratic_uncertainty_factor(copy.deepcopy(uncertainty_reference))
+        self.assertEqual(wikidata.wd_reference_uncertainty_factor(copy.deepcopy(uncertainty_reference)), expected)
+
+        mercury = [i for i in expected if i["label"] == "Mercury"]
+        self.assertEqual([i["uncertainty_factor"] for i in mercury], [3, 3, 3])
+        self.assertEqual(mercury[0]["uncertainty_see_also"], ["http://www.wikidata.org/entity/Q925"])
+        self.assertNotIn("uncertainty_factor", expected[-1])
+
+    def test_matches_quadratic_on_combined(self):
+        combined = uncertainty_reference + new_reference_items
+        self.assertEqual(
+            wikidata.wd_reference_uncertainty_factor(copy.deepcopy(combined)),
+            quadratic_uncertainty_factor(copy.deepcopy(combined))
+        )
+
+    def test_incremental_matches_full(self):
+        existing = wikidata.wd_reference_uncertainty_factor(copy.deepcopy(uncertainty_reference))
+        incremental = wikidata.wd_reference_uncertainty_factor(
+            existing + copy.deepcopy(new_reference_items),
+            new_items_start=len(existing)
+        )
+        full = wikidata.wd_reference_uncertainty_factor(copy.deepcopy(uncertainty_reference + new_reference_items))
+
+        self.assertEqual(incremental, full)
+        self.assertEqual(incremental[3]["uncertainty_factor"], 3)
+        self.assertNotIn("uncertainty_factor", incremental[-2])
+
+
+search_reference = [
+    reference_item("Mercury", "Q308", "Planets"),
+    reference_item("Mercury", "Q925", "Chemical Elements"),
+    reference_item("Hg", "Q925", "Chemical Elements", "alternate"),
+    reference_item("Mercury", "Q925", "Commodities", "alternate"),
+    reference_item("Iron", "Q677", "Chemical Elements"),
+    reference_item("Iron", "Q677", "Commodities", "alternate"),
+    reference_item("Kīlauea", "Q188", "Volcanos"),
+    reference_item("Kilauea", "Q188", "Volcanos", "alternate"),
+]
+
+
+class TestWdReferenceIndex(unittest.TestCase):
+    def test_search_matches_list(self):
+        index = wikidata.WdReferenceIndex(search_reference)
+        self.assertEqual(len(index), len(search_reference))
+
+        for search_label, wd_source, preferred_only, source_priority_list, return_original_label, return_var in itertools.product(
+            ["Mercury", "Hg", "Iron", "Kilauea", "mercury", "Gold"],
+            [None, "Chemical Elements", "Commodities", "Films"],
+            [False, True],
+            [None, ["Commodities"], ["Films", "Planets"], ["Films"]],
+            [False, True],
+            [None, "identifier"]
+        ):
+            kwargs = {
+                "wd_source": wd_source,
+                "preferred_only": preferred_only,
+                "source_priority_list": source_priority_list,
+                "return_original_label": return_original_label,
+                "return_var": return_var
+            }
+            self.assertEqual(
+                wikidata.search_wd_reference(search_label, index, **kwargs),
+                wikidata.search_wd_reference(search_label, search_reference, **kwargs),
+                (search_label, kwargs)
+            )
+
+    def test_folded_labels(self):
+        index = wikidata.WdReferenceIndex(search_reference, casefold=True, ascii_fold=True)
+        self.assertEqual(
+            [i["label"] for i in index.search("KILAUEA")],
+            ["Kīlauea", "Kilauea"]
+        )
+        self.assertEqual(index.search("kilauea", preferred_only=True, return_var="label"), "Kīlauea")
+        self.assertEqual(index.search("mercury", source_priority_list=["Planets"], return_var="identifier"), "http://www.wikidata.org/entity/Q308")
+        self.assertIsNone(wikidata.WdReferenceIndex(search_reference).search("mercury"))
+
+
+if __name__ == "__main__":
+    unittest.main()